@@ -3,7 +3,8 @@ const BASE_URL = "http://127.0.0.1:8000";
 // =========================
 // SEARCH
 // =========================
-export async function searchFiles(query, topK = 5) {
+// snippetMode: "semantic" (default), "lexical" (no model inference) or "none"
+export async function searchFiles(query, topK = 5, snippetMode = "semantic") {
   const res = await fetch(`${BASE_URL}/search`, {
     method: "POST",
     headers: {
@@ -12,6 +13,7 @@ export async function searchFiles(query, topK = 5) {
     body: JSON.stringify({
       query,
       top_k: topK,
+      snippet_mode: snippetMode,
     }),
   });
 
@@ -23,6 +25,42 @@ export async function searchFiles(query, topK = 5) {
   return data.results || [];
 }
 
+// Streaming search: onEvent receives each NDJSON event as it arrives
+// ("results" first, sensitive files already dropped, then "snippet" per result, then "done").
+export async function searchFilesStream(query, topK = 5, onEvent, snippetMode = "semantic") {
+  const res = await fetch(`${BASE_URL}/search/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({
+      query,
+      top_k: topK,
+      snippet_mode: snippetMode,
+    }),
+  });
+
+  if (!res.ok || !res.body) {
+    throw new Error("Backend search failed");
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (line.trim()) onEvent(JSON.parse(line));
+    }
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
+
 // =========================
 // ROOTS MANAGEMENT
 // =========================
@@ -90,6 +128,29 @@ export async function getStatus() {
   return res.json();
 }
 
+export async function getIndexingProgress() {
+  const res = await fetch(`${BASE_URL}/index/progress`);
+  if (!res.ok) {
+    throw new Error("Failed to fetch indexing progress");
+  }
+  return res.json();
+}
+
+// =========================
+// PUSH EVENTS (SSE)
+// =========================
+// onEvent receives {type, ...}: "snapshot" first (full progress state,
+// files_indexed, generation), then "progress" (changed fields only),
+// "phase", "index", "generation" and "ready" (startup warmup done). EventSource reconnects on its own and
+// every reconnect starts with a fresh "snapshot". Returns an unsubscribe function.
+export function subscribeEvents(onEvent) {
+  const source = new EventSource(`${BASE_URL}/events`);
+  const types = ["snapshot", "progress", "phase", "index", "generation", "ready"];
+  const handler = (e) => onEvent(JSON.parse(e.data));
+  types.forEach((type) => source.addEventListener(type, handler));
+  return () => source.close();
+}
+
 // =========================
 // HEALTH CHECK
 // =========================
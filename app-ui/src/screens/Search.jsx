@@ -1,5 +1,5 @@
 import { useEffect, useMemo, useRef, useState } from 'react';
-import { getIndexingProgress, getRoots, searchFiles } from '../api/backend';
+import { getRoots, searchFiles, subscribeEvents } from '../api/backend';
 import ResultCard from '../components/ResultCard';
 import SearchBar from '../components/SearchBar';
 import { SCREENS, useApp } from '../state/appState';
@@ -21,50 +21,17 @@ export default function Search() {
     loadRoutes();
   }, []);
 
-  // Poll for indexing progress
+  // Indexing progress pushed by the backend (GET /events)
   useEffect(() => {
-    let interval = null;
-    let isMounted = true;
-    
-    const pollProgress = async () => {
-      if (!isMounted) return;
-      try {
-        const progress = await getIndexingProgress();
-        if (!isMounted) return;
-        setIndexingProgress(progress);
-        
-        if (progress.indexing) {
-          console.log('📚 Indexing in progress:', progress);
-          // Poll fast during active indexing
-          scheduleNext(1000);
-        } else if (progress.phase === 'complete') {
-          // Indexing just finished — show for 3s then hide
-          setTimeout(() => { if (isMounted) setIndexingProgress(null); }, 3000);
-          // Slow poll after completion
-          scheduleNext(5000);
-        } else {
-          // Idle — slow poll to detect when indexing starts
-          scheduleNext(5000);
-        }
-      } catch (error) {
-        console.error('Failed to fetch indexing progress:', error);
-        // Retry slowly on error
-        scheduleNext(5000);
+    const unsubscribe = subscribeEvents((event) => {
+      if (event.type === 'snapshot') {
+        setIndexingProgress(event.progress);
+      } else if (event.type === 'progress') {
+        // Only changed fields are sent
+        setIndexingProgress((previous) => ({ ...(previous || {}), ...event }));
       }
-    };
-
-    const scheduleNext = (delay) => {
-      if (interval) clearTimeout(interval);
-      interval = setTimeout(pollProgress, delay);
-    };
-
-    // Initial poll
-    pollProgress();
-
-    return () => {
-      isMounted = false;
-      if (interval) clearTimeout(interval);
-    };
+    });
+    return unsubscribe;
   }, []);
 
   useEffect(() => {
@@ -101,7 +68,8 @@ export default function Search() {
     setSearchQuery(localQuery);
     
     try {
-      const results = await searchFiles(localQuery, 10);
+      // The listing shows keyword snippets; "lexical" skips sentence inference
+      const results = await searchFiles(localQuery, 10, "lexical");
       setSearchResults(results || []);
       // Persist to Indexing Logs (but NOT back into Search on restart).
       setIndexingLogs?.(localQuery, results || []);
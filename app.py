@@ -1,16 +1,28 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 import search
 
 app = FastAPI(title="SAGE Semantic Search")
 
+MAX_BATCH_QUERIES = 500  # Max queries accepted by /search/batch (same limit as backend/main.py)
+
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
     roots: Optional[List[str]] = None
+    snippet_mode: Literal["none", "lexical", "semantic"] = "semantic"
+    retrieval: Literal["chunks", "files"] = "chunks"
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    roots: Optional[List[str]] = None
+    snippet_mode: Literal["none", "lexical", "semantic"] = "semantic"
+    retrieval: Literal["chunks", "files"] = "chunks"
 
 
 @app.post("/search")
@@ -18,5 +30,20 @@ def search_api(req: SearchRequest):
     return search.semantic_search(
         query=req.query,
         top_k=req.top_k,
-        roots=req.roots
+        roots=req.roots,
+        snippet_mode=req.snippet_mode,
+        retrieval=req.retrieval
+    )
+
+
+@app.post("/search/batch")
+def search_batch_api(req: BatchSearchRequest):
+    if len(req.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    return search.semantic_search_batch(
+        queries=req.queries,
+        top_k=req.top_k,
+        roots=req.roots,
+        snippet_mode=req.snippet_mode,
+        retrieval=req.retrieval
     )
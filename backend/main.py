@@ -3,30 +3,50 @@ import os
 # Set offline mode for HuggingFace before any transformers imports
 os.environ["HF_HUB_OFFLINE"] = "1"
 
+import time
+IMPORT_STARTED = time.perf_counter()  # Startup timings (GET /ready) count from here
+
 import traceback
 import sys
 import sqlite3
+import json
+import asyncio
+import functools
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import List, Optional
+from typing import List, Literal, Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uvicorn
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 # Add parent directory to path to import search.py and index_docs.py
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from search import semantic_search
-from search import invalidate_vocabulary
+from search import semantic_search, semantic_search_batch, semantic_search_stream
+from search import invalidate_vocabulary, seed_vocabulary
+from search import get_store, get_model, get_vocabulary
+from search import SEARCH_STAGE_SECONDS, CACHE_REQUESTS
 import index_docs
+import snapshot
+import metrics
+import index_telemetry
+import profiling
+import index_db
+import watch_manager
+from vector_store import load_schema_state
+
+# torch/sentence-transformers, weaviate and the extraction libraries are
+# imported on first use (see search.get_model, vector_store, index_docs
+# readers), so the server answers "/" before they load.
 
 # =========================
 # CONFIG
 # =========================
-INDEX_DB = "index_state.db"
 # Removed "key", "private", "secret" as they appear in legitimate crypto/security documents
 SENSITIVE_WORDS = {"password", "license key", "serial number", "activation code", "recovery phrase"}
 ALLOWED_EXT = (".txt", ".pdf", ".docx", ".ppt", ".pptx")
@@ -34,9 +54,43 @@ ALLOWED_EXT = (".txt", ".pdf", ".docx", ".ppt", ".pptx")
 # Global flags
 indexing_in_progress = False
 indexing_lock = threading.Lock()
-watchdog_observer = None
+rebuild_lock = threading.Lock()  # One shadow rebuild at a time (see index_docs.rebuild_index)
+watcher = None  # watch_manager.WatchManager, one watch (native or polling) per root
 last_watchdog_trigger = 0
 WATCHDOG_DEBOUNCE_SECONDS = 3  # Minimum seconds between indexing triggers
+MAX_BATCH_QUERIES = 500  # Max queries accepted by /search/batch
+
+# Search execution (model inference + Weaviate I/O run off the event loop)
+SEARCH_WORKERS = 2        # Threads dedicated to search jobs
+SEARCH_MAX_PENDING = 16   # Queued + running search jobs before new ones are shed with 503
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="sage-search")
+search_pending = 0        # Only touched from the event loop thread
+inflight_searches = {}    # job key -> asyncio.Future shared by identical requests
+
+# Push events (GET /events, Server-Sent Events)
+EVENT_PUSH_INTERVAL = 0.5       # Seconds between progress checks while clients are subscribed
+EVENT_HEARTBEAT_SECONDS = 15    # Keepalive comment on idle connections
+EVENT_QUEUE_SIZE = 256          # Events buffered per client; a client that falls behind is disconnected
+event_loop = None               # Set at startup; events from worker threads are handed to it
+event_subscribers = set()       # One asyncio.Queue per connected /events client
+
+# Metrics (GET /metrics, Prometheus text format); stage histograms live in search.py
+SEARCH_REQUEST_SECONDS = metrics.Histogram(
+    "sage_search_request_seconds", "End-to-end search request latency", ["endpoint"]
+)
+SEARCH_REJECTED = metrics.Counter("sage_search_rejected_total", "Searches shed with 503 because the queue was full")
+metrics.Gauge("sage_search_pending", "Search jobs queued or running", fn=lambda: search_pending)
+metrics.Gauge("sage_search_inflight_jobs", "Distinct search jobs in flight (identical requests share one)", fn=lambda: len(inflight_searches))
+metrics.Gauge("sage_indexing_in_progress", "1 while an indexing run is active", fn=lambda: int(indexing_in_progress))
+metrics.Gauge("sage_native_watches", "Native file watches held (inotify: one per directory)",
+              fn=lambda: sum(r.watches for r in watcher.roots.values()) if watcher is not None else 0)
+
+# Startup and readiness (GET /ready)
+WARMUP_ON_STARTUP = True  # Load store, model and vocabulary in a background thread right after startup
+startup_timings = {"imports": time.perf_counter() - IMPORT_STARTED}  # step -> seconds before "/" answers
+warmup_state = {"status": "pending", "steps": {}, "error": None}  # pending/running/ready/failed/skipped
+warmup_lock = threading.Lock()
+metrics.Gauge("sage_ready", "1 once the warmup finished (GET /ready)", fn=lambda: int(is_ready()))
 
 # =========================
 # LIFESPAN (Startup/Shutdown)
@@ -45,20 +99,36 @@ WATCHDOG_DEBOUNCE_SECONDS = 3  # Minimum seconds between indexing triggers
 async def lifespan(app: FastAPI):
     """Modern lifespan handler for startup/shutdown events"""
     # === STARTUP ===
+    global event_loop
     print("[INIT] Initializing SAGE backend...")
     # Ensure database tables exist
-    index_docs.init_db()
+    startup_step("init_db", index_docs.init_db)
+    # files_indexed is counted once, then kept up to date in memory
+    index_docs.indexed_files_count = startup_step("count_files", count_indexed_files)
+    event_loop = asyncio.get_running_loop()
+    progress_task = asyncio.create_task(watch_progress())
     # Clean up any duplicate roots from previous runs
-    cleanup_duplicate_roots()
+    startup_step("cleanup_roots", cleanup_duplicate_roots)
     # Start watchdog monitoring
-    start_watchdog()
-    print("[DONE] Backend ready")
+    startup_step("watchdog", start_watchdog)
+    # Rebuild in the background if embedding/chunking settings changed
+    startup_step("rebuild_check", start_rebuild_if_needed)
+    # Model, store and vocabulary load in the background; GET /ready reports when they are done
+    if WARMUP_ON_STARTUP:
+        start_warmup()
+    else:
+        warmup_state["status"] = "skipped"
+    startup_timings["total"] = time.perf_counter() - IMPORT_STARTED
+    print(f"[DONE] Backend up in {startup_timings['total']:.2f}s ({format_timings(startup_timings)})")
     
     yield  # App runs here
     
     # === SHUTDOWN ===
     print("[STOP] Shutting down SAGE backend...")
+    progress_task.cancel()
     stop_watchdog()
+    search_executor.shutdown(wait=False, cancel_futures=True)
+    index_db.close_pools()
 
 
 # =========================
@@ -80,19 +150,34 @@ app.add_middleware(
 # =========================
 class SearchRequest(BaseModel):
     query: str
-    top_k: Optional[int] = 5
+    top_k: int = Field(5, ge=1)
+    snippet_mode: Literal["none", "lexical", "semantic"] = "semantic"
+    retrieval: Literal["chunks", "files"] = "chunks"
+    debug: bool = False  # Include per-stage timings in the response
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = Field(5, ge=1)
+    snippet_mode: Literal["none", "lexical", "semantic"] = "semantic"
+    retrieval: Literal["chunks", "files"] = "chunks"
 
 class RootRequest(BaseModel):
     path: str
 
+class SnapshotRequest(BaseModel):
+    path: str
+    dtype: Literal["float16", "float32"] = "float16"  # Export only
+    confirm: bool = False  # Import only: it replaces the whole index and every root
+
+class ProfileRequest(BaseModel):
+    target: Literal["index", "search"]
+    mode: Literal["cprofile", "sampling"] = "cprofile"
+    count: int = 1  # Searches to capture (target "search")
+
 
 # =========================
 # DATABASE HELPERS
 # =========================
-def get_db_connection():
-    """Get SQLite connection to index_state.db with timeout for concurrent access"""
-    return sqlite3.connect(INDEX_DB, timeout=30)
-
 def normalize_path(path: str) -> str:
     """Normalize path: remove trailing slashes, resolve to absolute"""
     normalized = os.path.abspath(path)
@@ -103,13 +188,8 @@ def normalize_path(path: str) -> str:
 
 
 def get_user_roots() -> List[str]:
-    """Get list of user-defined roots from database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT path FROM user_roots")
-    roots = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return roots
+    """Get list of user-defined roots (cached in memory by index_db)"""
+    return index_db.user_roots()
 
 def add_user_root(path: str) -> bool:
     """Add a root path to the database"""
@@ -119,65 +199,286 @@ def add_user_root(path: str) -> bool:
     if not os.path.exists(normalized_path):
         return False
     
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        # Check if already exists
-        cur.execute("SELECT COUNT(*) FROM user_roots WHERE path = ?", (normalized_path,))
-        if cur.fetchone()[0] > 0:
+        if not index_db.add_user_root(normalized_path):
             print(f"⚠️ Root already exists: {normalized_path}")
             return True  # Return true since it's already there
-        
-        cur.execute("INSERT INTO user_roots (path) VALUES (?)", (normalized_path,))
-        conn.commit()
         print(f"✅ Added root: {normalized_path}")
         return True
     except Exception as e:
         print(f"❌ Error adding root: {e}")
         return False
-    finally:
-        conn.close()
 
 def remove_user_root(path: str) -> bool:
     """Remove a root path from the database"""
     normalized_path = normalize_path(path)
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM user_roots WHERE path = ?", (normalized_path,))
-        conn.commit()
+        index_db.remove_user_root(normalized_path)
         return True
     except Exception as e:
         print(f"❌ Error removing root: {e}")
         return False
-    finally:
-        conn.close()
 
 
 def cleanup_duplicate_roots():
     """Remove duplicate roots from database (keeps first occurrence)"""
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        # Delete duplicates, keeping the one with lowest rowid
-        cur.execute("""
-            DELETE FROM user_roots
-            WHERE rowid NOT IN (
-                SELECT MIN(rowid)
-                FROM user_roots
-                GROUP BY path
-            )
-        """)
-        deleted = cur.rowcount
-        conn.commit()
+        with index_db.transaction() as conn:
+            # Delete duplicates, keeping the one with lowest rowid
+            deleted = conn.execute("""
+                DELETE FROM user_roots
+                WHERE rowid NOT IN (
+                    SELECT MIN(rowid)
+                    FROM user_roots
+                    GROUP BY path
+                )
+            """).rowcount
         if deleted > 0:
+            index_db.invalidate_roots()
             print(f"🧹 Cleaned up {deleted} duplicate root(s)")
         return deleted
     except Exception as e:
         print(f"❌ Error cleaning duplicates: {e}")
         return 0
+
+
+def count_indexed_files() -> int:
+    """Number of files recorded in indexed_files"""
+    with index_db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM indexed_files").fetchone()[0]
+
+
+def files_indexed() -> int:
+    """In-memory indexed file count (index_docs keeps it current)"""
+    if index_docs.indexed_files_count is None:
+        index_docs.indexed_files_count = count_indexed_files()
+    return index_docs.indexed_files_count
+
+
+def index_generation() -> int:
+    """Live schema version of the vector store (bumped by rebuilds, imports and migrations)"""
+    return load_schema_state()["schema_version"]
+
+
+# =========================
+# STARTUP AND WARMUP
+# =========================
+def startup_step(name: str, fn, *args):
+    """Run one startup step, recording its duration in startup_timings"""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+
+def format_timings(timings: dict) -> str:
+    return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+
+
+def timings_ms(timings: dict) -> dict:
+    return {name: round(seconds * 1000, 1) for name, seconds in timings.items()}
+
+
+def is_ready() -> bool:
+    return warmup_state["status"] in ("ready", "skipped")
+
+
+def run_warmup():
+    """
+    Pay the first search's costs up front: connect the vector store, load
+    the model (torch import included), run one encode and build the
+    fuzzy-match vocabulary. Stops at the first failing step.
+    """
+    if not warmup_lock.acquire(blocking=False):
+        return
+    try:
+        warmup_state.update(status="running", steps={}, error=None)
+        steps = (
+            ("store", get_store),
+            ("model", get_model),
+            ("encode", lambda: get_model().encode("warmup", normalize_embeddings=True)),
+            ("vocabulary", get_vocabulary),
+        )
+        for name, fn in steps:
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                warmup_state.update(status="failed", error=f"{name}: {e}")
+                print(f"[ERROR] Warmup failed at {name}: {e}")
+                return
+            finally:
+                warmup_state["steps"][name] = time.perf_counter() - start
+        warmup_state["status"] = "ready"
+        print(f"[DONE] Warmup complete ({format_timings(warmup_state['steps'])})")
+        publish_event({"type": "ready", "warmup_ms": timings_ms(warmup_state["steps"])})
+    finally:
+        warmup_lock.release()
+
+
+def start_warmup():
+    threading.Thread(target=run_warmup, daemon=True, name="sage-warmup").start()
+
+
+# =========================
+# PUSH EVENTS
+# =========================
+def publish_event(event: dict):
+    """Send an event to every /events client; safe to call from any thread"""
+    if event_loop is not None and event_subscribers:
+        event_loop.call_soon_threadsafe(deliver_event, event)
+
+
+def deliver_event(event: dict):
+    """Queue an event for each client (event loop thread only)"""
+    for queue in list(event_subscribers):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Deltas cannot be skipped: drop the client, it reconnects and gets a fresh snapshot
+            event_subscribers.discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+def progress_state() -> dict:
+    """Flat progress fields whose changes are pushed as deltas"""
+    progress = index_docs.indexing_progress
+    total = progress.get("total_files", 0)
+    processed = progress.get("processed_files", 0)
+    run = index_docs.current_run
+    eta = run.eta_seconds() if run is not None and indexing_in_progress else None
+    return {
+        "indexing": indexing_in_progress,
+        "phase": progress.get("phase", "idle"),
+        "total_files": total,
+        "processed_files": processed,
+        "current_file": progress.get("current_file", ""),
+        "percentage": round((processed / total) * 100, 1) if total > 0 else 0,
+        "eta_seconds": round(eta) if eta is not None else None,
+        "rebuild_phase": index_docs.rebuild_progress["phase"],
+        "rebuild_processed_files": index_docs.rebuild_progress["processed_files"],
+        "snapshot_phase": snapshot.snapshot_progress["phase"],
+        "snapshot_processed_chunks": snapshot.snapshot_progress["processed_chunks"],
+    }
+
+
+async def watch_progress():
+    """Push progress deltas and phase changes to /events clients (in-memory state, no SQLite)"""
+    last = {}
+    while True:
+        await asyncio.sleep(EVENT_PUSH_INTERVAL)
+        if not event_subscribers:
+            last = {}
+            continue
+        state = progress_state()
+        changed = {key: value for key, value in state.items() if last.get(key) != value}
+        if changed:
+            # Fields are absolute values, so a full first delta after idling is harmless
+            if last and "phase" in changed:
+                deliver_event({"type": "phase", "phase": state["phase"], "previous": last["phase"]})
+            deliver_event({"type": "progress", **changed})
+        last = state
+
+
+def sse_message(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+# =========================
+# SEARCH EXECUTION
+# =========================
+def reject_if_search_busy():
+    """Shed load with 503 once SEARCH_MAX_PENDING search jobs are queued or running"""
+    if search_pending >= SEARCH_MAX_PENDING:
+        SEARCH_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Search is busy, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+
+
+def reserve_search_slot():
+    """reject_if_search_busy() and take a slot in one step (no await in between, so no other request can slip in)"""
+    global search_pending
+    reject_if_search_busy()
+    search_pending += 1
+
+
+def release_search_slot():
+    global search_pending
+    search_pending -= 1
+
+
+async def run_search_job(key, fn, *args, **kwargs):
+    """
+    Run a blocking search job on the bounded search executor.
+    Identical in-flight jobs (same key) share one computation. Once
+    SEARCH_MAX_PENDING jobs are queued or running, new jobs are rejected
+    with 503 instead of piling up behind the workers.
+    """
+    future = inflight_searches.get(key)
+    CACHE_REQUESTS.inc(cache="inflight_search", result="miss" if future is None else "hit")
+    if future is None:
+        reserve_search_slot()
+
+        loop = asyncio.get_running_loop()
+        job = profiling.wrap("search", fn)  # fn itself unless a search profile is armed
+        future = loop.run_in_executor(search_executor, functools.partial(job, *args, **kwargs))
+        inflight_searches[key] = future
+
+        def _job_done(f):
+            release_search_slot()
+            if inflight_searches.get(key) is f:
+                del inflight_searches[key]
+            if not f.cancelled():
+                f.exception()  # Mark retrieved even if every waiter went away
+
+        future.add_done_callback(_job_done)
+
+    # Shield so one disconnecting client does not cancel the shared job
+    return await asyncio.shield(future)
+
+
+async def stream_search_job(events):
+    """
+    Drive a search event generator on the search executor, one step per
+    executor call, yielding each event as it is produced. A search slot is
+    taken when iteration starts (HTTPException 503 when busy) and released
+    once the generator is closed, after the stream ends or the client
+    disconnects; a stream that never starts holds no slot.
+    """
+    reserve_search_slot()
+    loop = asyncio.get_running_loop()
+    step = None  # concurrent.futures.Future of the step in flight
+    try:
+        while True:
+            step = search_executor.submit(next, events, None)
+            event = await asyncio.wrap_future(step)
+            if event is None:
+                break
+            yield event
+    except Exception as e:
+        print("❌ STREAM SEARCH ERROR:", e)
+        traceback.print_exc()
+        yield {"type": "error", "error": str(e)}
     finally:
-        conn.close()
+        def close(_=None):
+            # A disconnect cancels the await, not the executor thread: closing
+            # the generator while that step still runs raises "generator
+            # already executing", so close once the step is over
+            try:
+                events.close()
+            finally:
+                loop.call_soon_threadsafe(release_search_slot)
+
+        if step is None:
+            close()
+        else:
+            step.add_done_callback(close)  # Runs at once if the step is done or was still queued
 
 
 # =========================
@@ -197,8 +498,12 @@ def run_indexing_background():
         index_docs.reset_progress()
         indexing_in_progress = True
         print("[START] Starting indexing...")
-        index_docs.main()
+        with profiling.capture("index") as profile:
+            index_docs.main()
+            if profile is not None and index_docs.current_run is not None:
+                profile.details["index_run_id"] = index_docs.current_run.run_id
         invalidate_vocabulary()  # Refresh fuzzy-match vocabulary after indexing
+        publish_event({"type": "index", "files_indexed": files_indexed()})
         print("[DONE] Indexing complete")
     except Exception as e:
         print(f"[ERROR] Indexing error: {e}")
@@ -206,6 +511,69 @@ def run_indexing_background():
     finally:
         indexing_in_progress = False
         indexing_lock.release()
+    start_rebuild_if_needed()
+
+
+def run_rebuild_background():
+    """Shadow-rebuild the index for changed model/chunking settings, then flip generations"""
+    if not rebuild_lock.acquire(blocking=False):
+        return
+    try:
+        if index_docs.rebuild_index(flip_lock=indexing_lock):
+            invalidate_vocabulary()
+            publish_event({"type": "generation", "version": index_generation()})
+    except Exception as e:
+        print(f"[ERROR] Rebuild error: {e}")
+        traceback.print_exc()
+    finally:
+        rebuild_lock.release()
+
+
+def run_snapshot_background(operation: str, path: str, dtype: str = "float16"):
+    """Export or import an index snapshot while holding the indexing lock"""
+    global indexing_in_progress
+    with indexing_lock:
+        indexing_in_progress = True
+        try:
+            if operation == "export":
+                snapshot.export_snapshot(path, dtype=dtype)
+            else:
+                version = snapshot.import_snapshot(path, retire_seconds=index_docs.REBUILD_RETIRE_SECONDS)
+                seed_vocabulary(version, snapshot.read_vocabulary(path))
+                restart_watchdog()  # Roots come from the snapshot
+                index_docs.indexed_files_count = count_indexed_files()  # Replaced wholesale
+                publish_event({"type": "generation", "version": version})
+                publish_event({"type": "index", "files_indexed": files_indexed()})
+        except Exception as e:
+            print(f"[ERROR] Snapshot {operation} error: {e}")
+            traceback.print_exc()
+        finally:
+            indexing_in_progress = False
+    if operation == "import":
+        start_rebuild_if_needed()
+
+
+def run_remove_root_background(path: str):
+    """Drop a removed root's shard (sharded stores) once no indexing run holds the lock"""
+    with indexing_lock:
+        try:
+            if index_docs.remove_root(normalize_path(path)):
+                invalidate_vocabulary()
+                publish_event({"type": "index", "files_indexed": files_indexed()})
+        except Exception as e:
+            print(f"[ERROR] Removing root shard failed: {e}")
+            traceback.print_exc()
+
+
+def start_rebuild_if_needed():
+    """Start run_rebuild_background in a thread when the live generation is outdated"""
+    try:
+        needed = index_docs.rebuild_needed()
+    except Exception as e:
+        print(f"[ERROR] Could not check index generation: {e}")
+        return
+    if needed and not rebuild_lock.locked():
+        threading.Thread(target=run_rebuild_background, daemon=True).start()
 
 
 # =========================
@@ -243,74 +611,73 @@ class SageEventHandler(FileSystemEventHandler):
             return
         self.handle_event("deleted", path)
 
-    def handle_event(self, action, path):
-        """Trigger re-indexing when files change (with debounce)"""
+    def handle_event(self, action, path) -> bool:
+        """Trigger re-indexing when files change (with debounce); True if indexing was started"""
         global last_watchdog_trigger
         import time as time_module
         
         # Skip temporary files (like ~$word files)
         filename = os.path.basename(path)
         if filename.startswith('~$'):
-            return
+            return False
         
         current_time = time_module.time()
         
         # Debounce: skip if triggered too recently
         if current_time - last_watchdog_trigger < WATCHDOG_DEBOUNCE_SECONDS:
             print(f"[WATCHDOG] {action.upper()} - {filename} (debounced)")
-            return
+            return False
+        # A running pass may have scanned before this change; polled roots retry
+        if indexing_lock.locked():
+            return False
         
         last_watchdog_trigger = current_time
         print(f"[WATCHDOG] {action.upper()} - {path}")
         # Run indexing in background to avoid blocking
         threading.Thread(target=run_indexing_background, daemon=True).start()
+        return True
 
 
 def start_watchdog():
-    """Initialize and start watchdog observer for all user roots"""
-    global watchdog_observer
+    """Initialize and start watching all user roots (native watch or polling per root)"""
+    global watcher
     
     roots = get_user_roots()
     if not roots:
         print("[WARN] No user roots configured. Watchdog will start after roots are added.")
         return
     
-    if watchdog_observer is not None:
+    if watcher is not None and watcher.running:
         print("[WARN] Watchdog already running")
         return
     
     try:
-        watchdog_observer = Observer()
         handler = SageEventHandler()
-        
-        for root in roots:
-            if not os.path.exists(root):
-                continue
-            print(f"[WATCH] Watching: {root}")
-            watchdog_observer.schedule(handler, root, recursive=True)
-        
-        watchdog_observer.start()
+        watcher = watch_manager.WatchManager(handler, handler.handle_event, ALLOWED_EXT)
+        watcher.start()
+        watcher.sync(roots)
         print("[DONE] Watchdog monitoring active")
     except Exception as e:
         print(f"❌ Failed to start watchdog: {e}")
-        watchdog_observer = None
+        watcher = None
 
 
 def stop_watchdog():
-    """Stop watchdog observer"""
-    global watchdog_observer
+    """Stop all watches"""
+    global watcher
     
-    if watchdog_observer is not None:
-        watchdog_observer.stop()
-        watchdog_observer.join()
-        watchdog_observer = None
+    if watcher is not None:
+        watcher.stop()
+        watcher = None
         print("🔻 Watchdog stopped")
 
 
 def restart_watchdog():
-    """Restart watchdog with updated roots"""
-    stop_watchdog()
-    start_watchdog()
+    """Bring the watches in line with the configured roots (only added/removed roots change)"""
+    if watcher is None or not watcher.running:
+        start_watchdog()
+        return
+    watcher.sync(get_user_roots())
 
 
 # =========================
@@ -323,19 +690,48 @@ async def root():
     return {"status": "SAGE backend running", "indexing": indexing_in_progress}
 
 
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness: 200 once the warmup has loaded the store, model and
+    vocabulary (searches no longer pay for them), 503 before. A failed
+    warmup is retried on the next call. "/" stays the liveness check.
+    """
+    body = {
+        "ready": is_ready(),
+        "warmup": warmup_state["status"],
+        "error": warmup_state["error"],
+        "startup_ms": timings_ms(startup_timings),
+        "warmup_ms": timings_ms(warmup_state["steps"]),
+    }
+    if body["ready"]:
+        return body
+    if warmup_state["status"] == "failed":
+        start_warmup()
+    return JSONResponse(status_code=503, content=body)
+
+
 @app.get("/roots")
 async def list_roots():
     """Get list of current user-defined roots"""
     try:
-        # Clean duplicates on every fetch to ensure data integrity
-        cleanup_duplicate_roots()
-        roots = get_user_roots()
+        # user_roots.path is the primary key, so duplicates can only predate
+        # it; they are cleaned once at startup, not on every fetch
+        roots = await run_in_threadpool(get_user_roots)
         return {"roots": roots}
     except Exception as e:
         print(f"❌ Error listing roots: {e}")
         raise HTTPException(status_code=500, detail="Failed to list roots")
 
 
+@app.get("/roots/watch")
+async def get_watch_status():
+    """Per-root watch mode (native/polling/missing/error), watch counts and the inotify budget"""
+    if watcher is None:
+        return {"running": False, "roots": []}
+    return await run_in_threadpool(watcher.status)
+
+
 @app.post("/roots/add")
 async def add_root(request: RootRequest):
     """Add a new root directory"""
@@ -347,10 +743,10 @@ async def add_root(request: RootRequest):
         if not os.path.isdir(path):
             raise HTTPException(status_code=400, detail="Path is not a directory")
         
-        success = add_user_root(path)
+        success = await run_in_threadpool(add_user_root, path)
         if success:
-            # Restart watchdog to monitor new root
-            restart_watchdog()
+            # Schedule a watch for the new root (others are untouched)
+            await run_in_threadpool(restart_watchdog)
             return {"success": True, "message": "Root added successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to add root")
@@ -365,10 +761,11 @@ async def add_root(request: RootRequest):
 async def remove_root(request: RootRequest):
     """Remove a root directory"""
     try:
-        success = remove_user_root(request.path)
+        success = await run_in_threadpool(remove_user_root, request.path)
         if success:
-            # Restart watchdog to remove monitoring from this root
-            restart_watchdog()
+            # Unschedule this root's watch (others are untouched)
+            await run_in_threadpool(restart_watchdog)
+            threading.Thread(target=run_remove_root_background, args=(request.path,), daemon=True).start()
             return {"success": True, "message": "Root removed successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to remove root")
@@ -386,7 +783,7 @@ async def trigger_indexing():
         return {"success": False, "message": "Indexing already in progress"}
     
     # Check if roots exist
-    roots = get_user_roots()
+    roots = await run_in_threadpool(get_user_roots)
     if not roots:
         raise HTTPException(status_code=400, detail="No roots configured. Add roots first.")
     
@@ -397,18 +794,126 @@ async def trigger_indexing():
     return {"success": True, "message": "Indexing started"}
 
 
+@app.post("/index/snapshot/export")
+async def export_snapshot(request: SnapshotRequest):
+    """Write the live index to a snapshot file (runs in the background, see /index/progress)"""
+    if indexing_in_progress or indexing_lock.locked():
+        raise HTTPException(status_code=409, detail="Indexing in progress")
+    if not os.path.isdir(os.path.dirname(os.path.abspath(request.path))):
+        raise HTTPException(status_code=400, detail="Target directory does not exist")
+    if os.path.exists(request.path):
+        # Never overwrite: any page can reach this endpoint (CORS is open)
+        raise HTTPException(status_code=409, detail="Target file already exists")
+
+    thread = threading.Thread(
+        target=run_snapshot_background, args=("export", request.path, request.dtype), daemon=True
+    )
+    thread.start()
+    return {"success": True, "message": "Snapshot export started"}
+
+
+@app.post("/index/snapshot/import")
+async def import_snapshot(request: SnapshotRequest):
+    """Restore a snapshot file and make it the live index (runs in the background, see /index/progress)"""
+    if indexing_in_progress or indexing_lock.locked():
+        raise HTTPException(status_code=409, detail="Indexing in progress")
+    if not request.confirm:
+        # Any page can reach this endpoint (CORS is open): never replace the index unasked
+        raise HTTPException(status_code=400, detail="Import replaces the whole index and every root; send confirm=true")
+    if not os.path.isfile(request.path):
+        raise HTTPException(status_code=400, detail="Snapshot file does not exist")
+    try:
+        await run_in_threadpool(snapshot.read_manifest, request.path)
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    thread = threading.Thread(target=run_snapshot_background, args=("import", request.path), daemon=True)
+    thread.start()
+    return {"success": True, "message": "Snapshot import started"}
+
+
+@app.post("/profile")
+async def arm_profile(request: ProfileRequest):
+    """Profile the next indexing run or the next `count` /search and /search/batch jobs"""
+    try:
+        return profiling.arm(request.target, request.mode, request.count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/profiles")
+async def list_profiles():
+    """Armed, running and stored profiles"""
+    return {"profiles": await run_in_threadpool(profiling.list_profiles)}
+
+
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Stored profile: pstats (cprofile mode) or speedscope JSON (sampling mode)"""
+    found = profiling.profile_file(profile_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path, media_type = found
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Search latency histograms, cache hit counters and in-flight gauges (Prometheus text format)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/events")
+async def stream_events():
+    """
+    Server-Sent Events push channel, replacing /status and /index/progress polling:
+      snapshot    full progress state, files_indexed and generation (first event)
+      progress    changed progress fields only
+      phase       indexing phase change
+      index       an indexing run / root removal / import changed the index (files_indexed)
+      generation  the live index generation was bumped (rebuild flip, snapshot import)
+      ready       the startup warmup finished (store, model, vocabulary loaded)
+    """
+    hello = {
+        "type": "snapshot",
+        "progress": progress_state(),
+        "files_indexed": await run_in_threadpool(files_indexed),
+        "generation": await run_in_threadpool(index_generation),
+        "ready": is_ready(),
+    }
+    queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+    event_subscribers.add(queue)
+
+    async def event_lines():
+        try:
+            yield sse_message(hello)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield sse_message(event)
+        finally:
+            event_subscribers.discard(queue)
+
+    return StreamingResponse(
+        event_lines(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
 @app.get("/status")
 async def get_status():
     """Get indexing status and file count"""
     try:
-        roots = get_user_roots()
+        roots = await run_in_threadpool(get_user_roots)
         
-        # Get indexed file count
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM indexed_files")
-        file_count = cur.fetchone()[0]
-        conn.close()
+        # Indexed file count (in memory, counted from SQLite only when unknown)
+        file_count = await run_in_threadpool(files_indexed)
         
         return {
             "indexing": indexing_in_progress,
@@ -443,7 +948,10 @@ async def get_indexing_progress():
             "total_files": total,
             "processed_files": processed,
             "current_file": progress.get("current_file", ""),
-            "percentage": percentage
+            "percentage": percentage,
+            "telemetry": index_docs.current_run.snapshot() if index_docs.current_run else None,
+            "rebuild": dict(index_docs.rebuild_progress),
+            "snapshot": dict(snapshot.snapshot_progress)
         }
     except Exception as e:
         print(f"❌ Error getting progress: {e}")
@@ -457,59 +965,198 @@ async def get_indexing_progress():
         }
 
 
+@app.get("/index/runs")
+async def get_index_runs(limit: int = 20):
+    """Summaries of recent indexing runs (newest first), to spot throughput regressions"""
+    def load():
+        with index_db.connection() as conn:
+            return index_telemetry.load_runs(conn, max(1, min(limit, index_telemetry.INDEX_RUNS_KEEP)))
+
+    try:
+        return {"runs": await run_in_threadpool(load)}
+    except sqlite3.OperationalError:
+        return {"runs": []}  # No run recorded yet
+
+
 @app.post("/search")
 async def search_files(request: SearchRequest):
     """
     Semantic search using frozen search.py logic.
     Returns file-level deduplicated results with hybrid scoring.
+    Runs on the bounded search executor so the event loop stays responsive.
+    With "debug": true the response carries the per-stage timings.
     """
     try:
+        start = time.perf_counter()
         query = request.query.strip()
         if not query:
             return {"results": []}
         
         # Check if roots exist
-        roots = get_user_roots()
+        roots = await run_in_threadpool(get_user_roots)
         if not roots:
             return {"results": [], "message": "No roots configured"}
         
         # Use semantic_search from search.py (frozen backend)
-        top_k = request.top_k or 5
-        results = semantic_search(query, top_k=top_k)
-        
-        # Optional: Filter sensitive content
-        filtered_results = []
-        for r in results:
-            snippet = r.get("snippet", "")
-            if is_sensitive_text(snippet):
-                continue
-            
-            # Format for frontend
-            filtered_results.append({
-                "file": r.get("file"),
-                "filename": r.get("file"),  # Add filename field
-                "path": r.get("path"),
-                "snippet": snippet,
-                "chunk": snippet,  # Alias for compatibility
-                "matched_terms": r.get("matched_terms", []),  # Terms to highlight
-                "score": r.get("hybrid_score", r.get("similarity", 0)),  # Use hybrid_score as main score
-                "similarity": round(r.get("similarity", 0) * 100, 2),  # Convert to percentage
-                "hybrid_score": round(r.get("hybrid_score", 0) * 100, 2)  # Convert to percentage
-            })
+        top_k = request.top_k
+        stats = {} if request.debug else None
+        results = await run_search_job(
+            # Debug requests get their own job so the stats are their own
+            ("search", query, top_k, request.snippet_mode, request.retrieval, id(stats) if request.debug else None),
+            semantic_search, query, top_k=top_k,
+            snippet_mode=request.snippet_mode, retrieval=request.retrieval, stats=stats,
+            exclude=is_sensitive_text  # On the chunk text, whatever the snippet mode
+        )
         
-        return {"results": filtered_results}
+        response = {"results": format_search_results(results)}
+        total_seconds = time.perf_counter() - start
+        SEARCH_REQUEST_SECONDS.observe(total_seconds, endpoint="/search")
+
+        if request.debug:
+            response["debug"] = search_debug(stats, total_seconds)
+        return response
     
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ SEARCH ERROR:", e)
         traceback.print_exc()
         return {"results": [], "error": str(e)}
 
 
+@app.post("/search/stream")
+async def search_files_stream(request: SearchRequest):
+    """
+    Streaming variant of /search (NDJSON, one event per line):
+      {"type": "results", "results": [...]}   ranked files, empty snippets
+      {"type": "snippet", "index": i, ...}     snippet + matched_terms for result i
+      {"type": "done"}
+    The ranked list arrives as soon as ANN and hybrid scoring finish;
+    sensitive files are dropped before it is sent. With "debug": true the
+    "done" event carries the per-stage timings.
+    """
+    start = time.perf_counter()
+    query = request.query.strip()
+    roots = await run_in_threadpool(get_user_roots) if query else []
+    if query and roots:
+        reject_if_search_busy()  # 503 up front; the slot itself is taken by stream_search_job
+
+    async def event_lines():
+        if not query or not roots:
+            yield json.dumps({"type": "results", "results": []}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+            return
+
+        top_k = request.top_k
+        stats = {}
+        events = semantic_search_stream(
+            query, top_k=top_k, snippet_mode=request.snippet_mode, retrieval=request.retrieval, stats=stats,
+            exclude=is_sensitive_text  # Checked before the ranked list goes out
+        )
+        try:
+            async for event in stream_search_job(events):
+                if event["type"] == "results":
+                    event["results"] = [format_search_result(r) for r in event["results"]]
+                elif event["type"] == "snippet":
+                    event["chunk"] = event["snippet"]  # Alias for compatibility
+                yield json.dumps(event) + "\n"
+        except HTTPException as e:
+            # Busy by the time the body started: the status line is already sent
+            events.close()
+            yield json.dumps({"type": "error", "error": e.detail}) + "\n"
+
+        total_seconds = time.perf_counter() - start
+        SEARCH_REQUEST_SECONDS.observe(total_seconds, endpoint="/search/stream")
+        done = {"type": "done"}
+        if request.debug:
+            done["debug"] = search_debug(stats, total_seconds)
+        yield json.dumps(done) + "\n"
+
+    return StreamingResponse(event_lines(), media_type="application/x-ndjson")
+
+
+@app.post("/search/batch")
+async def search_files_batch(request: BatchSearchRequest):
+    """
+    Run many searches in one request (evaluation jobs, internal tools).
+    Queries are encoded together and their Weaviate queries run concurrently.
+    Each entry in "results" has the same shape as a /search response.
+    """
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+
+    try:
+        start = time.perf_counter()
+        queries = [q.strip() for q in request.queries]
+        non_empty = [q for q in queries if q]
+        
+        roots = await run_in_threadpool(get_user_roots)
+        if not roots or not non_empty:
+            return {"results": [{"query": q, "results": []} for q in queries]}
+        
+        top_k = request.top_k
+        batch_results = await run_search_job(
+            ("batch", tuple(non_empty), top_k, request.snippet_mode, request.retrieval),
+            semantic_search_batch, non_empty, top_k=top_k,
+            snippet_mode=request.snippet_mode, retrieval=request.retrieval,
+            exclude=is_sensitive_text
+        )
+        
+        by_query = dict(zip(non_empty, batch_results))
+        response = {
+            "results": [
+                {"query": q, "results": format_search_results(by_query.get(q, []))}
+                for q in queries
+            ]
+        }
+        SEARCH_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/search/batch")
+        return response
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("❌ BATCH SEARCH ERROR:", e)
+        traceback.print_exc()
+        return {"results": [], "error": str(e)}
+
+
 # =========================
 # HELPER FUNCTIONS
 # =========================
+def format_search_result(r: dict) -> dict:
+    """Shape one semantic_search result for the frontend"""
+    snippet = r.get("snippet", "")
+    return {
+        "file": r.get("file"),
+        "filename": r.get("file"),  # Add filename field
+        "path": r.get("path"),
+        "snippet": snippet,
+        "chunk": snippet,  # Alias for compatibility
+        "matched_terms": r.get("matched_terms", []),  # Terms to highlight
+        "score": r.get("hybrid_score", r.get("similarity", 0)),  # Use hybrid_score as main score
+        "similarity": round(r.get("similarity", 0) * 100, 2),  # Convert to percentage
+        "hybrid_score": round(r.get("hybrid_score", 0) * 100, 2)  # Convert to percentage
+    }
+
+
+def format_search_results(results: List[dict]) -> List[dict]:
+    """Shape semantic_search output for the frontend (sensitive files are already dropped)"""
+    return [format_search_result(r) for r in results]
+
+
+def search_debug(stats: dict, total_seconds: float) -> dict:
+    """Per-stage breakdown returned for debug searches"""
+    timings = dict(stats.get("timings_ms", {}))
+    timings["total"] = round(total_seconds * 1000, 3)
+    return {"timings_ms": timings, "retrieval": stats.get("retrieval")}
+
+
 def is_sensitive_text(text: str | None) -> bool:
-    """Check if text contains sensitive keywords"""
+    """
+    Check if text contains sensitive keywords. Passed to search.py as
+    `exclude`, so it sees each result's whole best chunk, not the snippet
+    shown (stricter: a snippet is a subset of its chunk).
+    """
     if not text:
         return False
     t = text.lower()
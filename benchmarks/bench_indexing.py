@@ -0,0 +1,384 @@
+"""
+Indexing benchmark: runs index_docs.main() over a deterministic synthetic
+corpus (txt, docx, pptx, text PDFs and image-only PDFs) against an
+in-memory store stand-in (or the local store / a running Weaviate) and
+reports files/sec, chunks/sec, peak RSS and per-stage time as JSON.
+
+    python benchmarks/bench_indexing.py --txt 200 --docx 50 --pdf 50 --scanned 5
+    python benchmarks/bench_indexing.py --store local --repeat 3 --out after.json --compare before.json
+    python benchmarks/bench_indexing.py --embedder hash   # Pipeline overhead without model inference
+
+Peak RSS is the process high-water mark (model included), so compare it
+between runs with the same embedder.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import hashlib
+import platform
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import index_docs
+import vector_store
+from vector_store import WeaviateStore, LocalStore, unit_rows
+
+BENCH_CLASS_NAME = "BenchIndexDocuments"        # Never the real collections
+BENCH_FILE_CLASS_NAME = "BenchIndexDocumentFiles"
+VOCABULARY_SIZE = 5000
+HASH_EMBED_DIM = 384  # all-MiniLM-L6-v2
+
+
+# -------- CORPUS --------
+
+def make_vocabulary(seed: int) -> List[str]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(VOCABULARY_SIZE)]
+
+
+def make_text(rng: random.Random, vocabulary: List[str], words: int) -> str:
+    """Zipf-like word frequencies, sentences of 8-20 words"""
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    picked = rng.choices(vocabulary, weights=weights, k=words)
+    sentences, pos = [], 0
+    while pos < len(picked):
+        length = rng.randint(8, 20)
+        sentence = " ".join(picked[pos:pos + length])
+        sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+        pos += length
+    return " ".join(sentences)
+
+
+def write_txt(path: str, pages: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(pages))
+
+
+def write_docx(path: str, pages: List[str]):
+    from docx import Document
+
+    doc = Document()
+    for page in pages:
+        doc.add_paragraph(page)
+    doc.save(path)
+
+
+def write_pptx(path: str, pages: List[str]):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    prs = Presentation()
+    for page in pages:
+        slide = prs.slides.add_slide(prs.slide_layouts[6])  # Blank
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6))
+        box.text_frame.text = page
+    prs.save(path)
+
+
+def write_pdf(path: str, pages: List[str]):
+    import fitz
+
+    doc = fitz.open()
+    for page_text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), page_text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def write_scanned_pdf(path: str, pages: List[str]):
+    """Image-only PDF: each page is a rendered bitmap, so extraction needs OCR"""
+    import io
+    import fitz
+    from PIL import Image, ImageDraw
+
+    doc = fitz.open()
+    for page_text in pages:
+        image = Image.new("L", (1240, 1754), 255)  # A4 at 150 dpi
+        draw = ImageDraw.Draw(image)
+        words, lines, line = page_text.split(), [], ""
+        for word in words:
+            if len(line) + len(word) > 90:
+                lines.append(line)
+                line = ""
+            line += word + " "
+        lines.append(line)
+        for i, text in enumerate(lines[:80]):
+            draw.text((60, 60 + i * 20), text, fill=0)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=buffer.getvalue())
+    doc.save(path)
+    doc.close()
+
+
+WRITERS = {
+    "txt": (".txt", write_txt),
+    "docx": (".docx", write_docx),
+    "pptx": (".pptx", write_pptx),
+    "pdf": (".pdf", write_pdf),
+    "scanned": (".pdf", write_scanned_pdf),
+}
+
+
+def make_corpus(directory: str, counts: Dict[str, int], words: int, pages: int, seed: int) -> dict:
+    """Write the corpus; the same arguments always produce the same text"""
+    vocabulary = make_vocabulary(seed)
+    os.makedirs(directory, exist_ok=True)
+    total_bytes = 0
+    for kind, count in counts.items():
+        ext, write = WRITERS[kind]
+        for i in range(count):
+            rng = random.Random(f"{seed}:{kind}:{i}")
+            file_pages = [make_text(rng, vocabulary, max(1, words // pages)) for _ in range(pages)]
+            path = os.path.join(directory, f"{kind}_{i:05d}{ext}")
+            write(path, file_pages)
+            total_bytes += os.path.getsize(path)
+    return {"files": sum(counts.values()), "bytes": total_bytes}
+
+
+# -------- STAND-INS --------
+
+class MemoryStore:
+    """In-memory stand-in for the vector store: the writes index_docs makes, no ANN"""
+
+    backend = "memory"
+    shard = None
+
+    def __init__(self):
+        self.version = 1
+        self.chunks: Dict[str, tuple] = {}       # uid -> (properties, vector)
+        self.by_path: Dict[str, set] = {}
+        self.files: Dict[str, np.ndarray] = {}
+
+    def ensure_schema(self, file_vectors: bool = True, report_drift: bool = True):
+        pass
+
+    def property_names(self):
+        return set(vector_store.CHUNK_PROPERTY_NAMES)
+
+    def has_file_vectors(self) -> bool:
+        return bool(self.files)
+
+    def delete_path(self, path: str):
+        for uid in self.by_path.pop(path, ()):
+            self.chunks.pop(uid, None)
+        self.files.pop(path, None)
+
+    def insert_chunks(self, properties: List[dict], vectors, uids: Optional[List[str]] = None):
+        for i, (props, vector) in enumerate(zip(properties, vectors)):
+            uid = uids[i] if uids else str(uuid.uuid4())
+            self.chunks[uid] = (props, np.asarray(vector, dtype=np.float32))
+            self.by_path.setdefault(props["path"], set()).add(uid)
+
+    def update_chunk(self, uid: str, properties: dict):
+        props, vector = self.chunks[uid]
+        self.chunks[uid] = ({**props, **properties}, vector)
+
+    def upsert_file_vector(self, path: str, vectors, chunk_count: int):
+        self.files[path] = unit_rows(np.mean(np.asarray(vectors, dtype=np.float32), axis=0, keepdims=True))[0]
+
+    def count(self) -> int:
+        return len(self.chunks)
+
+    def close(self):
+        pass
+
+
+class HashEmbedder:
+    """Deterministic pseudo-embeddings (no model): isolates extraction, chunking and writes"""
+
+    def encode(self, texts, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        rows = []
+        for text in ([texts] if single else texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            rows.append(np.random.default_rng(seed).normal(size=HASH_EMBED_DIM))
+        vectors = unit_rows(np.asarray(rows, dtype=np.float32).reshape(-1, HASH_EMBED_DIM))
+        return vectors[0] if single else vectors
+
+
+def open_bench_store(kind: str, directory: str):
+    if kind == "memory":
+        return MemoryStore()
+    if kind == "local":
+        return LocalStore(os.path.join(directory, "vector_store"))
+    store = WeaviateStore(class_name=BENCH_CLASS_NAME, file_class_name=BENCH_FILE_CLASS_NAME)
+    store.drop()  # Leftovers of an interrupted run
+    store.close()
+    return WeaviateStore(class_name=BENCH_CLASS_NAME, file_class_name=BENCH_FILE_CLASS_NAME)
+
+
+# -------- MEASUREMENT --------
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_once(corpus: str, store_kind: str, text_cache: bool) -> dict:
+    """One full indexing run in a fresh working directory (index_state.db, caches, store)"""
+    work = tempfile.mkdtemp(prefix="sage_bench_index_")
+    cwd = os.getcwd()
+    os.chdir(work)  # SQLite state files are relative to the working directory
+    store = None
+    try:
+        conn = index_docs.init_db()
+        conn.execute("INSERT INTO user_roots (path) VALUES (?)", (corpus,))
+        conn.commit()
+        conn.close()
+
+        store = open_bench_store(store_kind, work)
+        index_docs.open_store = lambda *args, **kwargs: store
+        index_docs.ENABLE_TEXT_CACHE = text_cache
+
+        start = time.perf_counter()
+        index_docs.main()
+        wall = time.perf_counter() - start
+
+        run = index_docs.current_run
+        counters = run.counters
+        return {
+            "wall_s": round(wall, 3),
+            "files_per_sec": round(counters["files"] / wall, 2),
+            "chunks_per_sec": round(counters["chunks"] / wall, 2),
+            "peak_rss_mb": peak_rss_mb(),
+            "counters": counters,
+            "stage_seconds": {s: round(t, 3) for s, t in run.stage_seconds.items()},
+            "throughput": run.throughput(),
+            "slowest_files": [
+                {"file": os.path.basename(f["path"]), "seconds": f["seconds"], "chunks": f["chunks"]}
+                for f in run.slowest()[:5]
+            ],
+        }
+    finally:
+        if store_kind == "weaviate" and store is not None:
+            cleanup = WeaviateStore(class_name=BENCH_CLASS_NAME, file_class_name=BENCH_FILE_CLASS_NAME)
+            cleanup.drop()
+            cleanup.close()
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def summarize(runs: List[dict]) -> dict:
+    """Median over repeats"""
+    def median(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    return {
+        "wall_s": median(r["wall_s"] for r in runs),
+        "files_per_sec": median(r["files_per_sec"] for r in runs),
+        "chunks_per_sec": median(r["chunks_per_sec"] for r in runs),
+        "peak_rss_mb": max((r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None), default=None),
+        "stage_seconds": {s: median(r["stage_seconds"][s] for r in runs) for s in runs[0]["stage_seconds"]},
+    }
+
+
+def compare(baseline: dict, current: dict):
+    """Print metric changes against a previous result file"""
+    def line(name, old, new, higher_is_better):
+        if old is None or new is None:
+            return
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == higher_is_better
+        mark = "" if abs(change) < 5 else (" (better)" if better else " (WORSE)")
+        print(f"        {name:<22} {old:>10} -> {new:>10}  {change:+6.1f}%{mark}")
+
+    old, new = baseline["summary"], current["summary"]
+    if baseline["config"] != current["config"]:
+        print("[WARN] Baseline was run with a different configuration")
+    print("[BENCH] Compared with baseline:")
+    line("files_per_sec", old["files_per_sec"], new["files_per_sec"], True)
+    line("chunks_per_sec", old["chunks_per_sec"], new["chunks_per_sec"], True)
+    line("peak_rss_mb", old["peak_rss_mb"], new["peak_rss_mb"], False)
+    for stage, seconds in new["stage_seconds"].items():
+        line(f"stage {stage} (s)", old["stage_seconds"].get(stage), seconds, False)
+
+
+# -------- MAIN --------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the indexing pipeline")
+    for kind, default in (("txt", 100), ("docx", 20), ("pptx", 20), ("pdf", 20), ("scanned", 0)):
+        parser.add_argument(f"--{kind}", type=int, default=default, help=f"Number of {kind} files")
+    parser.add_argument("--words", type=int, default=2000, help="Words per file")
+    parser.add_argument("--pages", type=int, default=4, help="Pages (paragraph blocks, slides) per file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", choices=["memory", "local", "weaviate"], default="memory")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--text-cache", action="store_true", help="Keep the extracted-text cache on (off: measure extraction)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--corpus-dir", help="Reuse/keep the generated corpus here")
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous --out file to compare against")
+    args = parser.parse_args()
+
+    counts = {kind: getattr(args, kind) for kind in WRITERS if getattr(args, kind) > 0}
+    corpus = os.path.abspath(args.corpus_dir or tempfile.mkdtemp(prefix="sage_bench_corpus_"))
+    try:
+        print(f"[BENCH] Generating corpus {counts} in {corpus}...")
+        start = time.perf_counter()
+        corpus_info = make_corpus(corpus, counts, args.words, args.pages, args.seed)
+        print(f"        {corpus_info['files']} files, {corpus_info['bytes'] / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s")
+
+        if args.embedder == "hash":
+            index_docs.get_model = lambda *a, **k: HashEmbedder()
+        else:
+            print("[BENCH] Loading embedding model...")
+            index_docs.get_model(index_docs.EMBED_MODEL)  # Not part of the timed runs
+
+        runs = []
+        for i in range(args.repeat):
+            print(f"[BENCH] Run {i + 1}/{args.repeat} ({args.store} store, {args.embedder} embedder)...")
+            runs.append(run_once(corpus, args.store, args.text_cache))
+            print(f"        {runs[-1]['files_per_sec']} files/s, {runs[-1]['chunks_per_sec']} chunks/s, "
+                  f"stages {runs[-1]['stage_seconds']}")
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus, ignore_errors=True)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare", "corpus_dir", "repeat")}
+    results = {
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "chunk_size": index_docs.CHUNK_SIZE,
+            "chunk_dedup": index_docs.ENABLE_CHUNK_DEDUP,
+            "sentence_vectors": index_docs.ENABLE_SENTENCE_VECTORS,
+        },
+        "corpus": corpus_info,
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+    print(f"[BENCH] Summary: {results['summary']}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[DONE] Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Search benchmark: replays a fixed query set (clean and deliberately
+misspelled) through search.semantic_search() over a deterministic
+synthetic corpus in a local store, and reports p50/p95/p99 latency per
+stage plus recall@k against exact brute-force cosine search, for every
+top_k x FETCH_BUFFER combination.
+
+    python benchmarks/bench_search.py --files 2000 --top-k 5,10 --fetch-buffer 3,10,20
+    python benchmarks/bench_search.py --index hnsw --ef 64 --no-hybrid --out search.json
+
+Runs offline on CPU: the default "words" embedder is a deterministic
+bag-of-words projection (texts sharing words get similar vectors); use
+--embedder model for the real sentence-transformers model.
+
+Ground truth for a misspelled query is the exact result of its clean form,
+so its recall includes what spell correction fails to recover.
+  recall@k        returned files found in the exact top_k files (best chunk per file)
+  ann_recall      chunks of the store's top top_k*FETCH_BUFFER query found in the exact ones
+  dedup_loss      exact top_k files absent from every fetched candidate chunk
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import contextlib
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search
+import vector_store
+from vector_store import LocalStore, hit_refs, unit_rows
+
+EMBED_DIM = 384  # all-MiniLM-L6-v2
+INSERT_BATCH = 1000
+TOPIC_WORDS = 150   # Words specific to each topic
+COMMON_WORDS = 2000  # Zipf-distributed words shared by all topics
+FILES_PER_TOPIC = 10
+WARMUP_QUERIES = 5
+
+
+# -------- DATA --------
+
+def make_words(rng: random.Random, count: int) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def make_corpus(root: str, files: int, chunks_per_file: int, words_per_chunk: int, seed: int):
+    """Chunk properties and texts; each file mixes its topic's words with common ones"""
+    rng = random.Random(seed)
+    common = make_words(rng, COMMON_WORDS)
+    weights = [1 / (rank + 1) for rank in range(len(common))]
+    topics = [make_words(rng, TOPIC_WORDS) for _ in range(max(1, files // FILES_PER_TOPIC))]
+
+    props, owner = [], []
+    for f in range(files):
+        topic = topics[f % len(topics)]
+        name = f"doc_{f:05d}.txt"
+        for c in range(chunks_per_file):
+            picked = [
+                rng.choice(topic) if rng.random() < 0.5 else rng.choices(common, weights=weights)[0]
+                for _ in range(words_per_chunk)
+            ]
+            sentences = [" ".join(picked[i:i + 12]) for i in range(0, len(picked), 12)]
+            text = " ".join(s[:1].upper() + s[1:] + "." for s in sentences)
+            props.append({"file": name, "path": os.path.join(root, name), "chunk": text})
+            owner.append(f)
+    return props, np.asarray(owner)
+
+
+def misspell(rng: random.Random, word: str) -> str:
+    """One random edit (swap, drop, replace or insert) inside the word"""
+    i = rng.randint(1, len(word) - 2)
+    edit = rng.choice(("swap", "drop", "replace", "insert"))
+    if edit == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if edit == "drop":
+        return word[:i] + word[i + 1:]
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    if edit == "replace":
+        return word[:i] + letter + word[i + 1:]
+    return word[:i] + letter + word[i:]
+
+
+def make_queries(props: List[dict], count: int, seed: int) -> List[dict]:
+    """3-word queries taken from random chunks, each with a misspelled twin"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        words = sorted({w.lower() for w in re.findall(r"[a-zA-Z]{5,}", rng.choice(props)["chunk"])})
+        clean = rng.sample(words, min(3, len(words)))
+        typo = [misspell(rng, w) if j == 0 or rng.random() < 0.5 else w for j, w in enumerate(clean)]
+        queries.append({"clean": " ".join(clean), "misspelled": " ".join(typo)})
+    return queries
+
+
+class WordsEmbedder:
+    """Offline stand-in for the model: sum of fixed pseudo-random vectors of the words"""
+
+    def __init__(self):
+        self._vectors: Dict[str, np.ndarray] = {}
+
+    def word_vector(self, word: str) -> np.ndarray:
+        vector = self._vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = self._vectors[word] = np.random.default_rng(seed).normal(size=EMBED_DIM).astype(np.float32)
+        return vector
+
+    def encode(self, texts, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        rows = []
+        for text in ([texts] if single else texts):
+            words = re.findall(r"[a-z]{3,}", text.lower())
+            rows.append(np.sum([self.word_vector(w) for w in words], axis=0) if words else np.ones(EMBED_DIM))
+        vectors = unit_rows(np.asarray(rows, dtype=np.float32).reshape(-1, EMBED_DIM))
+        return vectors[0] if single else vectors
+
+
+# -------- GROUND TRUTH --------
+
+def exact_truth(vectors: np.ndarray, owner: np.ndarray, files: int, query_vector: np.ndarray,
+                max_chunks: int, max_files: int) -> dict:
+    """Exact chunk rows and files (ranked by their best chunk) of one query, best first"""
+    scores = vectors @ query_vector
+    n = min(max_chunks, len(scores))
+    rows = np.argpartition(-scores, n - 1)[:n]
+    best = np.full(files, -np.inf, dtype=np.float32)
+    np.maximum.at(best, owner, scores)
+    return {
+        "rows": rows[np.argsort(-scores[rows])].tolist(),
+        "files": np.argsort(-best)[:max_files].tolist(),
+    }
+
+
+# -------- MEASUREMENT --------
+
+def attach(store, embedder):
+    """Make search use this store and embedder without index_state.db"""
+    search._store = store
+    search._store_version = store.version
+    search._store_checked = time.monotonic()
+    search._store_embed_model = search.EMBED_MODEL
+    search.GENERATION_CHECK_SECONDS = float("inf")
+    search._models[search.EMBED_MODEL] = embedder
+    search.invalidate_vocabulary()
+
+
+class FetchRecorder:
+    """Wraps search.fetch_candidates to collect the paths of every fetched chunk"""
+
+    def __init__(self):
+        self.paths = set()
+        self._fetch = search.fetch_candidates
+
+    def __call__(self, *args, **kwargs):
+        objects = self._fetch(*args, **kwargs)
+        for obj in objects:
+            self.paths.update(hit_refs(obj))
+        return objects
+
+
+def percentiles(values: List[float]) -> dict:
+    values = np.asarray(values)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def measure(store, queries: List[dict], corpus: dict, top_k: int, fetch_buffer: int, args) -> dict:
+    """Latency per stage, recall@k and dedup loss of one top_k x FETCH_BUFFER setting"""
+    search.FETCH_BUFFER = fetch_buffer
+    recorder = FetchRecorder()
+    search.fetch_candidates = recorder
+    options = {"roots": [corpus["root"]], "snippet_mode": args.snippet_mode, "retrieval": args.retrieval}
+    quiet = open(os.devnull, "w")  # Correction and vocabulary logging
+    try:
+        with contextlib.redirect_stdout(quiet):
+            for q in queries[:WARMUP_QUERIES]:
+                search.semantic_search(q["clean"], top_k, **options)
+
+        result = {}
+        for kind in ("clean", "misspelled"):
+            totals, stages, recalls, losses = [], {}, [], []
+            for _ in range(args.repeat):
+                for q in queries:
+                    recorder.paths = set()
+                    stats = {}
+                    with contextlib.redirect_stdout(quiet):
+                        start = time.perf_counter()
+                        hits = search.semantic_search(q[kind], top_k, stats=stats, **options)
+                        totals.append((time.perf_counter() - start) * 1000)
+                    for stage, ms in stats["timings_ms"].items():
+                        stages.setdefault(stage, []).append(ms)
+
+                    expected = set(q["truth"]["files"][:top_k])
+                    found = {corpus["file_ids"][h["path"]] for h in hits}
+                    fetched = {corpus["file_ids"][p] for p in recorder.paths if p in corpus["file_ids"]}
+                    recalls.append(len(found & expected) / len(expected))
+                    losses.append(len(expected - fetched) / len(expected))
+
+            result[kind] = {
+                "total": percentiles(totals),
+                "stages": {stage: percentiles(values) for stage, values in stages.items()},
+                f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+                "dedup_loss": round(float(np.mean(losses)), 4),
+            }
+
+        # ANN quality of the store alone, at the pool size a fixed fetch requests
+        limit = top_k * fetch_buffer
+        ann = []
+        for q in queries:
+            hits = store.query(q["vector"], limit, return_properties=["path", "chunk"])
+            rows = {corpus["row_ids"].get((h.properties["path"], h.properties["chunk"])) for h in hits}
+            expected = set(q["truth"]["rows"][:limit])
+            ann.append(len(rows & expected) / len(expected))
+        result[f"ann_recall@{limit}"] = round(float(np.mean(ann)), 4)
+        return result
+    finally:
+        search.fetch_candidates = recorder._fetch
+        quiet.close()
+
+
+# -------- MAIN --------
+
+def int_list(text: str) -> List[int]:
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search latency and recall")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--chunks-per-file", type=int, default=8)
+    parser.add_argument("--words-per-chunk", type=int, default=150)
+    parser.add_argument("--queries", type=int, default=100, help="Clean queries (each also run misspelled)")
+    parser.add_argument("--top-k", type=int_list, default=[5, 10])
+    parser.add_argument("--fetch-buffer", type=int_list, default=[3, 10])
+    parser.add_argument("--strategy", choices=["fixed", "adaptive", "group_by"], default=search.FETCH_STRATEGY)
+    parser.add_argument("--retrieval", choices=list(search.RETRIEVAL_MODES), default="chunks")
+    parser.add_argument("--snippet-mode", choices=list(search.SNIPPET_MODES), default="semantic")
+    parser.add_argument("--no-hybrid", action="store_true", help="Pure semantic scoring")
+    parser.add_argument("--index", choices=["brute", "hnsw"], default="brute", help="Local store query method")
+    parser.add_argument("--ef", type=int, default=vector_store.LOCAL_HNSW_EF, help="HNSW query-time ef")
+    parser.add_argument("--embedder", choices=["words", "model"], default="words")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the query set per setting")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.index == "hnsw" and vector_store.hnswlib is None:
+        parser.error("hnswlib is not installed")
+    search.FETCH_STRATEGY = args.strategy
+    search.ENABLE_HYBRID = not args.no_hybrid
+    vector_store.LOCAL_HNSW_EF = args.ef
+
+    work = tempfile.mkdtemp(prefix="sage_bench_search_")
+    cwd = os.getcwd()
+    os.chdir(work)  # Keep index_state.db lookups away from the real one
+    try:
+        root = os.path.join(work, "corpus")
+        print(f"[BENCH] Generating {args.files} files x {args.chunks_per_file} chunks...")
+        props, owner = make_corpus(root, args.files, args.chunks_per_file, args.words_per_chunk, args.seed)
+        queries = make_queries(props, args.queries, args.seed)
+
+        if args.embedder == "model":
+            print("[BENCH] Loading embedding model...")
+            embedder = search.get_model(search.EMBED_MODEL)
+        else:
+            embedder = WordsEmbedder()
+
+        print(f"[BENCH] Embedding and loading {len(props)} chunks...")
+        start = time.perf_counter()
+        vectors = unit_rows(embedder.encode([p["chunk"] for p in props], normalize_embeddings=True))
+        vector_store.LOCAL_HNSW_THRESHOLD = 0 if args.index == "hnsw" else len(props) + 1
+        store = LocalStore(os.path.join(work, "vector_store"), dtype=np.float32)
+        for i in range(0, len(props), INSERT_BATCH):
+            store.insert_chunks(props[i:i + INSERT_BATCH], vectors[i:i + INSERT_BATCH])
+        for f in range(args.files):
+            rows = np.flatnonzero(owner == f)
+            store.upsert_file_vector(props[rows[0]]["path"], vectors[rows], len(rows))
+        store.query(vectors[0].tolist(), 1)  # Builds the in-memory view (and HNSW graph)
+        print(f"        {time.perf_counter() - start:.1f}s")
+
+        corpus = {
+            "root": root,
+            "file_ids": {props[i]["path"]: int(owner[i]) for i in range(len(props))},
+            "row_ids": {(p["path"], p["chunk"]): i for i, p in enumerate(props)},
+        }
+        max_chunks = max(args.top_k) * max(args.fetch_buffer)
+        for q in queries:
+            q["vector"] = embedder.encode(q["clean"], normalize_embeddings=True).tolist()
+            q["truth"] = exact_truth(vectors, owner, args.files, np.asarray(q["vector"], dtype=np.float32),
+                                     max_chunks, max(args.top_k))
+
+        attach(store, embedder)
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            corrected = sum(search.correct_query(q["misspelled"]) == q["clean"] for q in queries)
+
+        results = {
+            "config": {k: v for k, v in vars(args).items() if k != "out"},
+            "corpus": {"files": args.files, "chunks": len(props)},
+            "spell_correction_rate": round(corrected / len(queries), 4),
+            "settings": [],
+        }
+        print(f"[BENCH] Misspelled queries fully corrected: {results['spell_correction_rate']:.1%}")
+
+        for top_k in args.top_k:
+            for fetch_buffer in args.fetch_buffer:
+                print(f"[BENCH] top_k={top_k} FETCH_BUFFER={fetch_buffer}...")
+                result = measure(store, queries, corpus, top_k, fetch_buffer, args)
+                results["settings"].append({"top_k": top_k, "fetch_buffer": fetch_buffer, **result})
+                for kind in ("clean", "misspelled"):
+                    r = result[kind]
+                    print(f"        {kind:<10} p50 {r['total']['p50_ms']}ms  p95 {r['total']['p95_ms']}ms  "
+                          f"p99 {r['total']['p99_ms']}ms  recall@{top_k} {r[f'recall@{top_k}']}  "
+                          f"dedup loss {r['dedup_loss']}")
+                print(f"        ann_recall@{top_k * fetch_buffer} {result[f'ann_recall@{top_k * fetch_buffer}']}")
+        store.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[DONE] Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
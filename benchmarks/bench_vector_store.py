@@ -0,0 +1,172 @@
+"""
+Vector store benchmark: query latency and recall@k of the local backend
+(brute force and HNSW) and, optionally, Weaviate, on synthetic clustered
+unit vectors. Ground truth is an exact float32 dot product.
+
+    python benchmarks/bench_vector_store.py --chunks 20000
+    python benchmarks/bench_vector_store.py --chunks 200000 --weaviate --out bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vector_store
+from vector_store import LocalStore, WeaviateStore, unit_rows
+
+BENCH_CLASS_NAME = "BenchDocuments"  # Never the real collection
+INSERT_BATCH = 1000
+
+
+# -------- DATA --------
+
+def make_corpus(chunks: int, dim: int, files: int, seed: int):
+    """Clustered unit vectors (one cluster per file) plus chunk properties"""
+    rng = np.random.default_rng(seed)
+    centers = unit_rows(rng.normal(size=(files, dim)))
+    owner = rng.integers(0, files, size=chunks)
+    vectors = unit_rows(centers[owner] + 1.4 * rng.normal(size=(chunks, dim)) / np.sqrt(dim))
+    props = [
+        {"file": f"f{o}.txt", "path": f"/bench/f{o}.txt", "chunk": f"chunk {i}"}
+        for i, o in enumerate(owner)
+    ]
+    return vectors, props
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Queries near random stored vectors"""
+    rng = np.random.default_rng(seed + 1)
+    picks = vectors[rng.integers(0, len(vectors), size=count)]
+    return unit_rows(picks + 0.5 * rng.normal(size=picks.shape) / np.sqrt(vectors.shape[1]))
+
+
+def ground_truth(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+
+# -------- MEASUREMENT --------
+
+def load(store, vectors: np.ndarray, props: list) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(vectors), INSERT_BATCH):
+        store.insert_chunks(props[i:i + INSERT_BATCH], vectors[i:i + INSERT_BATCH])
+    return time.perf_counter() - start
+
+
+def measure(store, queries: np.ndarray, truth: np.ndarray, k: int, warmup: int = 3) -> dict:
+    """Latency percentiles and mean recall@k for one store"""
+    for q in queries[:warmup]:
+        store.query(q.tolist(), k, return_properties=["chunk"])
+
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = store.query(q.tolist(), k, return_properties=["chunk"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(h.properties["chunk"].split()[1]) for h in hits}
+        recalls.append(len(found & set(expected.tolist())) / k)
+
+    latencies = np.asarray(latencies)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+    }
+
+
+def bench_local(vectors, props, queries, truth, k, dtype, hnsw: bool) -> dict:
+    directory = tempfile.mkdtemp(prefix="sage_bench_")
+    vector_store.LOCAL_HNSW_THRESHOLD = 0 if hnsw else len(vectors) + 1
+    try:
+        store = LocalStore(directory, dtype=dtype)
+        load_s = load(store, vectors, props)
+
+        start = time.perf_counter()
+        store.query(queries[0].tolist(), k)  # Builds the in-memory view (and HNSW graph)
+        build_s = time.perf_counter() - start
+
+        result = measure(store, queries, truth, k)
+        result.update({
+            "load_s": round(load_s, 2),
+            "first_query_s": round(build_s, 2),
+            "disk_mb": round(sum(
+                os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+            ) / 1e6, 1),
+        })
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_weaviate(vectors, props, queries, truth, k) -> dict:
+    store = WeaviateStore(class_name=BENCH_CLASS_NAME)
+    try:
+        if store.client.collections.exists(BENCH_CLASS_NAME):
+            store.client.collections.delete(BENCH_CLASS_NAME)
+        store.ensure_schema(file_vectors=False)
+        load_s = load(store, vectors, props)
+        result = measure(store, queries, truth, k)
+        result["load_s"] = round(load_s, 2)
+        return result
+    finally:
+        store.client.collections.delete(BENCH_CLASS_NAME)
+        store.close()
+
+
+# -------- MAIN --------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector store backends")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)  # all-MiniLM-L6-v2
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=50)  # Roughly top_k * FETCH_BUFFER
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--weaviate", action="store_true", help="Also benchmark a running Weaviate")
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"[BENCH] Generating {args.chunks} x {args.dim} vectors...")
+    vectors, props = make_corpus(args.chunks, args.dim, args.files, args.seed)
+    queries = make_queries(vectors, args.queries, args.seed)
+    truth = ground_truth(vectors, queries, args.top_k)
+
+    results = {"config": vars(args), "backends": {}}
+    runs = [
+        ("local_float32_brute", lambda: bench_local(vectors, props, queries, truth, args.top_k, np.float32, False)),
+        ("local_float16_brute", lambda: bench_local(vectors, props, queries, truth, args.top_k, np.float16, False)),
+    ]
+    if vector_store.hnswlib is not None:
+        runs.append(
+            ("local_float16_hnsw", lambda: bench_local(vectors, props, queries, truth, args.top_k, np.float16, True))
+        )
+    else:
+        print("[WARN] hnswlib not installed, skipping local HNSW")
+    if args.weaviate:
+        runs.append(("weaviate", lambda: bench_weaviate(vectors, props, queries, truth, args.top_k)))
+
+    for name, run in runs:
+        print(f"[BENCH] {name}...")
+        results["backends"][name] = run()
+        print(f"        {results['backends'][name]}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[DONE] Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Backend launcher for the load test (benchmarks/load_test.py): runs
+backend/main.py with the local vector store instead of Weaviate and a
+stand-in embedder instead of the model, and exports the event-loop lag
+as sage_event_loop_lag_seconds on /metrics. Run it from a scratch
+working directory; index_state.db and the store are created there.
+
+    python benchmarks/load_server.py --port 8765 --embed-ms 3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+os.environ["SAGE_VECTOR_BACKEND"] = "local"  # Read when vector_store is imported
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "backend"))
+sys.path.insert(0, BENCH_DIR)
+
+import uvicorn
+
+import main as backend
+import search
+import metrics
+from bench_search import WordsEmbedder
+
+LAG_INTERVAL = 0.05  # Seconds between event-loop lag probes
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+EVENT_LOOP_LAG = metrics.Histogram(
+    "sage_event_loop_lag_seconds", "Delay of a periodic event-loop timer (load test probe)", buckets=LAG_BUCKETS
+)
+lag_max = 0.0
+metrics.Gauge("sage_event_loop_lag_max_seconds", "Largest event-loop lag seen", fn=lambda: lag_max)
+
+
+class StandInEmbedder(WordsEmbedder):
+    """WordsEmbedder that also burns `cost_ms` of CPU per text, holding the GIL like inference does"""
+
+    def __init__(self, cost_ms: float):
+        super().__init__()
+        self.cost = cost_ms / 1000
+
+    def encode(self, texts, normalize_embeddings: bool = False, **kwargs):
+        count = 1 if isinstance(texts, str) else len(texts)
+        deadline = time.perf_counter() + self.cost * count
+        while time.perf_counter() < deadline:
+            pass
+        return super().encode(texts, normalize_embeddings=normalize_embeddings)
+
+
+async def monitor_lag():
+    global lag_max
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag = max(0.0, loop.time() - start - LAG_INTERVAL)
+        lag_max = max(lag_max, lag)
+        EVENT_LOOP_LAG.observe(lag)
+
+
+async def serve(port: int):
+    server = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=port, log_level="warning"))
+    monitor = asyncio.create_task(monitor_lag())
+    try:
+        await server.serve()
+    finally:
+        monitor.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the backend with local stand-ins")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embed-ms", type=float, default=3.0, help="CPU time the stand-in embedder spends per text")
+    args = parser.parse_args()
+
+    # Both the searcher and the indexer resolve models through search.get_model()
+    search._models[search.EMBED_MODEL] = StandInEmbedder(args.embed_ms)
+    print(f"[LOAD] Backend on 127.0.0.1:{args.port} (local store, stand-in embedder {args.embed_ms}ms/text)")
+    asyncio.run(serve(args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+End-to-end load test of the backend over HTTP. Starts benchmarks/load_server.py
+(backend/main.py on the local vector store with a stand-in embedder) in a
+scratch directory, indexes a synthetic corpus, then for --duration seconds
+runs concurrently:
+  - closed-loop POST /search clients (--concurrency),
+  - /index/progress pollers at the UI's rate,
+  - a writer creating files in the watched root, so the watchdog keeps
+    triggering indexing runs under the search load,
+  - a GET / probe (client-side view of event-loop responsiveness).
+Reports throughput, p50/p95/p99/max latency and errors per endpoint,
+search latency while indexing vs idle, and the server's event-loop lag.
+
+    python benchmarks/load_test.py --concurrency 8 --duration 60
+    python benchmarks/load_test.py --files 2000 --embed-ms 5 --out load.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_indexing import make_corpus, make_text, make_vocabulary
+
+STARTUP_TIMEOUT = 120  # Seconds to wait for the backend to answer
+INDEX_TIMEOUT = 600    # Seconds to wait for the initial indexing run
+PROBE_INTERVAL = 0.1   # Seconds between GET / probes
+
+
+# -------- HTTP --------
+
+class Client:
+    """Keep-alive JSON client for one thread; records (endpoint, status, seconds, indexing)"""
+
+    def __init__(self, port: int, log: List[tuple], state: dict):
+        self.port = port
+        self.log = log
+        self.state = state
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Optional[dict] = None, endpoint: Optional[str] = None):
+        indexing = self.state["indexing"]
+        start = time.perf_counter()
+        status, result = 0, None
+        for attempt in range(2):  # The server closes idle keep-alive connections: retry once on a new one
+            reused = self.conn is not None
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+                payload = json.dumps(body) if body is not None else None
+                self.conn.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+                response = self.conn.getresponse()
+                data = response.read()
+                status = response.status
+                result = json.loads(data) if response.getheader("content-type", "").startswith("application/json") else data
+                if status == 200 and isinstance(result, dict) and result.get("error"):
+                    status = 500  # /search reports failures in a 200 body
+                break
+            except (OSError, http.client.HTTPException, ValueError):
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                if not reused:
+                    break
+        self.log.append((endpoint or path, status, time.perf_counter() - start, indexing))
+        return status, result
+
+
+def wait_until(predicate, timeout: float, interval: float = 0.2) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+
+# -------- LOAD --------
+
+def make_queries(vocabulary: List[str], count: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 2)
+    common = vocabulary[:500]  # Frequent words, so queries hit many chunks
+    return [" ".join(rng.sample(common, rng.randint(1, 4))) for _ in range(count)]
+
+
+def search_worker(client: Client, queries: List[str], stop: threading.Event, seed: int, top_k: int):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        client.request("POST", "/search", {"query": rng.choice(queries), "top_k": top_k}, endpoint="/search")
+
+
+def progress_poller(client: Client, stop: threading.Event, interval: float):
+    while not stop.is_set():
+        status, body = client.request("GET", "/index/progress")
+        if status == 200 and isinstance(body, dict):
+            client.state["indexing"] = bool(body.get("indexing"))
+        stop.wait(interval)
+
+
+def probe(client: Client, stop: threading.Event):
+    while not stop.is_set():
+        client.request("GET", "/")
+        stop.wait(PROBE_INTERVAL)
+
+
+def writer(root: str, vocabulary: List[str], stop: threading.Event, interval: float, words: int, seed: int):
+    """New files in the watched root, one every `interval` seconds"""
+    rng = random.Random(seed + 3)
+    i = 0
+    while not stop.wait(interval):
+        with open(os.path.join(root, f"load_{i:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(make_text(rng, vocabulary, words))
+        i += 1
+
+
+# -------- REPORT --------
+
+def summarize(entries: List[tuple], duration: float) -> dict:
+    latencies = np.asarray([s for _, status, s, _ in entries if status == 200]) * 1000
+    statuses: Dict[str, int] = {}
+    for _, status, _, _ in entries:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    summary = {
+        "requests": len(entries),
+        "ok": int(len(latencies)),
+        "shed_503": statuses.get("503", 0),
+        "errors": len(entries) - len(latencies) - statuses.get("503", 0),
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / duration, 2),
+    }
+    if len(latencies):
+        summary.update({
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            "max_ms": round(float(latencies.max()), 2),
+        })
+    return summary
+
+
+def parse_histogram(text: str, name: str) -> Optional[dict]:
+    """Count, mean and bucket-estimated p99/max bound of a label-less histogram in /metrics output"""
+    buckets = [(float("inf") if le == "+Inf" else float(le), int(float(n)))
+               for le, n in re.findall(rf'^{name}_bucket{{le="([^"]+)"}} (\S+)$', text, re.M)]
+    count = re.search(rf"^{name}_count (\S+)$", text, re.M)
+    total = re.search(rf"^{name}_sum (\S+)$", text, re.M)
+    if not buckets or not count or not float(count.group(1)):
+        return None
+    count, total = float(count.group(1)), float(total.group(1))
+    p99 = next(bound for bound, n in buckets if n >= 0.99 * count)
+    return {"samples": int(count), "mean_ms": round(total / count * 1000, 2),
+            "p99_le_ms": None if p99 == float("inf") else p99 * 1000}
+
+
+# -------- MAIN --------
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test of the backend with local stand-ins")
+    parser.add_argument("--files", type=int, default=300, help="txt files indexed before the load starts")
+    parser.add_argument("--words", type=int, default=1500, help="Words per file")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /search clients")
+    parser.add_argument("--pollers", type=int, default=2, help="Concurrent /index/progress pollers")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--write-interval", type=float, default=5.0, help="Seconds between new files (0: no writes)")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-ms", type=float, default=3.0, help="Stand-in embedder CPU time per text")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    parser.add_argument("--log", help="Keep the backend log at this path")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="sage_load_")
+    root = os.path.join(work, "corpus")
+    log_path = os.path.join(work, "backend.log")
+    vocabulary = make_vocabulary(args.seed)
+    print(f"[LOAD] Generating {args.files} files in {root}...")
+    make_corpus(root, {"txt": args.files}, args.words, 4, args.seed)
+
+    server = None
+    stop = threading.Event()
+    try:
+        with open(log_path, "w") as log_file:
+            server = subprocess.Popen(
+                [sys.executable, "-u", os.path.join(BENCH_DIR, "load_server.py"),
+                 "--port", str(args.port), "--embed-ms", str(args.embed_ms)],
+                cwd=work, stdout=log_file, stderr=subprocess.STDOUT,
+            )
+        state = {"indexing": False}
+        setup = Client(args.port, [], state)
+        if not wait_until(lambda: server.poll() is None and setup.request("GET", "/")[0] == 200, STARTUP_TIMEOUT):
+            raise RuntimeError("Backend did not start")
+
+        print("[LOAD] Indexing the corpus...")
+        start = time.perf_counter()
+        setup.request("POST", "/roots/add", {"path": root})
+        setup.request("POST", "/index")
+        if not wait_until(lambda: not setup.request("GET", "/index/progress")[1].get("indexing"), INDEX_TIMEOUT, 0.5):
+            raise RuntimeError("Initial indexing did not finish")
+        initial_index_s = time.perf_counter() - start
+        print(f"        {initial_index_s:.1f}s")
+        runs_before = len(setup.request("GET", "/index/runs?limit=500")[1]["runs"])
+
+        log: List[tuple] = []  # list.append is atomic; one shared log for all threads
+        queries = make_queries(vocabulary, 200, args.seed)
+        threads = [
+            threading.Thread(target=search_worker, args=(Client(args.port, log, state), queries, stop, args.seed + i, args.top_k))
+            for i in range(args.concurrency)
+        ]
+        threads += [threading.Thread(target=progress_poller, args=(Client(args.port, log, state), stop, args.poll_interval))
+                    for _ in range(args.pollers)]
+        threads.append(threading.Thread(target=probe, args=(Client(args.port, log, state), stop)))
+        if args.write_interval > 0:
+            threads.append(threading.Thread(target=writer, args=(root, vocabulary, stop, args.write_interval, args.words, args.seed)))
+
+        print(f"[LOAD] {args.concurrency} search clients, {args.pollers} pollers for {args.duration:.0f}s...")
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+        metrics_text = setup.request("GET", "/metrics")[1].decode("utf-8")
+        runs_during = len(setup.request("GET", "/index/runs?limit=500")[1]["runs"]) - runs_before
+    finally:
+        stop.set()
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if args.log:
+            shutil.copyfile(log_path, args.log)
+        shutil.rmtree(work, ignore_errors=True)
+
+    endpoints = sorted({entry[0] for entry in log})
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "log", "port")},
+        "initial_index_s": round(initial_index_s, 2),
+        "duration_s": round(duration, 2),
+        "indexing_runs_during_load": runs_during,
+        "endpoints": {e: summarize([x for x in log if x[0] == e], duration) for e in endpoints},
+        "search_while_indexing": summarize([x for x in log if x[0] == "/search" and x[3]], duration),
+        "search_while_idle": summarize([x for x in log if x[0] == "/search" and not x[3]], duration),
+        "event_loop_lag": parse_histogram(metrics_text, "sage_event_loop_lag_seconds"),
+        "event_loop_lag_max_ms": round(float(re.search(
+            r"^sage_event_loop_lag_max_seconds (\S+)$", metrics_text, re.M).group(1)) * 1000, 2),
+    }
+
+    for name, summary in list(results["endpoints"].items()) + [
+        ("/search (indexing)", results["search_while_indexing"]), ("/search (idle)", results["search_while_idle"])
+    ]:
+        print(f"[LOAD] {name:<20} {summary['throughput_rps']:>8} req/s  p50 {summary.get('p50_ms')}ms  "
+              f"p95 {summary.get('p95_ms')}ms  p99 {summary.get('p99_ms')}ms  max {summary.get('max_ms')}ms  "
+              f"503 {summary['shed_503']}  errors {summary['errors']}")
+    print(f"[LOAD] Event-loop lag: {results['event_loop_lag']}, max {results['event_loop_lag_max_ms']}ms")
+    print(f"[LOAD] Indexing runs during load: {runs_during}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[DONE] Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
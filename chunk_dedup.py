@@ -0,0 +1,328 @@
+import os
+import re
+import uuid
+import sqlite3
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+
+DEDUP_DB = "chunk_dedup.db"  # Own file: the indexer holds a write transaction on index_state.db per run
+SIMHASH_SHINGLE = 3        # Words per shingle
+SIMHASH_MAX_DISTANCE = 3   # Max differing bits (of 64) for two chunks to be near-duplicates
+SIMHASH_BANDS = 4          # 16-bit bands; > SIMHASH_MAX_DISTANCE so near-duplicates share a band
+
+# --------------------------------------
+
+BAND_BITS = 64 // SIMHASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+# -------- FINGERPRINTS --------
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word shingles (signed, so it fits SQLite INTEGER)"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) >= SIMHASH_SHINGLE:
+        shingles = [" ".join(words[i:i + SIMHASH_SHINGLE]) for i in range(len(words) - SIMHASH_SHINGLE + 1)]
+    else:
+        shingles = [" ".join(words)]
+
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    fingerprint = int(np.packbits(votes > 0, bitorder="little").view(np.uint64)[0])
+    return fingerprint - (1 << 64) if fingerprint >= (1 << 63) else fingerprint
+
+
+def bands(fingerprint: int) -> List[int]:
+    unsigned = fingerprint & ((1 << 64) - 1)
+    return [(unsigned >> (i * BAND_BITS)) & BAND_MASK for i in range(SIMHASH_BANDS)]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+# -------- CLUSTER STATE --------
+# One row per stored (canonical) chunk object and one ref per file that
+# contains it, scoped by store key so index generations (and per-root
+# shards, which never share objects) never mix. Refs live only here: a
+# file joining a shared chunk never rewrites the stored object; readers
+# attach the refs to hits (with_refs) and hit_refs() reports them.
+
+def store_key(store) -> str:
+    if store.shard:
+        return f"{store.backend}:{store.version}:{store.shard}"
+    return f"{store.backend}:{store.version}"
+
+
+def key_filter(key: str) -> Tuple[str, tuple]:
+    """WHERE clause matching a store key and the keys of its shards"""
+    return "(store=? OR store LIKE ?)", (key, key + ":%")
+
+
+def scope(store, path: str):
+    """Store that holds the objects of `path` (its shard when sharded)"""
+    return store.shard_for(path) if hasattr(store, "shard_for") else store
+
+
+def connect():
+    conn = sqlite3.connect(DEDUP_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS chunk_clusters (
+            store TEXT NOT NULL,
+            uid TEXT NOT NULL,
+            fingerprint INTEGER NOT NULL,
+            owner TEXT NOT NULL,
+            {", ".join(f"band{i} INTEGER NOT NULL" for i in range(SIMHASH_BANDS))},
+            PRIMARY KEY (store, uid)
+        )
+    """)
+    for i in range(SIMHASH_BANDS):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS chunk_clusters_band{i} ON chunk_clusters(store, band{i})")
+    conn.execute("CREATE INDEX IF NOT EXISTS chunk_clusters_owner ON chunk_clusters(store, owner)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_refs (
+            store TEXT NOT NULL,
+            uid TEXT NOT NULL,
+            path TEXT NOT NULL,
+            PRIMARY KEY (store, uid, path)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS chunk_refs_path ON chunk_refs(store, path)")
+    return conn
+
+
+def find_duplicate(cur, key: str, fingerprint: int) -> Optional[str]:
+    """uid of a stored chunk within SIMHASH_MAX_DISTANCE bits, if any"""
+    fp_bands = bands(fingerprint)
+    where = " OR ".join(f"band{i}=?" for i in range(SIMHASH_BANDS))
+    best = None
+    for uid, other in cur.execute(
+        f"SELECT uid, fingerprint FROM chunk_clusters WHERE store=? AND ({where})", [key] + fp_bands
+    ):
+        distance = hamming(fingerprint, other)
+        if distance <= SIMHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+            best = (distance, uid)
+    return best[1] if best else None
+
+
+def refs_of(cur, key: str, uid: str) -> List[str]:
+    return [row[0] for row in cur.execute(
+        "SELECT path FROM chunk_refs WHERE store=? AND uid=? ORDER BY path", (key, uid)
+    )]
+
+
+def owner_properties(owner: str) -> dict:
+    """Properties of a shared chunk handed to a new owner (refs are not stored on the object)"""
+    return {"path": owner, "file": os.path.basename(owner), "paths": []}
+
+
+# -------- READS --------
+
+def read_connection() -> Optional[sqlite3.Connection]:
+    """Connection for lookups, or None before anything was deduplicated"""
+    if not os.path.exists(DEDUP_DB):
+        return None
+    return sqlite3.connect(DEDUP_DB, timeout=30)
+
+
+def load_refs(store, uids: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    """uid -> files containing it, for `uids` (default: every chunk of the store and its shards)"""
+    conn = read_connection()
+    if conn is None:
+        return {}
+    where, args = key_filter(store_key(store))
+    refs: Dict[str, List[str]] = {}
+    try:
+        if uids is None:
+            batches = [(f"SELECT uid, path FROM chunk_refs WHERE {where}", args)]
+        else:
+            batches = [
+                (f"SELECT uid, path FROM chunk_refs WHERE {where} AND uid IN ({','.join('?' * len(part))})",
+                 args + tuple(part))
+                for part in (uids[i:i + 500] for i in range(0, len(uids), 500))
+            ]
+        for sql, params in batches:
+            for uid, path in conn.execute(sql, params):
+                refs.setdefault(uid, []).append(path)
+    finally:
+        conn.close()
+    return refs
+
+
+def attach_refs(objects, refs: Dict[str, List[str]]):
+    """Set `paths` (owner first) on hits of shared chunks, in memory"""
+    for obj in objects:
+        paths = refs.get(str(obj.uuid)) if obj.uuid is not None else None
+        if paths:
+            owner = obj.properties.get("path", "")
+            obj.properties["paths"] = [owner] + sorted(p for p in paths if p != owner)
+    return objects
+
+
+def with_refs(store, objects):
+    """Query hits with the refs of their shared chunks attached (one lookup)"""
+    uids = [str(obj.uuid) for obj in objects if obj.uuid is not None]
+    if not uids:
+        return objects
+    return attach_refs(objects, load_refs(store, uids))
+
+
+def owners_of(store, paths: List[str]) -> Set[str]:
+    """Owners of chunks shared into `paths` (a path filter on the store only sees owners)"""
+    conn = read_connection()
+    if conn is None or not paths:
+        return set()
+    where, args = key_filter(store_key(store))
+    where = where.replace("store", "r.store")
+    owners = set()
+    try:
+        for i in range(0, len(paths), 500):
+            part = paths[i:i + 500]
+            owners.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT c.owner FROM chunk_refs r "
+                f"JOIN chunk_clusters c ON c.store = r.store AND c.uid = r.uid "
+                f"WHERE {where} AND r.path IN ({','.join('?' * len(part))}) AND c.owner != r.path",
+                args + tuple(part)
+            ))
+    finally:
+        conn.close()
+    return owners
+
+
+# -------- INDEXING --------
+
+def release_path(store, path: str):
+    """
+    Detach `path` from the chunks it shares before its own objects are
+    deleted. Chunks it owns that other files still contain are handed to
+    one of them (vector kept, no re-embedding); refs it holds on other
+    files' chunks are removed. Call store.delete_path(path) afterwards.
+    """
+    for scoped in (store.shards_for(path) if hasattr(store, "shards_for") else [store]):
+        release_scoped(scoped, path)
+
+
+def release_scoped(store, path: str):
+    key = store_key(store)
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        touched = [row[0] for row in cur.execute(
+            "SELECT uid FROM chunk_refs WHERE store=? AND path=?", (key, path)
+        ).fetchall()]
+        cur.execute("DELETE FROM chunk_refs WHERE store=? AND path=?", (key, path))
+
+        for uid in touched:
+            owner = cur.execute(
+                "SELECT owner FROM chunk_clusters WHERE store=? AND uid=?", (key, uid)
+            ).fetchone()
+            if owner is None:
+                continue
+            if owner[0] != path:
+                continue  # Only the ref goes; the object is untouched
+            remaining = refs_of(cur, key, uid)
+            if not remaining:
+                # Only this file had it: the object goes with store.delete_path(path)
+                cur.execute("DELETE FROM chunk_clusters WHERE store=? AND uid=?", (key, uid))
+                continue
+            # Hand the object over so store.delete_path(path) keeps it
+            new_owner = remaining[0]
+            cur.execute(
+                "UPDATE chunk_clusters SET owner=? WHERE store=? AND uid=?", (new_owner, key, uid)
+            )
+            store.update_chunk(uid, owner_properties(new_owner))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def dedup_chunks(store, path: str, chunks: List[str]) -> Tuple[List[int], List[str]]:
+    """
+    Register one file's chunks. Returns (indices of chunks to insert,
+    their new uids); near-duplicates of stored chunks only gain a ref to
+    `path` in chunk_refs (the stored object is not rewritten).
+    release_path(path) must have run first.
+    """
+    store = scope(store, path)
+    key = store_key(store)
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        keep, uids = [], []
+        for i, chunk in enumerate(chunks):
+            fingerprint = simhash(chunk)
+            uid = find_duplicate(cur, key, fingerprint)
+            if uid is None:
+                uid = str(uuid.uuid4())
+                cur.execute(
+                    f"INSERT INTO chunk_clusters VALUES (?, ?, ?, ?, {', '.join('?' * SIMHASH_BANDS)})",
+                    [key, uid, fingerprint, path] + bands(fingerprint)
+                )
+                keep.append(i)
+                uids.append(uid)
+            cur.execute("INSERT OR IGNORE INTO chunk_refs VALUES (?, ?, ?)", (key, uid, path))
+        conn.commit()
+        return keep, uids
+    finally:
+        conn.close()
+
+
+def copy_clusters(source, target):
+    """Duplicate cluster state for a migrated store (uids are preserved)"""
+    restore_clusters(target, *dump_clusters(store_key(source)))
+
+
+def dump_clusters(key: str) -> Tuple[list, list]:
+    """(clusters, refs) rows of one store and its shards, without store keys (snapshots)"""
+    where, args = key_filter(key)
+    conn = connect()
+    try:
+        clusters = conn.execute(
+            f"SELECT uid, fingerprint, owner FROM chunk_clusters WHERE {where}", args
+        ).fetchall()
+        refs = conn.execute(f"SELECT uid, path FROM chunk_refs WHERE {where}", args).fetchall()
+    finally:
+        conn.close()
+    return clusters, refs
+
+
+def restore_clusters(store, clusters: list, refs: list):
+    """Replace the cluster state of a store with dumped rows (re-scoped to its shards)"""
+    forget(store_key(store))
+    keys = {}
+    for uid, _, owner in clusters:
+        keys[uid] = store_key(scope(store, owner))
+    conn = connect()
+    try:
+        conn.executemany(
+            f"INSERT INTO chunk_clusters VALUES (?, ?, ?, ?, {', '.join('?' * SIMHASH_BANDS)})",
+            [[keys[uid], uid, fingerprint, owner] + bands(fingerprint) for uid, fingerprint, owner in clusters]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO chunk_refs VALUES (?, ?, ?)",
+            [(keys[uid], uid, path) for uid, path in refs if uid in keys]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def forget(key: str):
+    """Drop cluster state of a dropped store (and of its shards)"""
+    where, args = key_filter(key)
+    conn = connect()
+    try:
+        conn.execute(f"DELETE FROM chunk_clusters WHERE {where}", args)
+        conn.execute(f"DELETE FROM chunk_refs WHERE {where}", args)
+        conn.commit()
+    finally:
+        conn.close()
@@ -1,24 +1,19 @@
 import os
 import time
-import sqlite3
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+import index_db
+
 # ---------------- CONFIG ----------------
 
-INDEX_DB = "index_state.db"
 ALLOWED_EXT = (".txt", ".pdf", ".docx", ".ppt", ".pptx")
 
 # --------------------------------------
 
 
 def load_user_roots():
-    conn = sqlite3.connect(INDEX_DB, timeout=30)
-    cur = conn.cursor()
-    cur.execute("SELECT path FROM user_roots")
-    roots = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return roots
+    return index_db.user_roots()
 
 
 def is_allowed_file(path: str) -> bool:
@@ -0,0 +1,234 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# ---------------- CONFIG ----------------
+
+INDEX_DB = "index_state.db"
+POOL_SIZE = 8                  # Idle connections kept per database file
+BUSY_TIMEOUT_SECONDS = 30      # Wait this long for another writer before "database is locked"
+CACHE_SIZE_KB = 8192           # Page cache per connection
+MMAP_SIZE = 64 * 1024 * 1024   # Bytes of the file read through mmap
+WRITE_BATCH_ROWS = 200         # Batched writes: commit after this many statements...
+WRITE_BATCH_SECONDS = 1.0      # ...or this many seconds, whichever comes first
+ROOTS_CHECK_SECONDS = 1.0      # How often the cached roots list checks for changes by other processes
+
+# --------------------------------------
+
+# Access layer for index_state.db (roots, indexed files, schema state, run
+# history). Connections are opened in WAL mode, so readers never wait for
+# the indexer's write transaction, and pooled per file. The user_roots list
+# is cached in memory and invalidated through roots_version, a counter that
+# triggers bump on every change (also by other processes).
+
+_pools: Dict[str, "ConnectionPool"] = {}
+_pools_lock = threading.Lock()
+
+
+def connect(path: str = INDEX_DB) -> sqlite3.Connection:
+    """New connection with the WAL pragmas (callers close it; prefer connection()/transaction())"""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe with WAL
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """Idle connections of one database file, handed to one thread at a time"""
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.path)
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()  # Uncommitted work never leaks into the next borrower
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def pool(path: str = INDEX_DB) -> ConnectionPool:
+    """Pool of a database file (keyed by absolute path: relative paths follow the working directory)"""
+    key = os.path.abspath(path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(key)
+        return _pools[key]
+
+
+@contextmanager
+def connection(path: str = INDEX_DB):
+    """Borrow a pooled connection for reads (uncommitted writes are rolled back)"""
+    p = pool(path)
+    conn = p.acquire()
+    try:
+        yield conn
+    finally:
+        p.release(conn)
+
+
+@contextmanager
+def transaction(path: str = INDEX_DB):
+    """Borrow a pooled connection; commit on success, roll back on error"""
+    with connection(path) as conn:
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for p in pools:
+        p.close()
+
+
+class BatchedWrites:
+    """
+    Commits a long-lived connection every WRITE_BATCH_ROWS statements or
+    WRITE_BATCH_SECONDS, so a long run never holds the write lock for
+    more than a moment and other writers (the API) get in between.
+    The limits are only checked on the next statement: call flush()
+    before slow work so no write transaction stays open across it.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, rows: int = WRITE_BATCH_ROWS, seconds: float = WRITE_BATCH_SECONDS):
+        self.conn = conn
+        self.rows = rows
+        self.seconds = seconds
+        self.pending = 0
+        self._since = time.monotonic()
+
+    def execute(self, sql: str, params=()):
+        self.conn.execute(sql, params)
+        self.pending += 1
+        if self.pending >= self.rows or time.monotonic() - self._since >= self.seconds:
+            self.commit()
+
+    def executemany(self, sql: str, rows):
+        cur = self.conn.executemany(sql, rows)
+        self.pending += max(cur.rowcount, 1)
+        if self.pending >= self.rows or time.monotonic() - self._since >= self.seconds:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+        self._since = time.monotonic()
+
+    def flush(self):
+        """Commit pending statements, if any"""
+        if self.pending:
+            self.commit()
+
+
+# -------- USER ROOTS --------
+
+def create_roots_version(cur):
+    """roots_version counter in db_meta, bumped by triggers on every user_roots change"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('roots_version', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS user_roots_{event.lower()} AFTER {event} ON user_roots
+            BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'roots_version';
+            END
+        """)
+
+
+_roots_cache: Dict[str, tuple] = {}  # abs path -> (version, roots, checked at)
+_roots_lock = threading.Lock()
+
+
+def roots_version(conn) -> Optional[int]:
+    try:
+        row = conn.execute("SELECT value FROM db_meta WHERE key='roots_version'").fetchone()
+    except sqlite3.OperationalError:
+        return None  # Created by init_db
+    return row[0] if row else None
+
+
+def user_roots(path: str = INDEX_DB) -> List[str]:
+    """
+    Configured roots, served from memory. The cache is re-validated
+    against roots_version at most every ROOTS_CHECK_SECONDS (changes made
+    by other processes) and dropped at once by this process's writes.
+    """
+    key = os.path.abspath(path)
+    now = time.monotonic()
+    with _roots_lock:
+        cached = _roots_cache.get(key)
+    if cached is not None and now - cached[2] < ROOTS_CHECK_SECONDS:
+        return list(cached[1])
+
+    with connection(path) as conn:
+        version = roots_version(conn)
+        if cached is not None and version is not None and version == cached[0]:
+            roots = cached[1]
+        else:
+            try:
+                roots = [row[0] for row in conn.execute("SELECT path FROM user_roots")]
+            except sqlite3.OperationalError:
+                roots = []  # Table not created yet
+    if version is not None:
+        with _roots_lock:
+            _roots_cache[key] = (version, roots, now)
+    return list(roots)
+
+
+def invalidate_roots(path: str = INDEX_DB):
+    with _roots_lock:
+        _roots_cache.pop(os.path.abspath(path), None)
+
+
+def add_user_root(root: str, path: str = INDEX_DB) -> bool:
+    """Insert a root; False if it was already there"""
+    try:
+        with transaction(path) as conn:
+            added = conn.execute("INSERT OR IGNORE INTO user_roots (path) VALUES (?)", (root,)).rowcount > 0
+    finally:
+        invalidate_roots(path)
+    return added
+
+
+def remove_user_root(root: str, path: str = INDEX_DB) -> bool:
+    """Delete a root; False if it was not configured"""
+    try:
+        with transaction(path) as conn:
+            removed = conn.execute("DELETE FROM user_roots WHERE path = ?", (root,)).rowcount > 0
+    finally:
+        invalidate_roots(path)
+    return removed
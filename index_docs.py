@@ -1,29 +1,28 @@
 import os
 import glob
 import time
-import sqlite3
 import io
-from typing import List
+import atexit
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 
 # Set offline mode for HuggingFace before importing transformers
 os.environ["HF_HUB_OFFLINE"] = "1"
 
-from sentence_transformers import SentenceTransformer
-import weaviate
-from weaviate.collections.classes.config import Property, DataType, Configure
-from weaviate.collections.classes.filters import Filter
+# Extraction libraries (fitz, docx, pptx, pytesseract, PIL) are imported by
+# the readers that use them, so importing this module (the backend does at
+# startup) stays cheap.
 
-import fitz  # PyMuPDF
-from docx import Document
-from pptx import Presentation
-
-import pytesseract
-from PIL import Image
+from search import split_sentence_spans, encode_sentence_vectors, MAX_SNIPPET_SENTENCES
+from search import get_model, EMBED_MODEL
+from vector_store import open_store, load_schema_state, save_schema_state, hit_refs, VECTOR_BACKEND
+import text_cache
+import chunk_dedup
+import index_telemetry
+import index_db
 
 # ---------------- CONFIG ----------------
 
-CLASS_NAME = "Documents"
-INDEX_DB = "index_state.db"
 
 ALLOWED_EXT = (".txt", ".pdf", ".docx", ".ppt", ".pptx")
 
@@ -36,6 +35,8 @@ indexing_progress = {
     "current_file": "",
     "phase": "idle"  # idle, scanning, indexing, complete
 }
+current_run = None  # index_telemetry.RunTelemetry of the latest run (throughput, ETA, slowest files)
+indexed_files_count = None  # Rows in indexed_files, kept up to date by main()/remove_root() (None = unknown)
 
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
@@ -46,6 +47,31 @@ ENABLE_OCR = True
 OCR_WORD_THRESHOLD = 50  # OCR triggers if extracted text has fewer than this many words
 OCR_MAX_PAGES = 5        # Maximum pages to OCR per PDF
 
+# Extracted-Text Cache (text_cache.py)
+ENABLE_TEXT_CACHE = True  # Reuse extracted text of unchanged content (keyed by SHA-256)
+EXTRACTOR_VERSION = 1     # Bump when readers change so cached text is re-extracted
+
+# Snippet Precomputation
+ENABLE_SENTENCE_VECTORS = True  # Store sentence offsets/vectors so search snippets skip model inference
+
+# File Summary Vectors
+ENABLE_FILE_VECTORS = True  # Maintain a centroid vector per file (vector_store.FILE_CLASS_NAME)
+
+# Near-Duplicate Chunks (chunk_dedup.py)
+ENABLE_CHUNK_DEDUP = False  # Store one object per near-duplicate chunk (SimHash), shared by every file containing it
+
+# Shadow Rebuild (EMBED_MODEL / CHUNK_SIZE / CHUNK_OVERLAP changes, see rebuild_index)
+REBUILD_DUTY_CYCLE = 0.5        # Share of wall time the rebuild may spend working (rest is left to search)
+REBUILD_RETIRE_SECONDS = 60     # Old generation is dropped this long after the flip (in-flight searches)
+
+rebuild_progress = {
+    "phase": "idle",  # idle, rebuilding, flipping, complete, failed
+    "from_version": 0,
+    "to_version": 0,
+    "total_files": 0,
+    "processed_files": 0,
+}
+
 # ----------------------------------------
 
 
@@ -63,16 +89,20 @@ def read_pdf(path: str) -> str:
     """
     Text-first PDF extraction with conditional OCR fallback.
     """
+    import fitz  # PyMuPDF
+
     try:
         doc = fitz.open(path)
     except:
         return ""
 
     texts = []
+    index_telemetry.set_page_count(len(doc))
 
     # ---- PASS 1: TEXT EXTRACTION ----
     for page in doc:
         text = page.get_text().strip()
+        index_telemetry.count("pages")
         if text:
             texts.append(text)
 
@@ -89,29 +119,34 @@ def read_pdf(path: str) -> str:
         return full_text
 
     print(f"[OCR] Triggered for {os.path.basename(path)} (only {word_count} words extracted)")
-    ocr_texts = []
-
-    for page_num, page in enumerate(doc):
-        # Stop after max pages limit
-        if page_num >= OCR_MAX_PAGES:
-            break
+    import pytesseract
+    from PIL import Image
 
-        try:
-            pix = page.get_pixmap(dpi=300)
-            # Use a more reliable temp file approach
-            img_bytes = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_bytes))
-            ocr_text = pytesseract.image_to_string(img)
-            if ocr_text.strip():
-                ocr_texts.append(ocr_text)
-        except Exception as e:
-            print(f"[WARN] OCR failed for page {page_num + 1}: {e}")
-            continue
+    ocr_texts = []
 
-        # Early termination: stop if we've extracted enough text
-        current_ocr_text = "\n".join(ocr_texts)
-        if len(current_ocr_text.split()) >= OCR_WORD_THRESHOLD:
-            break
+    with index_telemetry.stage("ocr"):
+        for page_num, page in enumerate(doc):
+            # Stop after max pages limit
+            if page_num >= OCR_MAX_PAGES:
+                break
+
+            try:
+                pix = page.get_pixmap(dpi=300)
+                # Use a more reliable temp file approach
+                img_bytes = pix.tobytes("png")
+                img = Image.open(io.BytesIO(img_bytes))
+                ocr_text = pytesseract.image_to_string(img)
+                index_telemetry.count("ocr_pages")
+                if ocr_text.strip():
+                    ocr_texts.append(ocr_text)
+            except Exception as e:
+                print(f"[WARN] OCR failed for page {page_num + 1}: {e}")
+                continue
+
+            # Early termination: stop if we've extracted enough text
+            current_ocr_text = "\n".join(ocr_texts)
+            if len(current_ocr_text.split()) >= OCR_WORD_THRESHOLD:
+                break
 
     ocr_result = "\n".join(ocr_texts)
     
@@ -125,6 +160,8 @@ def read_pdf(path: str) -> str:
 
 
 def read_docx(path: str) -> str:
+    from docx import Document
+
     try:
         doc = Document(path)
         return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
@@ -133,11 +170,15 @@ def read_docx(path: str) -> str:
 
 
 def read_pptx(path: str) -> str:
+    from pptx import Presentation
+
     try:
         prs = Presentation(path)
         texts = []
 
+        index_telemetry.set_page_count(len(prs.slides))
         for slide in prs.slides:
+            index_telemetry.count("pages")
             for shape in slide.shapes:
                 if shape.has_text_frame:
                     for p in shape.text_frame.paragraphs:
@@ -162,27 +203,75 @@ def extract_text(path: str) -> str:
     return ""
 
 
+def extractor_key() -> str:
+    """Identifies extraction code + settings; part of the text cache key"""
+    return f"v{EXTRACTOR_VERSION}:ocr={int(ENABLE_OCR)},{OCR_WORD_THRESHOLD},{OCR_MAX_PAGES}"
+
+
+def load_text(path: str, content_hash: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    extract_text() through the text cache: (text, content_hash).
+    With a known content_hash a cache hit never opens the file.
+    """
+    if not ENABLE_TEXT_CACHE:
+        return extract_text(path), None
+    if content_hash is not None:
+        text = text_cache.get_text(content_hash, extractor_key())
+        if text is not None:
+            return text, content_hash
+        # Miss: the file may have changed since the hash was recorded, hash it again
+    return text_cache.get_or_extract(path, extractor_key(), extract_text)
+
+
 # -------- CHUNKING --------
 
-def chunk_text(text: str) -> List[str]:
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
     text = " ".join(text.split())
     chunks = []
     start = 0
 
     while start < len(text):
-        end = start + CHUNK_SIZE
+        end = start + chunk_size
         chunk = text[start:end].strip()
         if len(chunk) >= MIN_CHUNK_LEN:
             chunks.append(chunk)
-        start = end - CHUNK_OVERLAP
+        start = end - chunk_overlap
 
     return chunks
 
 
+def build_sentence_properties(model, chunks: List[str]) -> List[dict]:
+    """
+    Precompute sentence boundaries and sentence embeddings for each chunk.
+    All sentences of the file are encoded in one batch. Vectors are only
+    stored for chunks long enough to need sentence selection at query time.
+    """
+    spans_per_chunk = [split_sentence_spans(chunk) for chunk in chunks]
+
+    sentences = []
+    for chunk, spans in zip(chunks, spans_per_chunk):
+        if len(spans) > MAX_SNIPPET_SENTENCES:
+            sentences.extend(chunk[start:end] for start, end in spans)
+
+    vectors = model.encode(sentences, normalize_embeddings=True) if sentences else []
+
+    props = []
+    pos = 0
+    for spans in spans_per_chunk:
+        chunk_props = {"sentence_offsets": [offset for span in spans for offset in span]}
+        if len(spans) > MAX_SNIPPET_SENTENCES:
+            chunk_props["sentence_vectors"] = encode_sentence_vectors(vectors[pos:pos + len(spans)])
+            pos += len(spans)
+        props.append(chunk_props)
+
+    return props
+
+
 # -------- SQLITE --------
 
 def init_db():
-    conn = sqlite3.connect(INDEX_DB, timeout=30)
+    """Create the index_state.db tables; returns a dedicated connection (caller closes)"""
+    conn = index_db.connect()
     cur = conn.cursor()
 
     cur.execute("""
@@ -199,6 +288,14 @@ def init_db():
             path TEXT PRIMARY KEY
         )
     """)
+    index_db.create_roots_version(cur)
+
+    # Content hash of the indexed version (text cache key), added later
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(indexed_files)")}
+    if "content_hash" not in columns:
+        cur.execute("ALTER TABLE indexed_files ADD COLUMN content_hash TEXT")
+
+    index_telemetry.create_table(cur)
 
     conn.commit()
     return conn
@@ -209,144 +306,500 @@ def load_user_roots(cur):
     return [row[0] for row in cur.fetchall()]
 
 
-# -------- MAIN INDEXER --------
+# -------- INDEX GENERATIONS --------
 
-def main():
-    print("[INIT] Loading embedding model...")
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    print("[DONE] Model loaded")
-
-    print("[INIT] Connecting to Weaviate...")
-    client = weaviate.connect_to_local()
-    print("[DONE] Connected")
-
-    print("[INIT] Ensuring schema...")
-    if CLASS_NAME not in client.collections.list_all():
-        client.collections.create(
-            name=CLASS_NAME,
-            properties=[
-                Property(name="file", data_type=DataType.TEXT),
-                Property(name="path", data_type=DataType.TEXT),
-                Property(name="chunk", data_type=DataType.TEXT),
-            ],
-            vectorizer_config=Configure.Vectorizer.none(),
-        )
-        print("[DONE] Schema created")
-    else:
-        print("[INFO] Schema already exists")
+def current_index_params() -> dict:
+    """Parameters that change stored vectors; a change needs a rebuild"""
+    return {
+        "embed_model": EMBED_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
 
-    collection = client.collections.get(CLASS_NAME)
 
-    conn = init_db()
-    cur = conn.cursor()
+def live_index_params() -> dict:
+    """
+    Parameters the live generation was built with. Indexes from before
+    they were recorded are assumed to match the current configuration.
+    """
+    params = load_schema_state()["index_params"]
+    if params is None:
+        params = current_index_params()
+        save_schema_state(VECTOR_BACKEND, index_params=params)
+    return params
 
-    roots = load_user_roots(cur)
-    if not roots:
-        print("[WARN] No user roots configured. Indexer exiting.")
-        reset_progress()  # Reset on exit
-        conn.close()
-        client.close()
-        return
 
-    print(f"[INFO] Using {len(roots)} user-defined roots")
-    
-    # Mark as scanning phase
-    indexing_progress["phase"] = "scanning"
-    indexing_progress["current_file"] = "Scanning files..."
-
-    all_files = set()
-    for root in roots:
-        if not os.path.exists(root):
-            continue
-        for ext in ALLOWED_EXT:
-            pattern = os.path.join(root, "**", f"*{ext}")
-            for f in glob.glob(pattern, recursive=True):
-                all_files.add(os.path.abspath(f))
-
-    print(f"[INFO] Found {len(all_files)} files")
-
-    cur.execute("SELECT path, mtime, size FROM indexed_files")
-    known = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
-
-    to_index = []
-    for path in all_files:
-        try:
-            stat = os.stat(path)
-        except:
-            continue
+def rebuild_needed() -> bool:
+    return live_index_params() != current_index_params()
 
-        if path not in known:
-            to_index.append(path)
-        else:
-            old_mtime, old_size = known[path]
-            if stat.st_mtime != old_mtime or stat.st_size != old_size:
-                to_index.append(path)
 
-    deleted = set(known.keys()) - all_files
+def remove_path(store, path: str):
+    """Remove one file from the store, handing its shared chunks to other files"""
+    chunk_dedup.release_path(store, path)
+    store.delete_path(path)
 
-    print(f"[INFO] New/changed files: {len(to_index)}")
-    print(f"[INFO] Deleted files: {len(deleted)}")
 
-    # Update progress tracking
-    indexing_progress["total_files"] = len(to_index)
-    indexing_progress["processed_files"] = 0
-    indexing_progress["phase"] = "indexing"
+def remove_root(root: str) -> bool:
+    """
+    Drop the shard of a removed root in one step, together with its
+    indexed_files rows so the next run does not delete its files one by
+    one. Returns False when the store is not sharded by root.
+    """
+    global indexed_files_count
+    store = open_store()
+    try:
+        if not hasattr(store, "drop_root"):
+            return False
+        root = os.path.normpath(root)
+
+        with index_db.transaction() as conn:
+            known = [row[0] for row in conn.execute("SELECT path FROM indexed_files")]
+            removed = [(path,) for path in known if store.root_for(path) == root]
+            conn.executemany("DELETE FROM indexed_files WHERE path=?", removed)
+
+            dropped = store.drop_root(root)
+            if dropped is not None:
+                chunk_dedup.forget(chunk_dedup.store_key(dropped))
+        if indexed_files_count is not None:
+            indexed_files_count -= len(removed)
+        print(f"[INFO] Removed root {root}: {len(removed)} files")
+        return True
+    finally:
+        store.close()
+
+
+def rollback_dedup(store, path: str):
+    """
+    Undo dedup_chunks() after a failed insert: its new clusters would
+    otherwise point at objects that were never stored, and later
+    near-duplicates would be skipped against them. Releasing the file drops
+    those clusters and its refs on other files' chunks; the file's partial
+    objects are deleted.
+    """
+    try:
+        remove_path(store, path)
+    except Exception as e:
+        print(f"[WARN] Could not roll back chunk dedup state of {os.path.basename(path)}: {e}")
 
-    for path in deleted:
-        collection.data.delete_many(
-            where=Filter.by_property("path").equal(path)
-        )
-        cur.execute("DELETE FROM indexed_files WHERE path=?", (path,))
 
-    for idx, path in enumerate(to_index, start=1):
-        # Update progress (1-indexed)
-        indexing_progress["current_file"] = os.path.basename(path)
-        indexing_progress["processed_files"] = idx
-        
-        print(f"[INDEX] Processing: {os.path.basename(path)} ({idx}/{len(to_index)})")
-        text = extract_text(path)
-        if not text.strip():
-            print(f"[WARN] No text extracted from {os.path.basename(path)}")
-            continue
-
-        chunks = chunk_text(text)
-        if not chunks:
-            print(f"[WARN] No chunks created from {os.path.basename(path)}")
-            continue
-
-        print(f"[INDEX] Created {len(chunks)} chunks ({len(text.split())} words)")
+def index_chunks(store, model, path: str, chunks: List[str]):
+    """
+    Embed one file's chunks and replace its objects in the store.
+    Everything is encoded before the old objects are removed, so a
+    modified file stays searchable while it is re-embedded.
+    With ENABLE_CHUNK_DEDUP, chunks that near-duplicate a stored chunk are
+    not inserted again; the stored object gains a ref to this file instead.
+    """
+    with index_telemetry.stage("embed"):
         vectors = model.encode(chunks)
+        if ENABLE_SENTENCE_VECTORS:
+            sentence_props = build_sentence_properties(model, chunks)
+        else:
+            sentence_props = [{} for _ in chunks]
+    index_telemetry.count("chunks", len(chunks))
 
-        collection.data.delete_many(
-            where=Filter.by_property("path").equal(path)
-        )
+    with index_telemetry.stage("write"):
+        remove_path(store, path)
+
+    with index_telemetry.stage("dedup"):
+        if ENABLE_CHUNK_DEDUP:
+            keep, uids = chunk_dedup.dedup_chunks(store, path, chunks)
+            if len(keep) < len(chunks):
+                print(f"[INDEX] {len(chunks) - len(keep)} near-duplicate chunks shared with stored chunks")
+        else:
+            keep, uids = list(range(len(chunks))), None
 
-        for chunk, vec in zip(chunks, vectors):
-            collection.data.insert(
-                properties={
-                    "file": os.path.basename(path),
-                    "path": path,
-                    "chunk": chunk,
-                },
-                vector=vec.tolist(),
+    try:
+        with index_telemetry.stage("write"):
+            store.insert_chunks(
+                [
+                    {
+                        "file": os.path.basename(path),
+                        "path": path,
+                        "chunk": chunks[i],
+                        **sentence_props[i],
+                    }
+                    for i in keep
+                ],
+                [vectors[i] for i in keep],
+                uids,
             )
 
-        stat = os.stat(path)
-        cur.execute(
-            "REPLACE INTO indexed_files VALUES (?, ?, ?, ?)",
-            (path, stat.st_mtime, stat.st_size, time.time())
-        )
+            # File vectors use every chunk, shared ones included
+            if ENABLE_FILE_VECTORS:
+                store.upsert_file_vector(path, vectors, len(chunks))
+    except BaseException:
+        if ENABLE_CHUNK_DEDUP:
+            rollback_dedup(store, path)
+        raise
+    index_telemetry.count("objects_written", len(keep) + int(ENABLE_FILE_VECTORS))
 
-    conn.commit()
-    conn.close()
-    client.close()
 
-    # Update progress to complete
-    indexing_progress["processed_files"] = indexing_progress["total_files"]
-    indexing_progress["current_file"] = ""
-    indexing_progress["phase"] = "complete"
+# -------- MAIN INDEXER --------
 
-    print("[DONE] Indexing complete")
+def main():
+    global current_run, indexed_files_count
+
+    # Incremental runs keep writing the live generation with its own
+    # parameters; changed parameters are applied by rebuild_index()
+    params = live_index_params()
+    run = current_run = index_telemetry.RunTelemetry()
+    index_telemetry.activate(run)
+    conn = store = None
+    try:
+        print("[INIT] Loading embedding model...")
+        model = get_model(params["embed_model"])
+        print("[DONE] Model loaded")
+
+        print(f"[INIT] Opening vector store ({VECTOR_BACKEND})...")
+        store = open_store()
+        print("[DONE] Connected")
+
+        print("[INIT] Ensuring schema...")
+        store.ensure_schema(file_vectors=ENABLE_FILE_VECTORS)
+
+        conn = init_db()
+        cur = conn.cursor()
+        # Quick indexed_files updates are committed in batches and flushed
+        # before slow work, so the API's writes (roots, schema state) are
+        # never locked out while a file is hashed or indexed
+        writes = index_db.BatchedWrites(conn)
+
+        roots = load_user_roots(cur)
+        if not roots:
+            print("[WARN] No user roots configured. Indexer exiting.")
+            reset_progress()  # Reset on exit
+            return
+
+        print(f"[INFO] Using {len(roots)} user-defined roots")
+    
+        # Mark as scanning phase
+        indexing_progress["phase"] = "scanning"
+        indexing_progress["current_file"] = "Scanning files..."
+
+        all_files = set()
+        for root in roots:
+            if not os.path.exists(root):
+                continue
+            for ext in ALLOWED_EXT:
+                pattern = os.path.join(root, "**", f"*{ext}")
+                for f in glob.glob(pattern, recursive=True):
+                    all_files.add(os.path.abspath(f))
+
+        print(f"[INFO] Found {len(all_files)} files")
+
+        cur.execute("SELECT path, mtime, size, content_hash FROM indexed_files")
+        known = {row[0]: (row[1], row[2], row[3]) for row in cur.fetchall()}
+
+        to_index = []
+        sizes = {}
+        for path in all_files:
+            try:
+                stat = os.stat(path)
+            except:
+                continue
+            sizes[path] = stat.st_size
+
+            if path not in known:
+                to_index.append(path)
+            else:
+                old_mtime, old_size, old_hash = known[path]
+                if stat.st_size == old_size and stat.st_mtime != old_mtime and old_hash:
+                    # Same content under a new mtime (copied/restored files): keep the index
+                    writes.flush()  # Hashing a large file is slow
+                    try:
+                        unchanged = text_cache.file_hash(path) == old_hash
+                    except OSError:
+                        unchanged = False
+                    if unchanged:
+                        writes.execute("UPDATE indexed_files SET mtime=? WHERE path=?", (stat.st_mtime, path))
+                        continue
+                if stat.st_mtime != old_mtime or stat.st_size != old_size:
+                    to_index.append(path)
+
+        deleted = set(known.keys()) - all_files
+
+        print(f"[INFO] New/changed files: {len(to_index)}")
+        print(f"[INFO] Deleted files: {len(deleted)}")
+
+        # Update progress tracking
+        indexing_progress["total_files"] = len(to_index)
+        indexing_progress["processed_files"] = 0
+        indexing_progress["phase"] = "indexing"
+        run.plan({path: sizes[path] for path in to_index})
+        added = 0  # New rows in indexed_files
+
+        for path in deleted:
+            remove_path(store, path)
+            writes.execute("DELETE FROM indexed_files WHERE path=?", (path,))
+        run.count("files_deleted", len(deleted))
+        writes.flush()
+
+        for idx, path in enumerate(to_index, start=1):
+            # Update progress (1-indexed)
+            indexing_progress["current_file"] = os.path.basename(path)
+            indexing_progress["processed_files"] = idx
+        
+            print(f"[INDEX] Processing: {os.path.basename(path)} ({idx}/{len(to_index)})")
+            run.start_file(path, sizes[path])
+            with index_telemetry.stage("extract"):
+                text, content_hash = load_text(path)
+            if not text.strip():
+                print(f"[WARN] No text extracted from {os.path.basename(path)}")
+                run.finish_file(0)
+                continue
+
+            with index_telemetry.stage("chunk"):
+                chunks = chunk_text(text, params["chunk_size"], params["chunk_overlap"])
+            if not chunks:
+                print(f"[WARN] No chunks created from {os.path.basename(path)}")
+                run.finish_file(0)
+                continue
+
+            print(f"[INDEX] Created {len(chunks)} chunks ({len(text.split())} words)")
+            index_chunks(store, model, path, chunks)
+            run.finish_file(len(chunks))
+
+            # Committed right away (cheap with WAL): the next file may take minutes
+            stat = os.stat(path)
+            conn.execute(
+                "REPLACE INTO indexed_files (path, mtime, size, indexed_at, content_hash) VALUES (?, ?, ?, ?, ?)",
+                (path, stat.st_mtime, stat.st_size, time.time(), content_hash)
+            )
+            conn.commit()
+            added += path not in known
+
+        if to_index or deleted:
+            run.save(cur)
+            print_run_summary(run)
+
+        conn.commit()
+        indexed_files_count = len(known) - len(deleted) + added
+        if ENABLE_TEXT_CACHE:
+            text_cache.evict()
+
+        # Update progress to complete
+        indexing_progress["processed_files"] = indexing_progress["total_files"]
+        indexing_progress["current_file"] = ""
+        indexing_progress["phase"] = "complete"
+
+        print("[DONE] Indexing complete")
+    finally:
+        # Also on the early return and on failures: an interrupted file is
+        # closed (nothing indexed), uncommitted row updates are dropped with
+        # the connection and this thread reports to no run
+        if conn is not None:
+            conn.close()
+        if store is not None:
+            store.close()
+        run.finish_file(0)
+        index_telemetry.activate(None)
+
+
+def print_run_summary(run):
+    """Per-stage table of one run, then its slowest files"""
+    counters, throughput = run.counters, run.throughput()
+    work = {
+        "extract": (counters["bytes_read"], "bytes", throughput["bytes_per_sec"]),
+        "ocr": (counters["ocr_pages"], "pages", throughput["ocr_pages_per_sec"]),
+        "embed": (counters["chunks"], "chunks", throughput["chunks_per_sec"]),
+        "write": (counters["objects_written"], "objects", throughput["objects_per_sec"]),
+    }
+    print(f"[SUMMARY] {counters['files']} files indexed, {counters['files_failed']} without text, "
+          f"{counters['files_deleted']} deleted in {run.elapsed():.1f}s")
+    print(f"[SUMMARY] {'stage':<8} {'seconds':>9} {'work':>16} {'per sec':>12}")
+    for stage, seconds in run.stage_seconds.items():
+        amount, unit, rate = work.get(stage, (None, "", None))
+        amount = f"{amount} {unit}" if amount is not None else ""
+        rate = f"{rate:.1f}" if rate is not None else ""
+        print(f"[SUMMARY] {stage:<8} {seconds:>9.2f} {amount:>16} {rate:>12}")
+    for entry in run.slowest()[:3]:
+        print(f"[SUMMARY] slow: {os.path.basename(entry['path'])} {entry['seconds']:.2f}s "
+              f"({entry['chunks']} chunks, {entry['pages']} pages, {entry['ocr_pages']} OCR)")
+
+
+# -------- SHADOW REBUILD --------
+
+_retiring: Dict[threading.Timer, tuple] = {}  # Pending retire_later() calls: timer -> (fn, args)
+_retiring_lock = threading.Lock()
+
+
+def retire_later(seconds: float, fn: Callable, *args):
+    """
+    Run fn(*args) after `seconds` in a daemon timer, so it never holds up
+    the CLI or server shutdown; calls still pending at exit run right
+    away then (no searches are left to read the old generation).
+    """
+    def run():
+        with _retiring_lock:
+            if _retiring.pop(timer, None) is None:
+                return  # Already run at exit
+        fn(*args)
+
+    timer = threading.Timer(seconds, run)
+    timer.daemon = True
+    with _retiring_lock:
+        _retiring[timer] = (fn, args)
+    timer.start()
+
+
+@atexit.register
+def retire_pending():
+    with _retiring_lock:
+        pending = list(_retiring.items())
+        _retiring.clear()
+    for timer, (fn, args) in pending:
+        timer.cancel()
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"[WARN] Could not drop a retired generation at exit: {e}")
+
+
+def throttle(work_seconds: float):
+    """Sleep so rebuild work stays at REBUILD_DUTY_CYCLE of wall time"""
+    if 0 < REBUILD_DUTY_CYCLE < 1:
+        time.sleep(work_seconds * (1 - REBUILD_DUTY_CYCLE) / REBUILD_DUTY_CYCLE)
+
+
+def rebuild_index(flip_lock=None) -> bool:
+    """
+    Rebuild the index into a shadow generation when EMBED_MODEL, CHUNK_SIZE
+    or CHUNK_OVERLAP differ from the live generation, then flip to it.
+
+    Search keeps reading the live generation throughout. If only the model
+    changed, the stored chunk texts are re-embedded; otherwise text comes
+    from the extracted-text cache and is re-chunked. Files are only parsed
+    on a cache miss. Work is throttled to
+    REBUILD_DUTY_CYCLE. Files the incremental indexer touched meanwhile
+    are caught up while holding `flip_lock` (the indexing lock), then the
+    live schema version is switched in one SQLite transaction. The old
+    generation is dropped REBUILD_RETIRE_SECONDS later, in a timer thread.
+    Returns True if a new generation went live.
+    """
+    live = load_schema_state()
+    live_params = live_index_params()
+    params = current_index_params()
+    if live_params == params:
+        return False
+
+    old_version = live["schema_version"]
+    new_version = old_version + 1
+    reuse_chunks = (
+        live_params["chunk_size"] == params["chunk_size"]
+        and live_params["chunk_overlap"] == params["chunk_overlap"]
+    )
+    print(f"[REBUILD] {live_params} → {params}")
+    print(f"[REBUILD] Building generation {new_version} (live: {old_version}, "
+          f"{'re-embedding stored chunks' if reuse_chunks else 're-chunking cached text'})")
+
+    rebuild_progress.update({
+        "phase": "rebuilding",
+        "from_version": old_version,
+        "to_version": new_version,
+        "total_files": 0,
+        "processed_files": 0,
+    })
+
+    source = shadow = None
+    try:
+        source = open_store(version=old_version)
+
+        stale = open_store(version=new_version)
+        stale.drop()  # Leftovers of an interrupted rebuild
+        stale.close()
+        chunk_dedup.forget(chunk_dedup.store_key(stale))
+
+        shadow = open_store(version=new_version)
+        shadow.ensure_schema(file_vectors=ENABLE_FILE_VECTORS)
+        model = get_model(params["embed_model"])
+        started = time.time()
+
+        with index_db.connection() as conn:
+            indexed = dict(conn.execute("SELECT path, content_hash FROM indexed_files").fetchall())
+
+        if reuse_chunks:
+            # Shared (deduplicated) chunks belong to every file in their refs
+            chunks_by_path = {}
+            return_properties = [p for p in ("path", "paths", "chunk") if p in source.property_names()]
+            refs = chunk_dedup.load_refs(source)
+            for obj in source.iterate(return_properties=return_properties):
+                for path in hit_refs(chunk_dedup.attach_refs([obj], refs)[0]):
+                    chunks_by_path.setdefault(path, []).append(obj.properties["chunk"])
+        else:
+            chunks_by_path = None
+
+        def build(path: str, content_hash: Optional[str]) -> bool:
+            if chunks_by_path is not None and path in chunks_by_path:
+                chunks = chunks_by_path[path]
+            else:
+                text, _ = load_text(path, content_hash)
+                chunks = chunk_text(text, params["chunk_size"], params["chunk_overlap"])
+            if not chunks:
+                return False
+            index_chunks(shadow, model, path, chunks)
+            return True
+
+        shadow_paths = set()
+        rebuild_progress["total_files"] = len(indexed)
+        for idx, (path, content_hash) in enumerate(indexed.items(), start=1):
+            work_start = time.time()
+            if build(path, content_hash):
+                shadow_paths.add(path)
+            rebuild_progress["processed_files"] = idx
+            throttle(time.time() - work_start)
+
+        # ---- Catch up with incremental indexing, then flip ----
+        rebuild_progress["phase"] = "flipping"
+        if flip_lock is not None:
+            flip_lock.acquire()
+        try:
+            with index_db.connection() as conn:
+                rows = conn.execute("SELECT path, indexed_at, content_hash FROM indexed_files").fetchall()
+
+            current = {path for path, _, _ in rows}
+            for path in shadow_paths - current:
+                remove_path(shadow, path)
+            changed = [
+                (path, content_hash) for path, indexed_at, content_hash in rows
+                if indexed_at >= started or path not in shadow_paths
+            ]
+            chunks_by_path = None  # Stored chunks may be stale for these
+            for path, content_hash in changed:
+                if not build(path, content_hash):
+                    remove_path(shadow, path)
+            print(f"[REBUILD] Caught up {len(changed)} changed and {len(shadow_paths - current)} deleted files")
+
+            save_schema_state(
+                VECTOR_BACKEND, version=new_version, settings=shadow.applied_settings(), index_params=params
+            )
+        finally:
+            if flip_lock is not None:
+                flip_lock.release()
+
+        shadow.close()
+        shadow = None
+        if ENABLE_TEXT_CACHE:
+            text_cache.evict()
+        rebuild_progress["phase"] = "complete"
+        print(f"[DONE] Generation {new_version} is live ({time.time() - started:.1f}s)")
+
+        def retire():
+            source.drop()
+            source.close()
+            chunk_dedup.forget(chunk_dedup.store_key(source))
+            print(f"[DONE] Dropped generation {old_version}")
+
+        # In-flight searches may still read the old generation; the rebuild
+        # (and rebuild_lock) is done, so the drop runs in a timer thread
+        retire_later(REBUILD_RETIRE_SECONDS, retire)
+        return True
+    except Exception:
+        rebuild_progress["phase"] = "failed"
+        for store in (shadow, source):
+            if store is not None:
+                store.close()
+        raise
 
 
 def reset_progress():
@@ -359,3 +812,5 @@ def reset_progress():
 
 if __name__ == "__main__":
     main()
+    if rebuild_needed():
+        rebuild_index()
@@ -0,0 +1,282 @@
+import os
+import time
+import json
+import heapq
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# ---------------- CONFIG ----------------
+
+SLOWEST_FILES = 10     # Slowest files kept per run
+INDEX_RUNS_KEEP = 500  # Run summaries kept in index_state.db (oldest are pruned)
+ETA_MIN_CHUNKS = 20    # Chunks embedded before an ETA is reported
+
+# --------------------------------------
+
+STAGES = ("extract", "ocr", "chunk", "dedup", "embed", "write")
+
+# The run of the indexing thread; readers and index_chunks() report into
+# it through the module functions below, which are no-ops without one
+# (shadow rebuilds, snapshot imports).
+_active = threading.local()
+
+
+class RunTelemetry:
+    """
+    Throughput and time-per-stage accounting of one indexing run. Stage
+    time is exclusive: OCR inside extraction is charged to "ocr" only.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stage_seconds: Dict[str, float] = {s: 0.0 for s in STAGES}
+        self.counters = {
+            "files": 0,          # Files indexed
+            "files_failed": 0,   # No text or no chunks
+            "files_deleted": 0,
+            "bytes_read": 0,
+            "pages": 0,          # PDF pages and slides extracted
+            "ocr_pages": 0,
+            "chunks": 0,         # Chunks embedded
+            "objects_written": 0,
+        }
+        self._stack: List[str] = []
+        self._mark = 0.0
+        self._pending: Dict[str, tuple] = {}          # path -> (ext, size) still to index
+        self._ratios: Dict[str, List[float]] = {}     # ext -> [chunks, bytes] seen so far
+        self._slowest: List[tuple] = []               # min-heap of (seconds, path, details)
+        self.current: Optional[dict] = None
+        self.run_id: Optional[int] = None  # index_runs row, once saved
+        self._planned = self._t0  # Indexing start (after model load and scan)
+
+    # ---- Recording ----
+
+    def plan(self, sizes: Dict[str, int]):
+        """Files this run will index, with their sizes (for the ETA)"""
+        with self._lock:
+            self._planned = time.perf_counter()
+            self._pending = {p: (os.path.splitext(p)[1].lower(), size) for p, size in sizes.items()}
+
+    def _charge(self, now: float):
+        if self._stack:
+            seconds = now - self._mark
+            self.stage_seconds[self._stack[-1]] += seconds
+            if self.current is not None:
+                stages = self.current["stages"]
+                stages[self._stack[-1]] = stages.get(self._stack[-1], 0.0) + seconds
+        self._mark = now
+
+    @contextmanager
+    def stage(self, name: str):
+        with self._lock:
+            self._charge(time.perf_counter())
+            self._stack.append(name)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._charge(time.perf_counter())
+                self._stack.pop()
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+            if self.current is not None and name in ("pages", "ocr_pages"):
+                self.current[name] += amount
+
+    def start_file(self, path: str, size: int):
+        with self._lock:
+            self.current = {
+                "path": path, "size": size, "started": time.perf_counter(),
+                "pages": 0, "ocr_pages": 0, "page_count": None, "stages": {},
+            }
+            self.counters["bytes_read"] += size
+
+    def set_page_count(self, pages: int):
+        with self._lock:
+            if self.current is not None:
+                self.current["page_count"] = pages
+
+    def finish_file(self, chunks: int):
+        """Close the current file (chunks=0: nothing indexed)"""
+        with self._lock:
+            current, self.current = self.current, None
+            if current is None:
+                return
+            ext, size = self._pending.pop(current["path"], (os.path.splitext(current["path"])[1].lower(), current["size"]))
+            self.counters["files" if chunks else "files_failed"] += 1
+            ratio = self._ratios.setdefault(ext, [0, 0])
+            ratio[0] += chunks
+            ratio[1] += size
+
+            seconds = time.perf_counter() - current["started"]
+            entry = (seconds, current["path"], {
+                "chunks": chunks, "bytes": size, "pages": current["pages"], "ocr_pages": current["ocr_pages"],
+                "stages": {s: round(t, 3) for s, t in current["stages"].items()},
+            })
+            if len(self._slowest) < SLOWEST_FILES:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    # ---- Reporting ----
+
+    def eta_seconds(self) -> Optional[float]:
+        """
+        Remaining chunks of the pending files (the current one included),
+        estimated from their size and the chunks per byte seen for their
+        extension, times the seconds per chunk since indexing started.
+        """
+        with self._lock:
+            done_chunks = sum(c for c, _ in self._ratios.values())
+            if done_chunks < ETA_MIN_CHUNKS:
+                return None
+            total_bytes = sum(b for _, b in self._ratios.values())
+            fallback = done_chunks / total_bytes if total_bytes else 0.0
+            remaining = 0.0
+            for ext, size in self._pending.values():
+                chunks, seen = self._ratios.get(ext, (0, 0))
+                remaining += size * (chunks / seen if seen else fallback)
+            return remaining * (time.perf_counter() - self._planned) / done_chunks
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def throughput(self) -> dict:
+        """Per-stage rates: work done / time spent in the stage doing it"""
+        def rate(amount, seconds):
+            return round(amount / seconds, 2) if seconds > 0 else None
+
+        c, s = self.counters, self.stage_seconds
+        return {
+            "bytes_per_sec": rate(c["bytes_read"], s["extract"]),
+            "pages_per_sec": rate(c["pages"], s["extract"]),
+            "ocr_pages_per_sec": rate(c["ocr_pages"], s["ocr"]),
+            "chunks_per_sec": rate(c["chunks"], s["embed"]),
+            "objects_per_sec": rate(c["objects_written"], s["write"]),
+            "files_per_sec": rate(c["files"] + c["files_failed"], self.elapsed()),
+        }
+
+    def slowest(self) -> List[dict]:
+        with self._lock:
+            entries = sorted(self._slowest, reverse=True)
+        return [{"path": path, "seconds": round(seconds, 3), **details} for seconds, path, details in entries]
+
+    def snapshot(self) -> dict:
+        """Live view for /index/progress"""
+        eta = self.eta_seconds()
+        with self._lock:
+            current = None
+            if self.current is not None:
+                current = {
+                    "file": os.path.basename(self.current["path"]),
+                    "stage": self._stack[-1] if self._stack else None,
+                    "seconds": round(time.perf_counter() - self.current["started"], 1),
+                    "pages": self.current["pages"] + self.current["ocr_pages"],
+                    "page_count": self.current["page_count"],
+                }
+            counters = dict(self.counters)
+            stages = {s: round(t, 3) for s, t in self.stage_seconds.items()}
+        return {
+            "elapsed_seconds": round(self.elapsed(), 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "counters": counters,
+            "stage_seconds": stages,
+            "throughput": self.throughput(),
+            "current": current,
+            "slowest_files": self.slowest(),
+        }
+
+    def save(self, cur):
+        """Append the run summary to index_runs (caller commits)"""
+        cur.execute(
+            """INSERT INTO index_runs (
+                started_at, finished_at, duration, files, files_failed, files_deleted, bytes_read,
+                pages, ocr_pages, chunks, objects_written, stage_seconds, throughput, slowest
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                self.started_at, time.time(), self.elapsed(),
+                self.counters["files"], self.counters["files_failed"], self.counters["files_deleted"],
+                self.counters["bytes_read"], self.counters["pages"], self.counters["ocr_pages"],
+                self.counters["chunks"], self.counters["objects_written"],
+                json.dumps(self.stage_seconds), json.dumps(self.throughput()), json.dumps(self.slowest()),
+            )
+        )
+        self.run_id = cur.lastrowid
+        cur.execute(
+            "DELETE FROM index_runs WHERE id NOT IN (SELECT id FROM index_runs ORDER BY id DESC LIMIT ?)",
+            (INDEX_RUNS_KEEP,)
+        )
+
+
+# -------- ACTIVE RUN --------
+
+def activate(run: Optional[RunTelemetry]):
+    """Make `run` the active run of this thread (None to clear)"""
+    _active.run = run
+
+
+def active() -> Optional[RunTelemetry]:
+    return getattr(_active, "run", None)
+
+
+@contextmanager
+def stage(name: str):
+    run = active()
+    if run is None:
+        yield
+        return
+    with run.stage(name):
+        yield
+
+
+def count(name: str, amount: int = 1):
+    run = active()
+    if run is not None:
+        run.count(name, amount)
+
+
+def set_page_count(pages: int):
+    run = active()
+    if run is not None:
+        run.set_page_count(pages)
+
+
+# -------- RUN HISTORY --------
+
+def create_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS index_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at REAL NOT NULL,
+            finished_at REAL NOT NULL,
+            duration REAL NOT NULL,
+            files INTEGER NOT NULL,
+            files_failed INTEGER NOT NULL,
+            files_deleted INTEGER NOT NULL,
+            bytes_read INTEGER NOT NULL,
+            pages INTEGER NOT NULL,
+            ocr_pages INTEGER NOT NULL,
+            chunks INTEGER NOT NULL,
+            objects_written INTEGER NOT NULL,
+            stage_seconds TEXT NOT NULL,
+            throughput TEXT NOT NULL,
+            slowest TEXT NOT NULL
+        )
+    """)
+
+
+def load_runs(conn, limit: int = 20) -> List[dict]:
+    """Most recent run summaries, newest first"""
+    cur = conn.execute("SELECT * FROM index_runs ORDER BY id DESC LIMIT ?", (limit,))
+    names = [d[0] for d in cur.description]
+    runs = []
+    for row in cur.fetchall():
+        run = dict(zip(names, row))
+        for key in ("stage_seconds", "throughput", "slowest"):
+            run[key] = json.loads(run[key])
+        runs.append(run)
+    return runs
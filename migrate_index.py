@@ -0,0 +1,125 @@
+"""
+Rebuild the vector store with the current vector index settings
+(HNSW_*, VECTOR_COMPRESSION, LOCAL_* in vector_store.py) by copying the
+stored chunks and vectors into a new schema version. Nothing is
+re-embedded. Stop the backend (or restart it afterwards) so it opens the
+new version.
+
+    python migrate_index.py                 # migrate and drop the old version
+    python migrate_index.py --keep-old      # keep the old collection/store
+    python migrate_index.py --backend local
+"""
+import time
+import argparse
+from typing import Optional
+
+from vector_store import (
+    VECTOR_BACKEND, open_store, load_schema_state, save_schema_state, hit_vector
+)
+import chunk_dedup
+
+# ---------------- CONFIG ----------------
+
+MIGRATE_BATCH = 500  # Chunks copied per insert batch
+CHUNK_PROPERTIES = ["file", "path", "chunk", "sentence_offsets", "sentence_vectors", "paths"]
+
+# ----------------------------------------
+
+
+def copy_chunks(source, target, batch_size: int = MIGRATE_BATCH) -> int:
+    """Copy every chunk (properties + vector + uuid) from source to target"""
+    return_properties = [p for p in CHUNK_PROPERTIES if p in source.property_names()]
+
+    copied = 0
+    props_batch, vector_batch, uid_batch = [], [], []
+    for obj in source.iterate(return_properties=return_properties, include_vector=True):
+        vector = hit_vector(obj)
+        if vector is None:
+            continue
+        props_batch.append(dict(obj.properties))
+        vector_batch.append(vector)
+        uid_batch.append(str(obj.uuid) if obj.uuid is not None else None)
+        if len(props_batch) >= batch_size:
+            target.insert_chunks(props_batch, vector_batch, uid_batch)
+            copied += len(props_batch)
+            props_batch, vector_batch, uid_batch = [], [], []
+            print(f"[MIGRATE] Copied {copied} chunks...")
+
+    if props_batch:
+        target.insert_chunks(props_batch, vector_batch, uid_batch)
+        copied += len(props_batch)
+    return copied
+
+
+def copy_file_vectors(source, target) -> int:
+    """Copy file summary vectors (already centroids, stored as-is)"""
+    copied = 0
+    for obj in source.iterate_files():
+        vector = hit_vector(obj)
+        if vector is None:
+            continue
+        target.upsert_file_vector(obj.properties["path"], [vector], obj.properties.get("chunk_count") or 0)
+        copied += 1
+    return copied
+
+
+def migrate(backend: Optional[str] = None, keep_old: bool = False) -> int:
+    """Copy the live schema version into version + 1 and make it live. Returns the new version."""
+    backend = backend or VECTOR_BACKEND
+    version = load_schema_state(backend)["schema_version"]
+    new_version = version + 1
+    start = time.time()
+
+    print(f"[MIGRATE] {backend}: schema version {version} → {new_version}")
+    source = open_store(backend, version)
+
+    # Leftovers of an interrupted migration are not trusted
+    stale = open_store(backend, new_version)
+    stale.drop()
+    stale.close()
+    chunk_dedup.forget(chunk_dedup.store_key(stale))
+
+    target = open_store(backend, new_version)
+    file_vectors = source.has_file_vectors()
+    target.ensure_schema(file_vectors=file_vectors)
+
+    chunks = copy_chunks(source, target)
+    files = copy_file_vectors(source, target) if file_vectors else 0
+    chunk_dedup.copy_clusters(source, target)  # uuids were kept
+
+    expected = source.count()
+    actual = target.count()
+    if actual != expected:
+        target.close()
+        source.close()
+        raise RuntimeError(f"Chunk count mismatch after copy: {actual} != {expected}; version {version} kept")
+
+    save_schema_state(backend, new_version, target.applied_settings())
+    print(f"[DONE] Copied {chunks} chunks and {files} file vectors in {time.time() - start:.1f}s")
+
+    if keep_old:
+        print(f"[INFO] Kept schema version {version}")
+        source.close()
+    else:
+        source.drop()
+        source.close()
+        chunk_dedup.forget(chunk_dedup.store_key(source))
+        print(f"[DONE] Dropped schema version {version}")
+
+    target.close()
+    return new_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector index with the configured settings")
+    parser.add_argument("--backend", choices=["weaviate", "local"], default=None)
+    parser.add_argument("--keep-old", action="store_true", help="Keep the previous schema version")
+    args = parser.parse_args()
+
+    state = load_schema_state(args.backend)
+    print(f"[INFO] Current schema version {state['schema_version']}, settings: {state['settings']}")
+    migrate(args.backend, keep_old=args.keep_old)
+
+
+if __name__ == "__main__":
+    main()
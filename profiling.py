@@ -0,0 +1,292 @@
+import os
+import re
+import sys
+import json
+import time
+import cProfile
+import pstats
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# ---------------- CONFIG ----------------
+
+PROFILE_DIR = "profiles"       # Relative like index_state.db
+PROFILE_KEEP = 20              # Stored profiles (oldest are deleted)
+SAMPLE_INTERVAL = 0.005        # Seconds between stack samples (sampling mode)
+MAX_SEARCH_COUNT = 1000        # Max searches captured by one profile
+
+# --------------------------------------
+
+TARGETS = ("index", "search")
+MODES = ("cprofile", "sampling")  # cprofile: deterministic, saved as pstats; sampling: stack samples, saved as speedscope JSON
+FORMATS = {"cprofile": (".pstats", "application/octet-stream"), "sampling": (".speedscope.json", "application/json")}
+
+# Profiles are opt-in: arm() registers a session for a target and the hooks
+# (capture(), wrap()) profile the next indexing run or the next `count`
+# searches, then store the result under the session id. With nothing
+# armed the hooks are a dict lookup.
+
+_sessions: Dict[str, "Session"] = {}  # target -> armed or running session
+_lock = threading.Lock()
+_cprofile_lock = threading.Lock()      # One cProfile capture at a time (profilers are per-process on newer Pythons)
+_ID_PATTERN = re.compile(r"^(index|search)-\d{8}-\d{6}-[0-9a-f]{4}$")
+
+
+class Sampler:
+    """Samples the stacks of registered threads from a background thread"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Dict[Tuple[tuple, ...], int] = {}
+        self.threads = set()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sage-profile-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    key = tuple(reversed(stack))
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+                    self.samples += 1
+
+    def speedscope(self, name: str) -> dict:
+        """Samples in the speedscope file format (weights in seconds)"""
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "sage",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": name, "unit": "seconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+        }
+
+
+class Session:
+    def __init__(self, target: str, mode: str, count: int):
+        self.id = f"{target}-{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(2).hex()}"
+        self.target = target
+        self.mode = mode
+        self.count = count
+        self.status = "armed"
+        self.armed_at = time.time()
+        self.started_at: Optional[float] = None
+        self.claimed = 0
+        self.done = 0
+        self.captured_seconds = 0.0
+        self.details: dict = {}  # Extra metadata from the caller (e.g. index_run_id)
+        self.stats: Optional[pstats.Stats] = None
+        self.sampler = Sampler(SAMPLE_INTERVAL) if mode == "sampling" else None
+
+    def info(self) -> dict:
+        return {
+            "id": self.id, "target": self.target, "mode": self.mode, "status": self.status,
+            "count": self.count, "captured": self.done, "armed_at": self.armed_at, "started_at": self.started_at,
+            "captured_seconds": round(self.captured_seconds, 3), **self.details,
+        }
+
+
+# -------- ARMING --------
+
+def arm(target: str, mode: str = "cprofile", count: int = 1) -> dict:
+    """Profile the next indexing run, or the next `count` searches"""
+    if target not in TARGETS:
+        raise ValueError(f"Unknown profile target: {target}")
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    if target == "index":
+        count = 1
+    elif not 1 <= count <= MAX_SEARCH_COUNT:
+        raise ValueError(f"count must be between 1 and {MAX_SEARCH_COUNT}")
+    with _lock:
+        if target in _sessions:
+            raise RuntimeError(f"A {target} profile is already {_sessions[target].status}: {_sessions[target].id}")
+        session = _sessions[target] = Session(target, mode, count)
+    print(f"[PROFILE] Armed {mode} profile {session.id} ({count} {target} {'run' if target == 'index' else 'requests'})")
+    return session.info()
+
+
+def armed(target: str) -> bool:
+    return target in _sessions
+
+
+def _claim(target: str) -> Optional[Session]:
+    """The target's session if this call should be profiled"""
+    with _lock:
+        session = _sessions.get(target)
+        if session is None or session.claimed >= session.count:
+            return None
+        if session.mode == "cprofile" and target == "search" and not _cprofile_lock.acquire(blocking=False):
+            return None  # Another capture is running; this search runs unprofiled
+        session.claimed += 1
+        if session.status == "armed":
+            session.status = "running"
+            session.started_at = time.time()
+            if session.sampler is not None:
+                session.sampler.start()
+    return session
+
+
+# -------- CAPTURE --------
+
+@contextmanager
+def capture(target: str):
+    """Profile the block if a session is armed for `target`; yields the session or None"""
+    session = _claim(target) if target in _sessions else None
+    if session is None:
+        yield None
+        return
+
+    start = time.perf_counter()
+    try:
+        if session.sampler is not None:
+            ident = threading.get_ident()
+            session.sampler.threads.add(ident)
+            try:
+                yield session
+            finally:
+                session.sampler.threads.discard(ident)
+        else:
+            if target != "search":
+                _cprofile_lock.acquire()  # Waits for a search capture, never skips the run
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                try:
+                    yield session
+                finally:
+                    profile.disable()
+            finally:
+                _cprofile_lock.release()
+            with _lock:
+                if session.stats is None:
+                    session.stats = pstats.Stats(profile)
+                else:
+                    session.stats.add(profile)
+    finally:
+        _finish(session, time.perf_counter() - start)
+
+
+def wrap(target: str, fn):
+    """`fn` profiled under capture() when a session is armed for `target`, else `fn` itself"""
+    if target not in _sessions:
+        return fn
+
+    def profiled(*args, **kwargs):
+        with capture(target):
+            return fn(*args, **kwargs)
+    return profiled
+
+
+def _finish(session: Session, seconds: float):
+    with _lock:
+        session.done += 1
+        session.captured_seconds += seconds
+        if session.done < session.count:
+            return
+        _sessions.pop(session.target, None)
+    if session.sampler is not None:
+        session.sampler.stop()
+    try:
+        save(session)
+        session.status = "complete"
+        print(f"[PROFILE] Saved {session.id} ({session.captured_seconds:.2f}s captured)")
+    except Exception as e:
+        session.status = "failed"
+        print(f"[PROFILE] Failed to save {session.id}: {e}")
+
+
+# -------- STORAGE --------
+
+def save(session: Session):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    ext, _ = FORMATS[session.mode]
+    path = os.path.join(PROFILE_DIR, session.id + ext)
+    if session.sampler is not None:
+        with open(path, "w") as f:
+            json.dump(session.sampler.speedscope(session.id), f)
+        session.details["samples"] = session.sampler.samples
+    else:
+        session.stats.dump_stats(path)
+    info = session.info()
+    info.update(status="complete", finished_at=time.time(), format=ext.lstrip("."))
+    with open(os.path.join(PROFILE_DIR, session.id + ".meta.json"), "w") as f:
+        json.dump(info, f)
+    prune()
+
+
+def prune():
+    """Keep the PROFILE_KEEP newest profiles"""
+    metas = sorted(
+        (name for name in os.listdir(PROFILE_DIR) if name.endswith(".meta.json")),
+        key=lambda name: os.path.getmtime(os.path.join(PROFILE_DIR, name)),
+        reverse=True,
+    )
+    for name in metas[PROFILE_KEEP:]:
+        profile_id = name[:-len(".meta.json")]
+        for ext, _ in FORMATS.values():
+            for suffix in (ext, ".meta.json"):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def list_profiles() -> List[dict]:
+    """Armed/running sessions, then stored profiles, newest first"""
+    with _lock:
+        profiles = [s.info() for s in _sessions.values()]
+    if os.path.isdir(PROFILE_DIR):
+        stored = []
+        for name in os.listdir(PROFILE_DIR):
+            if name.endswith(".meta.json"):
+                try:
+                    with open(os.path.join(PROFILE_DIR, name)) as f:
+                        stored.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        profiles += sorted(stored, key=lambda p: p.get("finished_at", 0), reverse=True)
+    return profiles
+
+
+def profile_file(profile_id: str) -> Optional[Tuple[str, str]]:
+    """(path, media type) of a stored profile, None if unknown"""
+    if not _ID_PATTERN.match(profile_id):
+        return None
+    for ext, media_type in FORMATS.values():
+        path = os.path.join(PROFILE_DIR, profile_id + ext)
+        if os.path.exists(path):
+            return path, media_type
+    return None
@@ -1,32 +1,54 @@
 import time
 import re
 import os
+import base64
 import difflib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 # Set offline mode for HuggingFace before importing transformers
 os.environ["HF_HUB_OFFLINE"] = "1"
 
-from sentence_transformers import SentenceTransformer, util
-import weaviate
+import numpy as np
 import sqlite3
-from typing import List, Optional, Tuple, Set
+from typing import Callable, List, Optional, Tuple, Set
+
+from vector_store import open_store, load_schema_state, hit_refs
+import chunk_dedup
+import index_db
+import metrics
 
 # ---------------- CONFIG ----------------
 
-CLASS_NAME = "Documents"
 EMBED_MODEL = "all-MiniLM-L6-v2"
-INDEX_DB = "index_state.db"
 
 # Hybrid Search Configuration
 ENABLE_HYBRID = True      # Set to False to use pure semantic search
 SEMANTIC_WEIGHT = 0.8     # Semantic similarity dominates
 KEYWORD_WEIGHT = 0.2      # Keywords provide relevance boost
-FETCH_BUFFER = 10         # Fetch top_k * FETCH_BUFFER for deduplication
+FETCH_BUFFER = 10         # Fetch up to top_k * FETCH_BUFFER chunks for deduplication
+FETCH_STRATEGY = "adaptive"  # "fixed", "adaptive" or "group_by" (see retrieve_files)
+INITIAL_FETCH_BUFFER = 3  # Adaptive: first page is top_k * INITIAL_FETCH_BUFFER chunks
+MAX_FETCH_CHUNKS = 2000   # Adaptive: hard ceiling when still short of top_k distinct files
+GROUP_BY_CHUNKS_PER_FILE = 3  # group_by: chunks kept per file group
+GROUP_BY_FILE_BUFFER = 2  # group_by: request top_k * GROUP_BY_FILE_BUFFER groups (root scoping drops some)
+RETRIEVAL_MODES = ("chunks", "files")  # chunks: ANN over all chunks, files: file summaries first, then their chunks
+FILE_CANDIDATE_BUFFER = 4  # files mode: stage one keeps top_k * FILE_CANDIDATE_BUFFER files
+BATCH_QUERY_CONCURRENCY = 8  # Parallel vector store queries in semantic_search_batch
+GENERATION_CHECK_SECONDS = 2.0  # How often get_store() looks for a newly flipped index generation
+STORE_RETIRE_SECONDS = 30.0     # Previous generation's store is closed this long after a flip
 
 # Query-aware Snippet Configuration
 MAX_SNIPPET_SENTENCES = 3    # Max sentences to include in snippet
 MIN_SENTENCE_LENGTH = 20     # Ignore very short sentences
 SENTENCE_SCORE_THRESHOLD = 0.3  # Min relevance score to include sentence
+SENTENCE_VECTOR_DTYPE = np.float16  # Storage dtype of precomputed sentence vectors
+SNIPPET_MODES = ("none", "lexical", "semantic")  # none: no snippet, lexical: keyword overlap, semantic: embeddings
+SENTENCE_CACHE_SIZE = 4096     # Sentence embeddings cached for chunks without precomputed vectors
 
 # Fuzzy / Typo Tolerance Configuration
 FUZZY_MATCH_THRESHOLD = 0.75   # Min similarity ratio for fuzzy keyword match (0-1)
@@ -37,48 +59,158 @@ MIN_WORD_LENGTH_FOR_FUZZY = 4  # Don't fuzzy-match very short words
 
 # -------- LAZY INIT --------
 
-_model = None
-_client = None
-_collection = None
-
-def get_model():
-    """Lazy load the embedding model"""
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(EMBED_MODEL)
-    return _model
-
-def get_weaviate_client(max_retries=3, retry_delay=2):
-    """Lazy connect to Weaviate with retry logic"""
-    global _client, _collection
-    if _client is None:
-        last_error = None
-        for attempt in range(max_retries):
-            try:
-                _client = weaviate.connect_to_local()
-                _collection = _client.collections.get(CLASS_NAME)
-                return _client, _collection
-            except Exception as e:
-                last_error = e
-                if attempt < max_retries - 1:
-                    print(f"⚠️ Weaviate connection attempt {attempt + 1} failed, retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
-                else:
-                    print(f"❌ Weaviate connection failed after {max_retries} attempts")
-                    raise last_error
-    return _client, _collection
-
-def get_collection():
-    """Get the Weaviate collection (connects if needed)"""
-    _, collection = get_weaviate_client()
-    return collection
+_models = {}
+_model_lock = threading.Lock()
+_store = None
+_store_version = None
+_store_checked = 0.0
+_store_embed_model = EMBED_MODEL
+_store_lock = threading.Lock()
+
+def get_model(name: Optional[str] = None):
+    """
+    Lazy load an embedding model (cached per name). Without a name, the
+    model the live index generation was built with, so queries always
+    match the vectors they are compared against.
+    """
+    if name is None:
+        get_store()
+        name = _store_embed_model
+    with _model_lock:
+        if name not in _models:
+            from sentence_transformers import SentenceTransformer  # Deferred: pulls in torch (seconds)
+
+            _models[name] = SentenceTransformer(name)
+        return _models[name]
+
+def get_store():
+    """
+    Get the vector store (Weaviate or local, see vector_store.VECTOR_BACKEND)
+    of the live index generation. Every GENERATION_CHECK_SECONDS the live
+    schema version is re-read from index_state.db; after a flip new searches
+    use the new generation and the old store is closed a little later.
+    """
+    global _store, _store_version, _store_checked, _store_embed_model
+    with _store_lock:
+        now = time.monotonic()
+        if _store is not None and now - _store_checked < GENERATION_CHECK_SECONDS:
+            return _store
+        _store_checked = now
+
+        try:
+            state = load_schema_state()
+        except sqlite3.Error as e:
+            if _store is None:
+                raise
+            print(f"[SEARCH] Failed to read index generation, keeping version {_store_version}: {e}")
+            return _store
+
+        if _store is None or state["schema_version"] != _store_version:
+            previous = _store
+            _store = open_store(version=state["schema_version"])
+            _store_version = state["schema_version"]
+            _store_embed_model = (state["index_params"] or {}).get("embed_model", EMBED_MODEL)
+            if previous is not None:
+                print(f"[SEARCH] Switched to index generation {_store_version}")
+                invalidate_vocabulary()
+                with _sentence_cache_lock:
+                    _sentence_cache.clear()  # Embeddings of the previous model
+                retire = threading.Timer(STORE_RETIRE_SECONDS, previous.close)
+                retire.daemon = True
+                retire.start()
+    return _store
+
+
+# Properties fetched for every search hit. BLOB properties are only returned
+# when requested explicitly, and the sentence_* and paths properties only exist
+# once the indexer has upgraded the schema, so the list is resolved against it.
+BASE_PROPERTIES = ["file", "path", "chunk"]
+SENTENCE_PROPERTIES = ["sentence_offsets", "sentence_vectors", "paths"]
+
+_return_properties: Optional[List[str]] = None
+
+def get_return_properties() -> List[str]:
+    """Properties to request from the vector store (cached until the next re-index)"""
+    global _return_properties
+    if _return_properties is None:
+        try:
+            existing = get_store().property_names()
+        except Exception as e:
+            print(f"[SCHEMA] Failed to read vector store schema: {e}")
+            return BASE_PROPERTIES
+        _return_properties = BASE_PROPERTIES + [p for p in SENTENCE_PROPERTIES if p in existing]
+    return _return_properties
 
 # -----------------------------------
 
 
+# -------- STAGE TIMINGS --------
+# Each query sums the time spent per stage (a stage can run several times,
+# e.g. adaptive fetch rounds) and records the sums in SEARCH_STAGE_SECONDS.
+
+SEARCH_STAGE_SECONDS = metrics.Histogram(
+    "sage_search_stage_seconds", "Time per search stage, summed per query", ["stage"]
+)
+CACHE_REQUESTS = metrics.Counter(
+    "sage_cache_requests_total", "Cache lookups by cache and result (hit/miss)", ["cache", "result"]
+)
+
+_stage_timings: ContextVar[Optional[dict]] = ContextVar("sage_stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings(timings: dict):
+    """Sum timed_stage() durations of this thread into `timings` (seconds), then record them"""
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+        for stage, seconds in timings.items():
+            SEARCH_STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Add the duration of the block to the current query's `stage` (no-op outside a query)"""
+    timings = _stage_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def timed(stage: str):
+    """Decorator form of timed_stage()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed_stage(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timings_ms(timings: dict) -> dict:
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
 # -------- VOCABULARY CACHE --------
 
 _vocabulary: Optional[Set[str]] = None
+_vocabulary_seed: Optional[Tuple[int, Set[str]]] = None
+
+def chunk_words(obj) -> Set[str]:
+    """Vocabulary words of one chunk: its text and the names of every file containing it"""
+    words = re.findall(r'[a-zA-Z]{3,}', obj.properties.get("chunk", ""))
+    for path in hit_refs(obj):
+        words += re.findall(r'[a-zA-Z]{3,}', os.path.basename(path))
+    return {w.lower() for w in words}
+
 
 def get_vocabulary() -> Set[str]:
     """
@@ -87,18 +219,21 @@ def get_vocabulary() -> Set[str]:
     """
     global _vocabulary
     if _vocabulary is not None:
+        CACHE_REQUESTS.inc(cache="vocabulary", result="hit")
         return _vocabulary
+    CACHE_REQUESTS.inc(cache="vocabulary", result="miss")
 
     try:
-        collection = get_collection()
         vocab = set()
-        for obj in collection.iterator():
-            chunk = obj.properties.get("chunk", "")
-            filename = obj.properties.get("file", "")
-            # Extract words from chunk and filename
-            words = re.findall(r'[a-zA-Z]{3,}', chunk)
-            words += re.findall(r'[a-zA-Z]{3,}', filename)
-            vocab.update(w.lower() for w in words)
+        store = get_store()
+        if _vocabulary_seed is not None and _vocabulary_seed[0] == _store_version:
+            _vocabulary = _vocabulary_seed[1]
+            print(f"[VOCAB] Using prebuilt vocabulary: {len(_vocabulary)} unique words")
+            return _vocabulary
+        return_properties = [p for p in ("chunk", "path", "paths") if p in store.property_names()]
+        refs = chunk_dedup.load_refs(store)
+        for obj in store.iterate(return_properties=return_properties):
+            vocab.update(chunk_words(chunk_dedup.attach_refs([obj], refs)[0]))
         _vocabulary = vocab
         print(f"[VOCAB] Built vocabulary: {len(vocab)} unique words")
     except Exception as e:
@@ -107,10 +242,17 @@ def get_vocabulary() -> Set[str]:
     return _vocabulary
 
 
+def seed_vocabulary(version: int, words: Set[str]):
+    """Prebuilt vocabulary of index generation `version` (e.g. an imported snapshot), used instead of a scan"""
+    global _vocabulary_seed
+    _vocabulary_seed = (version, set(words))
+
+
 def invalidate_vocabulary():
     """Call this after re-indexing to refresh the vocabulary."""
-    global _vocabulary
+    global _vocabulary, _return_properties
     _vocabulary = None
+    _return_properties = None  # Indexer may have added sentence properties
 
 
 def correct_query(query: str) -> str:
@@ -152,59 +294,8 @@ def correct_query(query: str) -> str:
 
 
 def load_db_roots() -> List[str]:
-    conn = sqlite3.connect(INDEX_DB, timeout=30)
-    cur = conn.cursor()
-    cur.execute("SELECT path FROM user_roots")
-    roots = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return roots
-
-
-def fuzzy_term_in_text(term: str, text_lower: str, threshold: float = FUZZY_MATCH_THRESHOLD) -> bool:
-    """
-    Check if a term (or a close fuzzy match) appears in the text.
-    First checks exact substring, then falls back to fuzzy word matching.
-    """
-    if term in text_lower:
-        return True
-    # Only do fuzzy matching for longer terms
-    if len(term) < MIN_WORD_LENGTH_FOR_FUZZY:
-        return False
-    # Check each word in the text for a close match
-    text_words = set(re.findall(r'[a-z]{3,}', text_lower))
-    for w in text_words:
-        ratio = difflib.SequenceMatcher(None, term, w).ratio()
-        if ratio >= threshold:
-            return True
-    return False
-
-
-def calculate_keyword_score(query_terms: List[str], chunk_text: str, filename: str) -> float:
-    """
-    Calculate keyword match score (0.0 to 1.0) based on query term presence.
-    Checks both chunk text and filename. Includes fuzzy matching for typos.
-    Bounded to prevent overpowering semantic score.
-    """
-    if not query_terms:
-        return 0.0
-    
-    chunk_lower = chunk_text.lower()
-    filename_lower = filename.lower()
-    
-    matches = 0
-    for term in query_terms:
-        term_lower = term.lower()
-        if fuzzy_term_in_text(term_lower, chunk_lower):
-            matches += 1
-        if fuzzy_term_in_text(term_lower, filename_lower):
-            matches += 0.5  # Filename match weighted less than chunk match
-    
-    # Normalize: max possible score is len(query_terms) * 1.5
-    # Cap at 1.0 to prevent keyword dominance
-    max_possible = len(query_terms) * 1.5
-    score = min(1.0, matches / max_possible if max_possible > 0 else 0.0)
-    
-    return score
+    """Configured roots (cached in memory, see index_db.user_roots)"""
+    return index_db.user_roots()
 
 
 def split_into_sentences(text: str) -> List[str]:
@@ -232,45 +323,68 @@ def split_into_sentences(text: str) -> List[str]:
     return cleaned
 
 
-def extract_query_aware_snippet(
-    query: str,
-    chunk_text: str,
-    query_embedding=None
-) -> Tuple[str, List[str]]:
+def split_sentence_spans(text: str) -> List[Tuple[int, int]]:
     """
-    Extract the most relevant sentences from a chunk based on the query.
-    Returns (snippet_text, list_of_matched_terms).
-    
-    Uses semantic similarity to find sentences that best answer the query,
-    not just sentences that contain query keywords.
+    Return (start, end) character offsets of the sentences produced by
+    split_into_sentences(). Offsets refer to the whitespace-normalized text,
+    which is exactly the form the indexer stores as a chunk.
+    """
+    text = ' '.join(text.split())
+    spans = []
+    pos = 0
+    for sentence in split_into_sentences(text):
+        start = text.find(sentence, pos)
+        if start < 0:
+            continue
+        end = start + len(sentence)
+        spans.append((start, end))
+        pos = end
+    return spans
+
+
+def sentences_from_offsets(chunk_text: str, offsets: List[int]) -> List[str]:
+    """Rebuild sentences from the flat [start, end, start, end, ...] offset list stored at index time"""
+    return [chunk_text[offsets[i]:offsets[i + 1]] for i in range(0, len(offsets) - 1, 2)]
+
+
+def encode_sentence_vectors(vectors) -> str:
+    """Pack sentence embeddings into a base64 blob for the Weaviate BLOB property"""
+    packed = np.asarray(vectors, dtype=SENTENCE_VECTOR_DTYPE)
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+def decode_sentence_vectors(blob: Optional[str], count: int) -> Optional[np.ndarray]:
+    """
+    Unpack a sentence vector blob into a (count, dim) float32 matrix.
+    Returns None if the blob is missing or does not match the sentence count.
+    """
+    if not blob or count <= 0:
+        return None
+    try:
+        packed = np.frombuffer(base64.b64decode(blob), dtype=SENTENCE_VECTOR_DTYPE)
+    except Exception:
+        return None
+    if packed.size == 0 or packed.size % count:
+        return None
+    return packed.reshape(count, -1).astype(np.float32)
+
+
+def to_unit_vector(vector) -> np.ndarray:
+    """Convert an embedding (numpy array, tensor or list) to a unit-length float32 vector"""
+    if hasattr(vector, "cpu"):
+        vector = vector.cpu().numpy()
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def compose_snippet(sentences: List[str], scores) -> str:
+    """
+    Build a snippet from the best-scoring sentences, kept in reading order,
+    with "..." between non-consecutive sentences.
     """
-    model = get_model()
-    
-    # Get query embedding if not provided
-    if query_embedding is None:
-        query_embedding = model.encode(query, convert_to_tensor=True)
-    
-    # Split chunk into sentences
-    sentences = split_into_sentences(chunk_text)
-    
-    if not sentences:
-        # Fallback: return truncated chunk
-        return chunk_text[:300], []
-    
-    if len(sentences) <= MAX_SNIPPET_SENTENCES:
-        # Chunk is small enough, use all sentences
-        snippet = ' '.join(sentences)
-        matched_terms = find_matched_terms(query, snippet)
-        return snippet, matched_terms
-    
-    # Encode all sentences
-    sentence_embeddings = model.encode(sentences, convert_to_tensor=True)
-    
-    # Calculate semantic similarity between query and each sentence
-    similarities = util.cos_sim(query_embedding, sentence_embeddings)[0]
-    
     # Get sentence scores as list of (index, score)
-    scored_sentences = [(i, float(similarities[i])) for i in range(len(sentences))]
+    scored_sentences = [(i, float(scores[i])) for i in range(len(sentences))]
     
     # Sort by score descending
     scored_sentences.sort(key=lambda x: x[1], reverse=True)
@@ -288,9 +402,6 @@ def extract_query_aware_snippet(
     # Sort by original position to maintain reading order
     selected_indices.sort()
     
-    # Build snippet from selected sentences
-    selected_sentences = [sentences[i] for i in selected_indices]
-    
     # Add ellipsis between non-consecutive sentences
     snippet_parts = []
     for i, idx in enumerate(selected_indices):
@@ -299,12 +410,131 @@ def extract_query_aware_snippet(
             snippet_parts.append("...")
         snippet_parts.append(sentences[idx])
     
-    snippet = ' '.join(snippet_parts)
-    
-    # Find terms to highlight
-    matched_terms = find_matched_terms(query, snippet)
-    
-    return snippet, matched_terms
+    return ' '.join(snippet_parts)
+
+
+# -------- BATCHED SNIPPETS --------
+
+_sentence_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_sentence_cache_lock = threading.Lock()
+
+def encode_sentences_cached(sentences: List[str]) -> np.ndarray:
+    """
+    Encode sentences to unit vectors in a single model call.
+    Sentences seen recently are served from an in-memory LRU cache.
+    """
+    vectors: List[Optional[np.ndarray]] = [None] * len(sentences)
+    missing = []
+    with _sentence_cache_lock:
+        for i, sentence in enumerate(sentences):
+            cached = _sentence_cache.get(sentence)
+            if cached is not None:
+                _sentence_cache.move_to_end(sentence)
+                vectors[i] = cached
+            else:
+                missing.append(i)
+
+    CACHE_REQUESTS.inc(len(sentences) - len(missing), cache="sentence_embeddings", result="hit")
+    CACHE_REQUESTS.inc(len(missing), cache="sentence_embeddings", result="miss")
+
+    if missing:
+        # Deduplicate so repeated sentences are encoded once
+        unique = list(dict.fromkeys(sentences[i] for i in missing))
+        encoded = get_model().encode(unique, normalize_embeddings=True)
+        fresh = {sentence: np.asarray(vec, dtype=np.float32) for sentence, vec in zip(unique, encoded)}
+        for i in missing:
+            vectors[i] = fresh[sentences[i]]
+        with _sentence_cache_lock:
+            for sentence, vec in fresh.items():
+                _sentence_cache[sentence] = vec
+            while len(_sentence_cache) > SENTENCE_CACHE_SIZE:
+                _sentence_cache.popitem(last=False)
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(vectors)
+
+
+def lexical_sentence_scores(query: str, sentences: List[str]) -> np.ndarray:
+    """Score sentences by the fraction of query terms they contain (no model inference)"""
+    terms = [t for t in set(query.lower().split()) if len(t) >= 3]
+    if not terms:
+        return np.zeros(len(sentences), dtype=np.float32)
+    return np.array(
+        [sum(t in s.lower() for t in terms) / len(terms) for s in sentences],
+        dtype=np.float32
+    )
+
+
+def build_snippets(
+    query: str,
+    results: List[dict],
+    query_embedding=None,
+    mode: str = "semantic"
+) -> List[Tuple[str, List[str]]]:
+    """
+    Build (snippet, matched_terms) for every result of a query in one pass.
+
+    In semantic mode, sentences of all results that lack precomputed vectors
+    are encoded in a single batched call (or served from the sentence cache),
+    and every sentence is scored with one matrix multiply. Results may carry
+    already-encoded "sentence_embeddings" (set by semantic_search_batch).
+    """
+    if mode not in SNIPPET_MODES:
+        raise ValueError(f"Unknown snippet mode: {mode}")
+    if mode == "none":
+        return [("", []) for _ in results]
+
+    snippets: List[Optional[Tuple[str, List[str]]]] = [None] * len(results)
+    pending = []  # (result index, sentences, precomputed vectors or None)
+
+    for i, result in enumerate(results):
+        chunk_text = result.get("chunk", "")
+        offsets = result.get("sentence_offsets")
+        sentences = sentences_from_offsets(chunk_text, offsets) if offsets else split_into_sentences(chunk_text)
+
+        if not sentences:
+            snippets[i] = (chunk_text[:300], [])
+        elif len(sentences) <= MAX_SNIPPET_SENTENCES:
+            snippet = ' '.join(sentences)
+            snippets[i] = (snippet, find_matched_terms(query, snippet))
+        elif mode == "lexical":
+            snippet = compose_snippet(sentences, lexical_sentence_scores(query, sentences))
+            snippets[i] = (snippet, find_matched_terms(query, snippet))
+        else:
+            vectors = result.get("sentence_embeddings")
+            if vectors is None:
+                vectors = decode_sentence_vectors(result.get("sentence_vectors"), len(sentences))
+            pending.append((i, sentences, vectors))
+
+    if pending:
+        if query_embedding is None:
+            query_embedding = get_model().encode(query, normalize_embeddings=True)
+        query_unit = to_unit_vector(query_embedding)
+
+        # One encode call for every sentence that has no stored vector
+        to_encode = [s for _, sentences, vectors in pending if vectors is None for s in sentences]
+        encoded = encode_sentences_cached(to_encode) if to_encode else None
+
+        blocks = []
+        pos = 0
+        for _, sentences, vectors in pending:
+            if vectors is None:
+                vectors = encoded[pos:pos + len(sentences)]
+                pos += len(sentences)
+            blocks.append(vectors)
+
+        # One matrix multiply scores every sentence of every result
+        similarities = np.vstack(blocks) @ query_unit
+
+        pos = 0
+        for i, sentences, _ in pending:
+            scores = similarities[pos:pos + len(sentences)]
+            pos += len(sentences)
+            snippet = compose_snippet(sentences, scores)
+            snippets[i] = (snippet, find_matched_terms(query, snippet))
+
+    return snippets
 
 
 def find_matched_terms(query: str, text: str) -> List[str]:
@@ -330,101 +560,383 @@ def find_matched_terms(query: str, text: str) -> List[str]:
     return list(set(matched))
 
 
-def semantic_search(
-    query: str,
-    top_k: int = 5,
+def prepare_query(query: str) -> str:
+    """Apply fuzzy spell correction to a query, logging any change"""
+    corrected = correct_query(query)
+    if corrected != query:
+        print(f"[SEARCH] Corrected query: '{query}' → '{corrected}'")
+    return corrected
+
+
+@timed("ann")
+def fetch_candidates(
+    store,
+    query_vector: List[float],
+    limit: int,
+    snippet_mode: str,
+    offset: int = 0,
+    group_by_path: Optional[Tuple[int, int]] = None,
+    paths: Optional[List[str]] = None,
     roots: Optional[List[str]] = None
 ):
     """
-    Semantic search with file-level deduplication and optional hybrid scoring.
-    Returns top_k FILES (not chunks), each with their best matching chunk.
-    Includes fuzzy spell correction for typo tolerance.
+    Run the ANN query and return the matching chunk objects (roots only
+    select shards), with the refs of shared chunks attached
     """
+    # Sentence vectors are only needed for semantic snippets
+    return_properties = get_return_properties()
+    if snippet_mode != "semantic":
+        return_properties = [p for p in return_properties if p != "sentence_vectors"]
 
-    # ---- Fuzzy spell correction ----
-    original_query = query
-    query = correct_query(query)
-    if query != original_query:
-        print(f"[SEARCH] Corrected query: '{original_query}' → '{query}'")
+    objects = store.query(
+        query_vector,
+        limit,
+        offset=offset,
+        return_properties=return_properties,
+        paths=paths,
+        group_by_path=group_by_path,
+        roots=roots
+    )
+    return chunk_dedup.with_refs(store, objects)
 
-    # ---- Resolve effective roots ----
-    if roots is None:
-        roots = load_db_roots()
 
-    norm_roots = [os.path.normpath(r) for r in roots] if roots else None
+def term_match_matrix(terms: List[str], texts_lower: List[str]) -> np.ndarray:
+    """
+    Boolean (len(texts), len(terms)) matrix: does each text contain each term,
+    exactly (substring) or, for terms of MIN_WORD_LENGTH_FOR_FUZZY or more,
+    as a fuzzy match (FUZZY_MATCH_THRESHOLD) against one of its [a-z]{3,}
+    words? Every distinct (term, word) pair is compared only once per call.
+    """
+    matches = np.zeros((len(texts_lower), len(terms)), dtype=bool)
+    if not texts_lower or not terms:
+        return matches
+
+    words_per_text = [set(re.findall(r'[a-z]{3,}', t)) for t in texts_lower]
+    all_words = set().union(*words_per_text)
 
+    fuzzy_words = {}  # term -> words that fuzzy-match it
+    for term in set(terms):
+        if len(term) < MIN_WORD_LENGTH_FOR_FUZZY:
+            fuzzy_words[term] = set()
+            continue
+        fuzzy_words[term] = {
+            w for w in all_words
+            if difflib.SequenceMatcher(None, term, w).ratio() >= FUZZY_MATCH_THRESHOLD
+        }
+
+    for j, term in enumerate(terms):
+        close = fuzzy_words[term]
+        for i, text in enumerate(texts_lower):
+            matches[i, j] = term in text or not close.isdisjoint(words_per_text[i])
+    return matches
+
+
+@timed("scoring")
+def score_candidates(objects, query: str, norm_roots: Optional[List[str]]) -> dict:
+    """
+    Hybrid-score chunk objects in vectorized form.
+    Returns a candidate set of parallel arrays (one entry per in-scope chunk
+    and file): "objects", "paths", "distance", "similarity" and "hybrid".
+    A deduplicated chunk shared by several files yields one entry per file.
+    """
     # ---- Parse query for keyword matching ----
     query_terms = query.lower().split() if ENABLE_HYBRID else []
 
-    # ---- Get model and collection (lazy init) ----
-    model = get_model()
-    collection = get_collection()
+    # ---- Attribute shared chunks to every file containing them ----
+    expanded, paths = [], []
+    for obj in objects:
+        for path in hit_refs(obj):
+            expanded.append(obj)
+            paths.append(path)
+    objects = expanded
 
-    # ---- Semantic vector search ----
-    query_vector = model.encode(query).tolist()
+    # ---- Root scoping (checked once per distinct path) ----
+    if norm_roots:
+        in_scope = {}
+        for path in set(paths):
+            norm_path = os.path.normpath(path)
+            in_scope[path] = any(norm_path.startswith(r) for r in norm_roots)
+        keep = [i for i, path in enumerate(paths) if in_scope[path]]
+        objects = [objects[i] for i in keep]
+        paths = [paths[i] for i in keep]
 
-    # Overfetch to ensure enough candidates after deduplication
-    results = collection.query.near_vector(
-        near_vector=query_vector,
-        limit=top_k * FETCH_BUFFER,
-        return_metadata=["distance"]
-    )
+    distances = np.fromiter((obj.metadata.distance for obj in objects), dtype=np.float64, count=len(objects))
+    similarity = 1 - distances
+
+    # ---- Calculate hybrid score ----
+    if ENABLE_HYBRID and query_terms and objects:
+        chunk_matches = term_match_matrix(
+            query_terms, [obj.properties.get("chunk", "").lower() for obj in objects]
+        )
+        # Filenames are matched once per distinct file
+        file_index = {}
+        file_ids = np.array([file_index.setdefault(p, len(file_index)) for p in paths], dtype=np.int64)
+        filenames = [""] * len(file_index)
+        for path in paths:
+            filenames[file_index[path]] = os.path.basename(path).lower()
+        name_matches = term_match_matrix(query_terms, filenames)
+
+        # Chunk match counts 1, filename match 0.5; normalized and capped at 1.0
+        matches = chunk_matches.sum(axis=1) + 0.5 * name_matches.sum(axis=1)[file_ids]
+        keyword_score = np.minimum(1.0, matches / (len(query_terms) * 1.5))
+        hybrid = similarity * SEMANTIC_WEIGHT + keyword_score * KEYWORD_WEIGHT
+    else:
+        hybrid = similarity
+
+    return {
+        "objects": objects,
+        "paths": paths,
+        "distance": distances,
+        "similarity": similarity,
+        "hybrid": hybrid
+    }
+
+
+@timed("scoring")
+def merge_candidates(first: dict, second: dict) -> dict:
+    """Concatenate two candidate sets (e.g. successive adaptive fetch pages)"""
+    return {
+        "objects": first["objects"] + second["objects"],
+        "paths": first["paths"] + second["paths"],
+        "distance": np.concatenate([first["distance"], second["distance"]]),
+        "similarity": np.concatenate([first["similarity"], second["similarity"]]),
+        "hybrid": np.concatenate([first["hybrid"], second["hybrid"]])
+    }
+
+
+@timed("scoring")
+def select_top_files(candidates: dict, top_k: int) -> List[dict]:
+    """
+    Keep the best chunk per file and return the top_k files by hybrid score.
+    Per-file max and top-k selection are vectorized; result dicts are only
+    built for the selected files.
+    """
+    paths = candidates["paths"]
+    if not paths or top_k <= 0:
+        return []
+    hybrid = candidates["hybrid"]
+
+    file_index = {}
+    file_ids = np.array([file_index.setdefault(p, len(file_index)) for p in paths], dtype=np.int64)
+
+    # Best chunk per file: order by file, then score desc, then fetch order
+    order = np.lexsort((np.arange(len(paths)), -hybrid, file_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = file_ids[order][1:] != file_ids[order][:-1]
+    best = order[first]  # one chunk index per file, in file-id order
+
+    # Top-k files: argpartition, then order by score (ties by first appearance)
+    best_scores = hybrid[best]
+    if len(best) > top_k:
+        top = np.argpartition(-best_scores, top_k - 1)[:top_k]
+    else:
+        top = np.arange(len(best))
+    top = top[np.lexsort((top, -best_scores[top]))]
+
+    ranked = []
+    for i in best[top]:
+        obj = candidates["objects"][i]
+        ranked.append({
+            "file": os.path.basename(paths[i]),
+            "path": paths[i],
+            "chunk": obj.properties.get("chunk", ""),  # Store full chunk for query-aware processing
+            "sentence_offsets": obj.properties.get("sentence_offsets"),
+            "sentence_vectors": obj.properties.get("sentence_vectors"),
+            "distance": round(float(candidates["distance"][i]), 4),
+            "similarity": round(float(candidates["similarity"][i]), 4),
+            "hybrid_score": round(float(hybrid[i]), 4)
+        })
+    return ranked
+
+
+def kth_file_score(candidates: dict, k: int) -> float:
+    """Unrounded best-chunk hybrid score of the k-th best file (-inf with fewer than k files)"""
+    paths = candidates["paths"]
+    if not paths:
+        return float("-inf")
+    file_ids = np.unique(np.asarray(paths, dtype=object), return_inverse=True)[1]
+    best = np.full(int(file_ids.max()) + 1, -np.inf)
+    np.maximum.at(best, file_ids, candidates["hybrid"])
+    if len(best) < k:
+        return float("-inf")
+    return float(np.partition(best, len(best) - k)[len(best) - k])
 
-    # ---- File-level deduplication with hybrid scoring ----
-    file_best = {}  # path -> best result for that file
 
-    for obj in results.objects:
+def rank_files(objects, query: str, top_k: int, norm_roots: Optional[List[str]]) -> List[dict]:
+    """
+    File-level deduplication with hybrid scoring.
+    Keeps the best chunk per file and returns the top_k files by hybrid score.
+    """
+    return select_top_files(score_candidates(objects, query, norm_roots), top_k)
+
+
+def max_unseen_score(last_distance: float, query: str) -> float:
+    """
+    Upper bound on the hybrid score of any chunk not fetched yet.
+    ANN results arrive in distance order, so unseen chunks are at least
+    last_distance away; their keyword score can at most be 1.0.
+    """
+    similarity = 1 - last_distance
+    if ENABLE_HYBRID and query.split():
+        return similarity * SEMANTIC_WEIGHT + KEYWORD_WEIGHT
+    return similarity
+
+
+def retrieve_files_two_stage(
+    store,
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    norm_roots: Optional[List[str]],
+    snippet_mode: str,
+    stats: Optional[dict] = None
+) -> List[dict]:
+    """
+    Two-stage retrieval: an ANN over per-file summary vectors picks
+    top_k * FILE_CANDIDATE_BUFFER candidate files, then a chunk-level ANN
+    filtered to those files picks the best chunk per file. Stage one
+    scales with the number of files rather than the number of chunks.
+    """
+    with timed_stage("ann"):
+        file_hits = store.query_files(query_vector, top_k * FILE_CANDIDATE_BUFFER, roots=norm_roots)
+
+    candidates = []
+    for obj in file_hits:
         path = obj.properties.get("path", "")
-        norm_path = os.path.normpath(path)
-
-        # ---- Root scoping ----
-        if norm_roots:
-            if not any(norm_path.startswith(r) for r in norm_roots):
-                continue
-
-        distance = obj.metadata.distance
-        semantic_similarity = 1 - distance
-        
-        chunk_text = obj.properties.get("chunk", "")
-        filename = obj.properties.get("file", "")
-
-        # ---- Calculate hybrid score ----
-        if ENABLE_HYBRID and query_terms:
-            keyword_score = calculate_keyword_score(query_terms, chunk_text, filename)
-            hybrid_score = (semantic_similarity * SEMANTIC_WEIGHT) + (keyword_score * KEYWORD_WEIGHT)
-        else:
-            hybrid_score = semantic_similarity
-
-        # ---- Keep best chunk per file ----
-        if path not in file_best or hybrid_score > file_best[path]["hybrid_score"]:
-            file_best[path] = {
-                "file": filename,
-                "path": path,
-                "chunk": chunk_text,  # Store full chunk for query-aware processing
-                "distance": round(distance, 4),
-                "similarity": round(semantic_similarity, 4),
-                "hybrid_score": round(hybrid_score, 4)
-            }
-
-    # ---- Extract query-aware snippets for top results ----
-    # Pre-compute query embedding once for efficiency
-    query_embedding = model.encode(query, convert_to_tensor=True)
-    
-    # Sort by hybrid score
-    sorted_results = sorted(file_best.values(), key=lambda x: x["hybrid_score"], reverse=True)[:top_k]
-    
-    # Process each result to extract query-aware snippet
-    output = []
-    for result in sorted_results:
-        chunk_text = result.get("chunk", "")
-        
-        # Extract relevant sentences and matched terms
-        snippet, matched_terms = extract_query_aware_snippet(
-            query, 
-            chunk_text,
-            query_embedding
+        if norm_roots and not any(os.path.normpath(path).startswith(r) for r in norm_roots):
+            continue
+        candidates.append(path)
+
+    objects = []
+    if candidates:
+        # Chunks shared into a candidate are stored under their owner's path
+        owners = chunk_dedup.owners_of(store, candidates) - set(candidates)
+        objects = fetch_candidates(
+            store, query_vector, top_k * FETCH_BUFFER, snippet_mode, paths=candidates + sorted(owners)
         )
-        
+        if owners:
+            wanted = set(candidates)
+            objects = [obj for obj in objects if wanted.intersection(hit_refs(obj))]
+
+    ranked = rank_files(objects, query, top_k, norm_roots)
+
+    if stats is not None:
+        stats["retrieval"] = {
+            "strategy": "two_stage",
+            "fetch_rounds": 2,
+            "file_candidates": len(candidates),
+            "chunks_fetched": len(objects),
+            "files_returned": len(ranked),
+            "chunks_per_file": round(len(objects) / len(ranked), 2) if ranked else 0.0
+        }
+
+    return ranked
+
+
+def retrieve_files(
+    store,
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    norm_roots: Optional[List[str]],
+    snippet_mode: str,
+    stats: Optional[dict] = None,
+    retrieval: str = "chunks"
+) -> List[dict]:
+    """
+    Fetch candidate chunks and reduce them to the top_k files.
+
+    retrieval="files" uses retrieve_files_two_stage() when the store has
+    file summary vectors; otherwise chunks are searched directly.
+
+    FETCH_STRATEGY selects how candidates are fetched:
+      "fixed"    - one query for top_k * FETCH_BUFFER chunks
+      "adaptive" - start at top_k * INITIAL_FETCH_BUFFER chunks and page
+                   further only while an unseen chunk could still enter
+                   the top_k files (capped at top_k * FETCH_BUFFER), or
+                   while fewer than top_k distinct files were found
+                   (capped at MAX_FETCH_CHUNKS)
+      "group_by" - the store groups hits by path, GROUP_BY_CHUNKS_PER_FILE each
+    Per-query fetch metrics are written into `stats` when given.
+    """
+    if retrieval == "files" and store.has_file_vectors():
+        return retrieve_files_two_stage(
+            store, query, query_vector, top_k, norm_roots, snippet_mode, stats
+        )
+
+    max_chunks = top_k * FETCH_BUFFER
+    rounds = 0
+
+    if FETCH_STRATEGY == "group_by":
+        group_by_path = (top_k * GROUP_BY_FILE_BUFFER, GROUP_BY_CHUNKS_PER_FILE)
+        objects = fetch_candidates(
+            store, query_vector, max_chunks, snippet_mode, group_by_path=group_by_path, roots=norm_roots
+        )
+        rounds = 1
+        ranked = rank_files(objects, query, top_k, norm_roots)
+
+    elif FETCH_STRATEGY == "adaptive":
+        objects = []
+        candidates = score_candidates([], query, norm_roots)
+        limit = min(top_k * INITIAL_FETCH_BUFFER, max_chunks)
+        while True:
+            requested = limit - len(objects)
+            page = fetch_candidates(
+                store, query_vector, requested, snippet_mode, offset=len(objects), roots=norm_roots
+            )
+            rounds += 1
+            objects.extend(page)
+            candidates = merge_candidates(candidates, score_candidates(page, query, norm_roots))
+            ranked = select_top_files(candidates, top_k)
+
+            if len(page) < requested:
+                break  # Index exhausted
+            if len(ranked) >= top_k:
+                # Enough files: stop once no unseen chunk could outscore the k-th file
+                if kth_file_score(candidates, top_k) >= max_unseen_score(objects[-1].metadata.distance, query):
+                    break
+                if len(objects) >= max_chunks:
+                    break
+                limit = min(limit * 2, max_chunks)
+            else:
+                # Too few distinct files (one document dominates): keep widening
+                if len(objects) >= MAX_FETCH_CHUNKS:
+                    break
+                limit = min(max(limit * 2, len(objects) + top_k), MAX_FETCH_CHUNKS)
+
+    else:
+        objects = fetch_candidates(store, query_vector, max_chunks, snippet_mode, roots=norm_roots)
+        rounds = 1
+        ranked = rank_files(objects, query, top_k, norm_roots)
+
+    if stats is not None:
+        stats["retrieval"] = {
+            "strategy": FETCH_STRATEGY,
+            "fetch_rounds": rounds,
+            "chunks_fetched": len(objects),
+            "files_returned": len(ranked),
+            "chunks_per_file": round(len(objects) / len(ranked), 2) if ranked else 0.0
+        }
+
+    return ranked
+
+
+def drop_excluded(ranked: List[dict], exclude: Optional[Callable[[str], bool]]) -> List[dict]:
+    """
+    Ranked files whose best chunk does not match `exclude` (the backend's
+    sensitive-word filter). Checks the chunk text, so the result does not
+    depend on the snippet mode, and excluded files never get snippets.
+    """
+    if exclude is None:
+        return ranked
+    with timed_stage("sensitive_filter"):
+        return [r for r in ranked if not exclude(r.get("chunk", ""))]
+
+
+def format_results(ranked: List[dict], snippets: List[Tuple[str, List[str]]]) -> List[dict]:
+    """Combine ranked files with their snippets into the public result shape"""
+    output = []
+    for result, (snippet, matched_terms) in zip(ranked, snippets):
         output.append({
             "file": result["file"],
             "path": result["path"],
@@ -434,5 +946,190 @@ def semantic_search(
             "similarity": result["similarity"],
             "hybrid_score": result["hybrid_score"]
         })
-    
     return output
+
+
+def check_search_modes(snippet_mode: str, retrieval: str):
+    """Validate snippet and retrieval mode arguments"""
+    if snippet_mode not in SNIPPET_MODES:
+        raise ValueError(f"Unknown snippet mode: {snippet_mode}")
+    if retrieval not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {retrieval}")
+
+
+def resolve_norm_roots(roots: Optional[List[str]]) -> Optional[List[str]]:
+    """Normalize the effective search roots (DB roots when none are given)"""
+    if roots is None:
+        roots = load_db_roots()
+    return [os.path.normpath(r) for r in roots] if roots else None
+
+
+def semantic_search(
+    query: str,
+    top_k: int = 5,
+    roots: Optional[List[str]] = None,
+    snippet_mode: str = "semantic",
+    stats: Optional[dict] = None,
+    retrieval: str = "chunks",
+    exclude: Optional[Callable[[str], bool]] = None
+):
+    """
+    Semantic search with file-level deduplication and optional hybrid scoring.
+    Returns top_k FILES (not chunks), each with their best matching chunk.
+    Includes fuzzy spell correction for typo tolerance.
+    snippet_mode selects how snippets are built (see SNIPPET_MODES).
+    retrieval="files" searches file summary vectors first (see RETRIEVAL_MODES).
+    Files whose best chunk matches `exclude` are dropped (see drop_excluded).
+    If `stats` is given it receives per-query retrieval metrics and the
+    per-stage timings ("timings_ms").
+    """
+    check_search_modes(snippet_mode, retrieval)
+
+    timings = {}
+    with collect_stage_timings(timings):
+        # ---- Fuzzy spell correction ----
+        with timed_stage("correction"):
+            query = prepare_query(query)
+
+        # ---- Resolve effective roots, get vector store and its model (lazy init) ----
+        with timed_stage("setup"):
+            norm_roots = resolve_norm_roots(roots)
+            store = get_store()
+            model = get_model()
+
+        # ---- Semantic vector search ----
+        # Encoded once: used for the ANN query and for snippet sentence scoring
+        with timed_stage("encode"):
+            query_embedding = model.encode(query, normalize_embeddings=True)
+
+        # ---- Candidate fetch + file-level deduplication with hybrid scoring ----
+        ranked = retrieve_files(
+            store, query, query_embedding.tolist(), top_k, norm_roots, snippet_mode, stats, retrieval
+        )
+        ranked = drop_excluded(ranked, exclude)
+
+        # ---- Extract query-aware snippets for top results ----
+        with timed_stage("snippets"):
+            snippets = build_snippets(query, ranked, query_embedding, mode=snippet_mode)
+
+    if stats is not None:
+        stats["timings_ms"] = timings_ms(timings)
+    return format_results(ranked, snippets)
+
+
+def semantic_search_batch(
+    queries: List[str],
+    top_k: int = 5,
+    roots: Optional[List[str]] = None,
+    snippet_mode: str = "semantic",
+    retrieval: str = "chunks",
+    exclude: Optional[Callable[[str], bool]] = None
+) -> List[List[dict]]:
+    """
+    Run semantic_search for many queries at once.
+    All queries are encoded in one model call, the ANN queries run
+    concurrently, and snippet sentences of every query share one batched
+    encode. Returns one result list per query, in input order, each with
+    the same shape as semantic_search().
+    """
+    check_search_modes(snippet_mode, retrieval)
+    if not queries:
+        return []
+
+    def retrieve(query, vec):
+        # Worker threads collect per-query ANN and scoring timings of their own
+        with collect_stage_timings({}):
+            ranked = retrieve_files(store, query, vec.tolist(), top_k, norm_roots, snippet_mode, retrieval=retrieval)
+            return drop_excluded(ranked, exclude)
+
+    with collect_stage_timings({}):
+        with timed_stage("correction"):
+            corrected = [prepare_query(q) for q in queries]
+        with timed_stage("setup"):
+            norm_roots = resolve_norm_roots(roots)
+            store = get_store()
+            model = get_model()
+
+        # ---- One encode call for every query ----
+        with timed_stage("encode"):
+            query_embeddings = model.encode(corrected, normalize_embeddings=True)
+
+        # ---- Concurrent ANN queries + hybrid scoring ----
+        with ThreadPoolExecutor(max_workers=BATCH_QUERY_CONCURRENCY) as pool:
+            ranked_per_query = list(pool.map(retrieve, corrected, query_embeddings))
+
+        with timed_stage("snippets"):
+            # ---- Encode snippet sentences of all queries in one call ----
+            if snippet_mode == "semantic":
+                unencoded = []  # (result, sentences) lacking precomputed vectors
+                for ranked in ranked_per_query:
+                    for result in ranked:
+                        chunk_text = result.get("chunk", "")
+                        offsets = result.get("sentence_offsets")
+                        sentences = sentences_from_offsets(chunk_text, offsets) if offsets else split_into_sentences(chunk_text)
+                        if len(sentences) > MAX_SNIPPET_SENTENCES and \
+                                decode_sentence_vectors(result.get("sentence_vectors"), len(sentences)) is None:
+                            unencoded.append((result, sentences))
+                if unencoded:
+                    encoded = encode_sentences_cached([s for _, sentences in unencoded for s in sentences])
+                    pos = 0
+                    for result, sentences in unencoded:
+                        result["sentence_embeddings"] = encoded[pos:pos + len(sentences)]
+                        pos += len(sentences)
+
+            output = []
+            for query, ranked, query_embedding in zip(corrected, ranked_per_query, query_embeddings):
+                snippets = build_snippets(query, ranked, query_embedding, mode=snippet_mode)
+                output.append(format_results(ranked, snippets))
+    return output
+
+
+def semantic_search_stream(
+    query: str,
+    top_k: int = 5,
+    roots: Optional[List[str]] = None,
+    snippet_mode: str = "semantic",
+    stats: Optional[dict] = None,
+    retrieval: str = "chunks",
+    exclude: Optional[Callable[[str], bool]] = None
+):
+    """
+    Generator variant of semantic_search for progressive rendering.
+    Yields {"type": "results", ...} with the ranked files (no snippets) as
+    soon as ANN and hybrid scoring finish, then one {"type": "snippet", ...}
+    event per result as its snippet is computed. Files matching `exclude`
+    are dropped before the first event. `stats` receives its "timings_ms"
+    once the last snippet is done.
+    """
+    check_search_modes(snippet_mode, retrieval)
+
+    # Steps of this generator may run on different threads, so stages are
+    # collected per step and snippet time is summed by hand
+    timings = {}
+    with collect_stage_timings(timings):
+        with timed_stage("correction"):
+            query = prepare_query(query)
+        with timed_stage("setup"):
+            norm_roots = resolve_norm_roots(roots)
+            store = get_store()
+            model = get_model()
+
+        with timed_stage("encode"):
+            query_embedding = model.encode(query, normalize_embeddings=True)
+        ranked = retrieve_files(
+            store, query, query_embedding.tolist(), top_k, norm_roots, snippet_mode, stats, retrieval
+        )
+        ranked = drop_excluded(ranked, exclude)
+
+    yield {"type": "results", "results": format_results(ranked, [("", [])] * len(ranked))}
+
+    snippet_seconds = 0.0
+    for index, result in enumerate(ranked):
+        start = time.perf_counter()
+        [(snippet, matched_terms)] = build_snippets(query, [result], query_embedding, mode=snippet_mode)
+        snippet_seconds += time.perf_counter() - start
+        yield {"type": "snippet", "index": index, "snippet": snippet, "matched_terms": matched_terms}
+
+    SEARCH_STAGE_SECONDS.observe(snippet_seconds, stage="snippets")
+    if stats is not None:
+        stats["timings_ms"] = timings_ms(dict(timings, snippets=snippet_seconds))
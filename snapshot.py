@@ -0,0 +1,453 @@
+"""
+Export the live index to one snapshot file, or restore one, without
+re-extracting or re-embedding anything. A snapshot is a zip archive:
+
+    manifest.json          format, version, index params, counts, SHA-256 of every member
+    chunks.jsonl           chunk uuid + properties (one JSON object per line)
+    vectors.bin            chunk vectors, raw rows (dtype/dim in the manifest)
+    files.jsonl            file summary properties
+    file_vectors.bin       file summary vectors
+    indexed_files.jsonl    indexed_files rows
+    roots.json             user roots
+    vocabulary.json        fuzzy-match vocabulary
+    dedup_clusters.jsonl   shared-chunk state (chunk_dedup.py)
+    dedup_refs.jsonl
+
+Import verifies every checksum first, bulk-loads into a new schema version
+and flips to it together with indexed_files and the roots.
+
+    python snapshot.py export sage.snapshot
+    python snapshot.py export sage.snapshot --dtype float32
+    python snapshot.py export sage.snapshot --overwrite
+    python snapshot.py import sage.snapshot
+    python snapshot.py import sage.snapshot --backend local --keep-old
+"""
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import zipfile
+import itertools
+import argparse
+import tempfile
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+
+from vector_store import (
+    VECTOR_BACKEND, ShardedStore, open_store, load_schema_state, save_schema_state, hit_vector, unit_rows
+)
+from index_docs import init_db, retire_later
+from search import chunk_words
+import chunk_dedup
+
+# ---------------- CONFIG ----------------
+
+SNAPSHOT_FORMAT = "sage-snapshot"
+SNAPSHOT_VERSION = 1        # Bump on layout changes; import refuses newer versions
+SNAPSHOT_DTYPE = "float16"  # Vector dtype in the file: "float16" (half size) or "float32" (lossless)
+IMPORT_BATCH = 2000         # Chunks per bulk insert
+HASH_BLOCK_SIZE = 1 << 20
+CHUNK_PROPERTIES = ["file", "path", "chunk", "sentence_offsets", "sentence_vectors", "paths"]
+
+snapshot_progress = {
+    "phase": "idle",  # idle, exporting, verifying, importing, complete, failed
+    "total_chunks": 0,
+    "processed_chunks": 0,
+}
+
+# ----------------------------------------
+
+
+# -------- MEMBERS --------
+
+class HashingWriter:
+    """File wrapper that hashes and counts everything written through it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.digest.update(data)
+        self.size += len(data)
+        self.f.write(data)
+
+
+def write_member(zf: zipfile.ZipFile, name: str, blocks: Iterable[bytes], compress: bool) -> dict:
+    """Stream blocks into one archive member; returns its checksum entry"""
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = compression
+    with zf.open(info, "w", force_zip64=True) as f:
+        writer = HashingWriter(f)
+        for block in blocks:
+            writer.write(block)
+    return {"sha256": writer.digest.hexdigest(), "size": writer.size}
+
+
+def json_lines(rows: Iterable) -> Iterable[bytes]:
+    for row in rows:
+        yield (json.dumps(row, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def member_hash(zf: zipfile.ZipFile, name: str) -> str:
+    digest = hashlib.sha256()
+    with zf.open(name) as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_lines(zf: zipfile.ZipFile, name: str) -> Iterable:
+    with zf.open(name) as f:
+        for line in io.TextIOWrapper(f, encoding="utf-8"):
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_vectors(zf: zipfile.ZipFile, name: str, dtype: np.dtype, dim: int, rows: int) -> Iterable[np.ndarray]:
+    """Vector rows of a member in blocks of up to `rows`"""
+    row_bytes = dtype.itemsize * dim
+    with zf.open(name) as f:
+        while True:
+            data = f.read(rows * row_bytes)
+            if not data:
+                return
+            if len(data) % row_bytes:
+                raise ValueError(f"{name} is truncated: partial vector row")
+            yield np.frombuffer(data, dtype=dtype).reshape(-1, dim)
+
+
+def json_safe(props: dict) -> dict:
+    """Chunk properties as JSON (BLOB properties as base64)"""
+    props = dict(props)
+    if isinstance(props.get("sentence_vectors"), bytes):
+        props["sentence_vectors"] = base64.b64encode(props["sentence_vectors"]).decode("ascii")
+    return props
+
+
+# -------- EXPORT --------
+
+def export_snapshot(
+    out_path: str,
+    backend: Optional[str] = None,
+    dtype: str = SNAPSHOT_DTYPE,
+    overwrite: bool = False
+) -> dict:
+    """
+    Write the live index of `backend` to `out_path`. Run it while no
+    indexing is in progress (the backend holds its indexing lock).
+    An existing `out_path` is refused unless `overwrite`. Returns the manifest.
+    """
+    if os.path.exists(out_path) and not overwrite:
+        raise FileExistsError(f"{out_path} already exists")
+    backend = backend or VECTOR_BACKEND
+    state = load_schema_state(backend)
+    vector_dtype = np.dtype(dtype)
+    start = time.time()
+    snapshot_progress.update({"phase": "exporting", "total_chunks": 0, "processed_chunks": 0})
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    store = open_store(backend, state["schema_version"])
+    tmp_path = None
+    try:
+        snapshot_progress["total_chunks"] = store.count()
+        members = {}
+        vocabulary: Set[str] = set()
+        dim = None
+        chunk_count = 0
+
+        # Unique temp name next to the target: never clobbers an unrelated file
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(out_path) + ".", suffix=".tmp", dir=out_dir)
+        os.close(fd)
+        with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zf, \
+                tempfile.TemporaryFile(dir=out_dir) as vectors_tmp:
+
+            # ---- Chunks: properties stream into the archive, vectors into a temp file ----
+            return_properties = [p for p in CHUNK_PROPERTIES if p in store.property_names()]
+            refs = chunk_dedup.load_refs(store)  # Vocabulary only; the refs themselves go to dedup_refs.jsonl
+
+            def chunk_rows():
+                nonlocal dim, chunk_count
+                for obj in store.iterate(return_properties=return_properties, include_vector=True):
+                    vector = hit_vector(obj)
+                    if vector is None:
+                        continue
+                    vector = unit_rows(vector)[0]
+                    if dim is None:
+                        dim = len(vector)
+                    vectors_tmp.write(vector.astype(vector_dtype).tobytes())
+                    uid = getattr(obj, "uuid", None)
+                    row = {"uuid": str(uid) if uid is not None else None, "properties": json_safe(obj.properties)}
+                    vocabulary.update(chunk_words(chunk_dedup.attach_refs([obj], refs)[0]))
+                    chunk_count += 1
+                    snapshot_progress["processed_chunks"] = chunk_count
+                    yield row
+
+            members["chunks.jsonl"] = write_member(zf, "chunks.jsonl", json_lines(chunk_rows()), compress=True)
+            vectors_tmp.seek(0)
+            members["vectors.bin"] = write_member(
+                zf, "vectors.bin", iter(lambda: vectors_tmp.read(HASH_BLOCK_SIZE), b""), compress=False
+            )
+
+            # ---- File summaries ----
+            file_vectors = []
+
+            def file_rows():
+                for obj in store.iterate_files():
+                    vector = hit_vector(obj)
+                    if vector is None:
+                        continue
+                    file_vectors.append(np.asarray(vector, dtype=np.float32))
+                    yield {"path": obj.properties["path"], "chunk_count": obj.properties.get("chunk_count") or 0}
+
+            members["files.jsonl"] = write_member(zf, "files.jsonl", json_lines(file_rows()), compress=True)
+            members["file_vectors.bin"] = write_member(
+                zf, "file_vectors.bin", (v.astype(vector_dtype).tobytes() for v in file_vectors), compress=False
+            )
+
+            # ---- SQLite state ----
+            conn = init_db()
+            try:
+                indexed = conn.execute(
+                    "SELECT path, mtime, size, indexed_at, content_hash FROM indexed_files"
+                ).fetchall()
+                roots = [row[0] for row in conn.execute("SELECT path FROM user_roots")]
+            finally:
+                conn.close()
+            members["indexed_files.jsonl"] = write_member(zf, "indexed_files.jsonl", json_lines(indexed), compress=True)
+            members["roots.json"] = write_member(zf, "roots.json", [json.dumps(roots).encode("utf-8")], compress=True)
+            members["vocabulary.json"] = write_member(
+                zf, "vocabulary.json", [json.dumps(sorted(vocabulary)).encode("utf-8")], compress=True
+            )
+
+            clusters, refs = chunk_dedup.dump_clusters(chunk_dedup.store_key(store))
+            members["dedup_clusters.jsonl"] = write_member(zf, "dedup_clusters.jsonl", json_lines(clusters), compress=True)
+            members["dedup_refs.jsonl"] = write_member(zf, "dedup_refs.jsonl", json_lines(refs), compress=True)
+
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "created_at": time.time(),
+                "source_backend": backend,
+                "source_schema_version": state["schema_version"],
+                "index_params": state["index_params"],
+                "vectors": {"dtype": vector_dtype.name, "dim": dim},
+                "counts": {
+                    "chunks": chunk_count,
+                    "files": len(file_vectors),
+                    "indexed_files": len(indexed),
+                    "roots": len(roots),
+                    "vocabulary": len(vocabulary),
+                },
+                "members": members,
+            }
+            zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        snapshot_progress["phase"] = "failed"
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        store.close()
+
+    snapshot_progress["phase"] = "complete"
+    print(f"[DONE] Exported {chunk_count} chunks and {len(indexed)} files to {out_path} "
+          f"({os.path.getsize(out_path) / 1e6:.1f} MB, {time.time() - start:.1f}s)")
+    return manifest
+
+
+# -------- IMPORT --------
+
+def read_manifest(path: str) -> dict:
+    """Manifest of a snapshot after the format and version checks (no checksums)"""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            manifest = json.loads(zf.read("manifest.json"))
+    except zipfile.BadZipFile:
+        raise ValueError(f"{path} is not a SAGE snapshot (not a zip archive)")
+    except KeyError:
+        raise ValueError(f"{path} is not a SAGE snapshot (no manifest)")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a SAGE snapshot")
+    if manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Snapshot version {manifest['version']} is newer than supported ({SNAPSHOT_VERSION})"
+        )
+    return manifest
+
+
+def verify_snapshot(path: str) -> dict:
+    """Check format, version and every member checksum; returns the manifest"""
+    manifest = read_manifest(path)
+    with zipfile.ZipFile(path) as zf:
+        for name, entry in manifest["members"].items():
+            if member_hash(zf, name) != entry["sha256"]:
+                raise ValueError(f"Checksum mismatch in snapshot member {name}")
+    return manifest
+
+
+def read_vocabulary(path: str) -> List[str]:
+    with zipfile.ZipFile(path) as zf:
+        return json.loads(zf.read("vocabulary.json"))
+
+
+def drop_version(backend: str, version: int):
+    source = open_store(backend, version)
+    source.drop()
+    source.close()
+    chunk_dedup.forget(chunk_dedup.store_key(source))
+    print(f"[DONE] Dropped schema version {version}")
+
+
+def import_snapshot(
+    path: str,
+    backend: Optional[str] = None,
+    keep_old: bool = False,
+    retire_seconds: float = 0
+) -> int:
+    """
+    Restore a snapshot into schema version live + 1 of `backend` and make it
+    live together with its indexed_files rows and roots (one SQLite
+    transaction). The previous version is dropped `retire_seconds` later
+    (in a timer thread) unless `keep_old`. Returns the new version.
+    """
+    backend = backend or VECTOR_BACKEND
+    start = time.time()
+    snapshot_progress.update({"phase": "verifying", "total_chunks": 0, "processed_chunks": 0})
+
+    try:
+        manifest = verify_snapshot(path)
+        counts = manifest["counts"]
+        print(f"[SNAPSHOT] Verified {path}: {counts['chunks']} chunks, {counts['indexed_files']} files")
+
+        version = load_schema_state(backend)["schema_version"]
+        new_version = version + 1
+
+        stale = open_store(backend, new_version)
+        stale.drop()  # Leftovers of an interrupted import
+        stale.close()
+        chunk_dedup.forget(chunk_dedup.store_key(stale))
+
+        target = open_store(backend, new_version)
+        target.ensure_schema(file_vectors=counts["files"] > 0)
+
+        snapshot_progress.update({"phase": "importing", "total_chunks": counts["chunks"]})
+        dtype = np.dtype(manifest["vectors"]["dtype"])
+        dim = manifest["vectors"]["dim"]
+
+        with zipfile.ZipFile(path) as zf:
+            roots = json.loads(zf.read("roots.json"))
+            if isinstance(target, ShardedStore):
+                target.pin_roots(roots)  # Shard by the snapshot's roots, not the ones live now
+
+            # ---- Chunks, in bulk ----
+            lines = read_lines(zf, "chunks.jsonl")
+            imported = 0
+            if dim:
+                for block in read_vectors(zf, "vectors.bin", dtype, dim, IMPORT_BATCH):
+                    rows = list(itertools.islice(lines, len(block)))
+                    if len(rows) != len(block):
+                        raise ValueError(
+                            f"Snapshot {path} is inconsistent: chunks.jsonl has {imported + len(rows)} rows, "
+                            f"vectors.bin has more"
+                        )
+                    target.insert_chunks(
+                        [row["properties"] for row in rows],
+                        block.astype(np.float32),
+                        [row["uuid"] for row in rows]
+                    )
+                    imported += len(rows)
+                    snapshot_progress["processed_chunks"] = imported
+                    if imported % (IMPORT_BATCH * 25) == 0:
+                        print(f"[SNAPSHOT] Imported {imported}/{counts['chunks']} chunks...")
+            if next(lines, None) is not None:
+                raise ValueError(f"Snapshot {path} is inconsistent: chunks.jsonl has more rows than vectors.bin ({imported})")
+            if imported != counts["chunks"]:
+                raise ValueError(f"Snapshot {path} is truncated: {imported} of {counts['chunks']} chunks")
+
+            # ---- File summaries ----
+            if counts["files"]:
+                files = list(read_lines(zf, "files.jsonl"))
+                vectors = np.concatenate(list(read_vectors(zf, "file_vectors.bin", dtype, dim, IMPORT_BATCH)))
+                for i in range(0, len(files), IMPORT_BATCH):
+                    target.insert_file_vectors(files[i:i + IMPORT_BATCH], vectors[i:i + IMPORT_BATCH].astype(np.float32))
+
+            chunk_dedup.restore_clusters(
+                target,
+                list(read_lines(zf, "dedup_clusters.jsonl")),
+                list(read_lines(zf, "dedup_refs.jsonl"))
+            )
+            indexed = list(read_lines(zf, "indexed_files.jsonl"))
+
+        actual = target.count()
+        if actual != counts["chunks"]:
+            target.close()
+            raise RuntimeError(f"Chunk count mismatch after import: {actual} != {counts['chunks']}; version {version} kept")
+
+        # ---- Flip: store version, indexed_files and roots together ----
+        conn = init_db()
+        try:
+            conn.execute("DELETE FROM indexed_files")
+            conn.executemany(
+                "INSERT INTO indexed_files (path, mtime, size, indexed_at, content_hash) VALUES (?, ?, ?, ?, ?)",
+                [tuple(row) for row in indexed]
+            )
+            conn.execute("DELETE FROM user_roots")
+            conn.executemany("INSERT OR IGNORE INTO user_roots VALUES (?)", [(root,) for root in roots])
+            save_schema_state(
+                backend, version=new_version, settings=target.applied_settings(),
+                index_params=manifest["index_params"], conn=conn
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        target.close()
+        print(f"[DONE] Imported {imported} chunks and {len(indexed)} files as schema version {new_version} "
+              f"({time.time() - start:.1f}s)")
+
+        if keep_old:
+            print(f"[INFO] Kept schema version {version}")
+        elif retire_seconds > 0:
+            # In-flight searches may still read the old version
+            retire_later(retire_seconds, drop_version, backend, version)
+        else:
+            drop_version(backend, version)
+    except Exception:
+        snapshot_progress["phase"] = "failed"
+        raise
+
+    snapshot_progress["phase"] = "complete"
+    return new_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a SAGE index snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="Write the live index to a snapshot file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--backend", choices=["weaviate", "local"], default=None)
+    export_parser.add_argument("--dtype", choices=["float16", "float32"], default=SNAPSHOT_DTYPE)
+    export_parser.add_argument("--overwrite", action="store_true", help="Replace an existing snapshot file")
+
+    import_parser = sub.add_parser("import", help="Restore a snapshot file and make it live")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--backend", choices=["weaviate", "local"], default=None)
+    import_parser.add_argument("--keep-old", action="store_true", help="Keep the previous schema version")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.path, args.backend, args.dtype, overwrite=args.overwrite)
+    else:
+        import_snapshot(args.path, args.backend, keep_old=args.keep_old)
+
+
+if __name__ == "__main__":
+    main()
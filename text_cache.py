@@ -0,0 +1,182 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Optional, Tuple
+
+# ---------------- CONFIG ----------------
+
+TEXT_CACHE_DB = "text_cache.db"  # Separate from index_state.db so blobs never slow it down
+TEXT_CACHE_MAX_MB = 512          # Compressed size budget; least recently used entries are evicted
+TEXT_CACHE_EVICT_TO = 0.9        # Evict down to this share of the budget
+TEXT_CACHE_MAX_ENTRY_MB = 32     # Texts larger than this (UTF-8 bytes, uncompressed) are not cached
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+HASH_BLOCK_SIZE = 1 << 20
+
+# --------------------------------------
+
+try:
+    import zstandard  # Optional: faster and smaller than zlib
+except ImportError:
+    zstandard = None
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+# -------- STORAGE --------
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(TEXT_CACHE_DB, timeout=30)
+    with _init_lock:
+        if not _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")  # Indexer and rebuild read/write concurrently
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS text_cache (
+                    content_hash TEXT NOT NULL,
+                    extractor TEXT NOT NULL,
+                    codec TEXT NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (content_hash, extractor)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS text_cache_lru ON text_cache(last_used)")
+            conn.commit()
+            _initialized = True
+    return conn
+
+
+def compress(raw: bytes) -> Tuple[str, bytes]:
+    """(codec, data) of UTF-8 encoded text"""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress(codec: str, data: bytes) -> Optional[str]:
+    """Decoded text, or None if the codec is unavailable here"""
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return None
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the file contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# -------- CACHE API --------
+
+def get_text(content_hash: str, extractor: str) -> Optional[str]:
+    """Cached text for a content hash, or None on a miss"""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT codec, data FROM text_cache WHERE content_hash=? AND extractor=?",
+            (content_hash, extractor)
+        ).fetchone()
+        if row is None:
+            return None
+        text = decompress(*row)
+        if text is not None:
+            conn.execute(
+                "UPDATE text_cache SET last_used=? WHERE content_hash=? AND extractor=?",
+                (time.time(), content_hash, extractor)
+            )
+            conn.commit()
+        return text
+    finally:
+        conn.close()
+
+
+def put_text(content_hash: str, extractor: str, text: str):
+    """Store extracted text (compressed); empty and oversized texts are skipped"""
+    if not text:
+        return  # Usually a failed extraction (unreadable PDF, no tesseract): retried once the cause is fixed
+    raw = text.encode("utf-8")
+    if len(raw) > TEXT_CACHE_MAX_ENTRY_MB * 1024 * 1024:
+        return
+    codec, data = compress(raw)
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "REPLACE INTO text_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, extractor, codec, len(raw), len(data), data, now, now)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_or_extract(
+    path: str,
+    extractor: str,
+    extract: Callable[[str], str],
+    content_hash: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Text of a file via the cache: (text, content_hash).
+    `extractor` identifies the extraction settings, so changing them
+    (OCR thresholds, ...) never serves stale text. Pass `content_hash` when
+    it is already known to skip hashing the file.
+    """
+    if content_hash is None:
+        content_hash = file_hash(path)
+    text = get_text(content_hash, extractor)
+    if not text:  # Miss, or an empty entry written before empty texts were skipped
+        text = extract(path)
+        put_text(content_hash, extractor, text)
+    return text, content_hash
+
+
+def evict(max_mb: float = None) -> int:
+    """Drop least recently used entries until the cache fits its budget"""
+    budget = (max_mb if max_mb is not None else TEXT_CACHE_MAX_MB) * 1024 * 1024
+    conn = _connect()
+    try:
+        total = conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM text_cache").fetchone()[0]
+        if total <= budget:
+            return 0
+
+        target = budget * TEXT_CACHE_EVICT_TO
+        removed = []
+        for content_hash, extractor, size in conn.execute(
+            "SELECT content_hash, extractor, stored_size FROM text_cache ORDER BY last_used"
+        ).fetchall():
+            if total <= target:
+                break
+            removed.append((content_hash, extractor))
+            total -= size
+
+        conn.executemany("DELETE FROM text_cache WHERE content_hash=? AND extractor=?", removed)
+        conn.commit()
+        print(f"[CACHE] Evicted {len(removed)} extracted texts ({total / 1e6:.1f} MB kept)")
+        return len(removed)
+    finally:
+        conn.close()
+
+
+def cache_stats() -> dict:
+    conn = _connect()
+    try:
+        entries, raw, stored = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM text_cache"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"entries": entries, "raw_bytes": raw, "stored_bytes": stored, "budget_bytes": TEXT_CACHE_MAX_MB * 1024 * 1024}
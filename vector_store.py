@@ -0,0 +1,1583 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+import index_db
+
+# ---------------- CONFIG ----------------
+
+CLASS_NAME = "Documents"
+FILE_CLASS_NAME = "DocumentFiles"  # One summary vector per file (two-stage search)
+
+# "weaviate" (default) or "local" (embedded, no server needed)
+VECTOR_BACKEND = os.environ.get("SAGE_VECTOR_BACKEND", "weaviate")
+
+# Weaviate vector index (applied when a collection is created; changing
+# anything but HNSW_EF needs `python migrate_index.py`)
+HNSW_EF = -1                  # Query-time candidate list size (-1 = dynamic)
+HNSW_EF_CONSTRUCTION = 128    # Build-time candidate list size
+HNSW_MAX_CONNECTIONS = 32     # Max graph edges per node
+VECTOR_COMPRESSION = "none"   # "none", "pq" (product quantization) or "bq" (binary quantization)
+PQ_SEGMENTS = 0               # PQ segments (0 = Weaviate default); must divide the vector dimension
+PQ_TRAINING_LIMIT = 100000    # Vectors used to train PQ centroids
+BQ_RESCORE_LIMIT = 200        # BQ: candidates rescored with full vectors
+
+# Per-root sharding: one collection pair (Weaviate) or store directory (local)
+# per user root; changing it needs `python migrate_index.py`
+SHARD_BY_ROOT = os.environ.get("SAGE_SHARD_BY_ROOT", "0") == "1"
+SHARD_QUERY_WORKERS = 8       # Shards queried in parallel per search
+SHARD_REFRESH_SECONDS = 2.0   # How often the shard list is re-read (other processes add shards)
+
+# Local backend
+LOCAL_STORE_DIR = "vector_store"    # Relative like index_state.db
+LOCAL_VECTOR_DTYPE = np.float16     # Vector file dtype: float16 halves disk/RAM, float32 scans faster
+LOCAL_HNSW_THRESHOLD = 50000        # Use an HNSW graph (hnswlib) at or above this many live chunks
+LOCAL_HNSW_M = 16                   # HNSW max connections per node (fixed per store)
+LOCAL_HNSW_EF_CONSTRUCTION = 200    # HNSW build-time candidate list size (fixed per store)
+LOCAL_HNSW_EF = 128                 # HNSW query-time candidate list size
+LOCAL_BLOCK_ROWS = 4096             # Rows per block in brute-force matrix search (cache-sized)
+LOCAL_COMPACT_RATIO = 0.3           # Compact vector files when this share of rows is deleted
+
+# --------------------------------------
+
+try:
+    import hnswlib  # Optional: only needed for large local indexes
+except ImportError:
+    hnswlib = None
+
+
+# -------- SHARED HELPERS --------
+
+class HitMetadata:
+    """Search metadata of a hit (mirrors Weaviate's metadata.distance)"""
+    __slots__ = ("distance",)
+
+    def __init__(self, distance: Optional[float] = None):
+        self.distance = distance
+
+
+class StoreHit:
+    """
+    A stored object returned by the local backend. Exposes the same
+    attributes search.py reads from Weaviate objects: .properties,
+    .metadata.distance, .vector and .uuid.
+    """
+    __slots__ = ("properties", "metadata", "vector", "uuid")
+
+    def __init__(self, properties: dict, distance: Optional[float] = None, vector=None, uuid=None):
+        self.properties = properties
+        self.metadata = HitMetadata(distance)
+        self.vector = vector
+        self.uuid = uuid
+
+
+def hit_vector(obj) -> Optional[List[float]]:
+    """Vector of a hit from either backend (Weaviate returns {"default": [...]})"""
+    vector = obj.vector
+    if isinstance(vector, dict):
+        vector = vector.get("default")
+    return vector
+
+
+def hit_refs(obj) -> List[str]:
+    """Every file a chunk belongs to: its `paths` refs (deduplicated chunks) or its own path"""
+    return obj.properties.get("paths") or [obj.properties.get("path", "")]
+
+
+def unit_rows(vectors) -> np.ndarray:
+    """Scale each row of a 2-D array to unit length"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def file_summary_vector(vectors) -> List[float]:
+    """Centroid of a file's (unit-normalized) chunk vectors, scaled to unit length"""
+    centroid = unit_rows(vectors).mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    if norm > 0:
+        centroid = centroid / norm
+    return centroid.tolist()
+
+
+def open_store(backend: Optional[str] = None, version: Optional[int] = None):
+    """
+    Open the configured vector store at a schema version (default: current).
+    Weaviate stores are independent connections; local stores are shared
+    per process so the indexer thread and search see the same state.
+    A version built with SHARD_BY_ROOT opens as a ShardedStore; a live
+    version without recorded settings predates sharding and opens flat.
+    """
+    backend = backend or VECTOR_BACKEND
+    state = load_schema_state(backend)
+    if version is None:
+        version = state["schema_version"]
+    if backend not in ("weaviate", "local"):
+        raise ValueError(f"Unknown vector backend: {backend}")
+
+    # The live version keeps the layout it was built with (sharding is only
+    # switched on through a rebuild); new versions use the configuration
+    sharded = SHARD_BY_ROOT
+    if version == state["schema_version"]:
+        sharded = (state["settings"] or {}).get("shard_by_root", False)
+    if sharded:
+        return ShardedStore(backend, version)
+
+    if backend == "weaviate":
+        return WeaviateStore(
+            class_name=versioned_name(CLASS_NAME, version),
+            file_class_name=versioned_name(FILE_CLASS_NAME, version),
+            version=version
+        )
+    return get_local_store(versioned_name(LOCAL_STORE_DIR, version), version)
+
+
+# -------- SCHEMA VERSION --------
+# Every migration writes into a new, versioned collection (or local store
+# directory). index_state.db records which version is live per backend,
+# together with the vector index settings it was built with.
+
+def versioned_name(base: str, version: int) -> str:
+    """Collection/directory name of a schema version (version 1 keeps the legacy name)"""
+    return base if version <= 1 else f"{base}_v{version}"
+
+
+def vector_index_settings(backend: Optional[str] = None) -> dict:
+    """Configured vector index settings that are baked into a collection/store"""
+    backend = backend or VECTOR_BACKEND
+    if backend == "local":
+        return {
+            "dtype": np.dtype(LOCAL_VECTOR_DTYPE).name,
+            "hnsw_m": LOCAL_HNSW_M,
+            "hnsw_ef_construction": LOCAL_HNSW_EF_CONSTRUCTION,
+            "shard_by_root": SHARD_BY_ROOT,
+        }
+    if VECTOR_COMPRESSION not in ("none", "pq", "bq"):
+        raise ValueError(f"Unknown VECTOR_COMPRESSION: {VECTOR_COMPRESSION}")
+    return {
+        "ef": HNSW_EF,
+        "ef_construction": HNSW_EF_CONSTRUCTION,
+        "max_connections": HNSW_MAX_CONNECTIONS,
+        "compression": VECTOR_COMPRESSION,
+        "shard_by_root": SHARD_BY_ROOT,
+    }
+
+
+def _create_schema_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+
+def load_schema_state(backend: Optional[str] = None) -> dict:
+    """
+    {"schema_version": int, "settings": dict or None, "index_params": dict or None}
+    of a backend. index_params are the embedding/chunking parameters the
+    live version was built with (see index_docs.current_index_params).
+    """
+    backend = backend or VECTOR_BACKEND
+    keys = [f"{backend}.{name}" for name in ("schema_version", "settings", "index_params")]
+    with index_db.connection() as conn:
+        _create_schema_table(conn)
+        rows = dict(conn.execute(
+            "SELECT key, value FROM schema_state WHERE key IN (?, ?, ?)", keys
+        ).fetchall())
+    return {
+        "schema_version": int(rows.get(keys[0], 1)),
+        "settings": json.loads(rows[keys[1]]) if keys[1] in rows else None,
+        "index_params": json.loads(rows[keys[2]]) if keys[2] in rows else None,
+    }
+
+
+def save_schema_state(
+    backend: str,
+    version: Optional[int] = None,
+    settings: Optional[dict] = None,
+    index_params: Optional[dict] = None,
+    conn=None
+):
+    """
+    Write the given fields in one transaction (switching version is the
+    atomic flip). With `conn` (an open index_state.db connection) the rows
+    join the caller's transaction and the caller commits.
+    """
+    values = []
+    if version is not None:
+        values.append((f"{backend}.schema_version", str(version)))
+    if settings is not None:
+        values.append((f"{backend}.settings", json.dumps(settings)))
+    if index_params is not None:
+        values.append((f"{backend}.index_params", json.dumps(index_params)))
+    if conn is not None:
+        _create_schema_table(conn)
+        conn.executemany("REPLACE INTO schema_state VALUES (?, ?)", values)
+        return
+    with index_db.transaction() as conn:
+        _create_schema_table(conn)
+        conn.executemany("REPLACE INTO schema_state VALUES (?, ?)", values)
+
+
+class SettingsRequireRebuild(ValueError):
+    """Raised by update_settings() for settings fixed when the store was built (change them with migrate_index.py)"""
+
+    def __init__(self, settings: Set[str]):
+        super().__init__(f"Settings {sorted(settings)} are fixed per store; run `python migrate_index.py` to rebuild")
+        self.settings = set(settings)
+
+
+def report_settings_drift(store):
+    """
+    Compare a store's built-in index settings with the configuration.
+    Settings the store can change in place are applied; the rest are
+    reported with a pointer to the migration command. The live version's
+    settings are recorded in index_state.db.
+    """
+    wanted = vector_index_settings(store.backend)
+    applied = store.applied_settings()
+    applied.setdefault("shard_by_root", False)
+    changed = {k for k in wanted if k in applied and applied[k] != wanted[k]}
+
+    rebuild = changed - store.MUTABLE_SETTINGS
+    in_place = changed & store.MUTABLE_SETTINGS
+    if in_place:
+        try:
+            store.update_settings({k: wanted[k] for k in in_place})
+            applied.update({k: wanted[k] for k in in_place})
+            print(f"[SCHEMA] Updated vector index settings in place: {sorted(in_place)}")
+        except SettingsRequireRebuild as e:
+            rebuild |= e.settings
+
+    if rebuild:
+        print(
+            f"[WARN] Vector index settings {sorted(rebuild)} differ from the configuration "
+            f"(built with {({k: applied[k] for k in rebuild})}); run `python migrate_index.py` to rebuild"
+        )
+
+    if load_schema_state(store.backend)["schema_version"] == store.version:
+        save_schema_state(store.backend, settings=applied)
+
+
+# -------- WEAVIATE BACKEND --------
+
+def connect_weaviate(max_retries: int = 3, retry_delay: int = 2):
+    """Connect to the local Weaviate instance, retrying briefly"""
+    import weaviate
+
+    last_error = None
+    for attempt in range(max_retries):
+        try:
+            return weaviate.connect_to_local()
+        except Exception as e:
+            last_error = e
+            if attempt < max_retries - 1:
+                print(f"⚠️ Weaviate connection attempt {attempt + 1} failed, retrying in {retry_delay}s...")
+                time.sleep(retry_delay)
+            else:
+                print(f"❌ Weaviate connection failed after {max_retries} attempts")
+    raise last_error
+
+
+class WeaviateStore:
+    """Vector store backed by a local Weaviate instance"""
+
+    backend = "weaviate"
+    MUTABLE_SETTINGS = {"ef"}  # Everything else is fixed when the collection is created
+
+    def __init__(
+        self,
+        class_name: str = CLASS_NAME,
+        file_class_name: str = FILE_CLASS_NAME,
+        version: int = 1,
+        max_retries: int = 3,
+        retry_delay: int = 2,
+        client=None,
+        shard_root: Optional[str] = None
+    ):
+        self.class_name = class_name
+        self.file_class_name = file_class_name
+        self.version = version
+        self.shard_root = shard_root  # Set for the shards of a ShardedStore
+        self.shard = shard_id(shard_root) if shard_root is not None else None
+
+        # A shared client (ShardedStore) stays open when this store closes
+        self._owns_client = client is None
+        self.client = client or connect_weaviate(max_retries, retry_delay)
+
+        self.collection = self.client.collections.get(class_name)
+        self._file_collection = None
+        self._property_names = None
+
+    # ---- Schema ----
+
+    def ensure_schema(self, file_vectors: bool = True, report_drift: bool = True):
+        """Create the chunk (and optionally file summary) collections if missing"""
+        from weaviate.collections.classes.config import Property, DataType, Configure, Tokenization
+
+        if self.class_name not in self.client.collections.list_all():
+            self.client.collections.create(
+                name=self.class_name,
+                description=self.shard_root,  # Shards record their root (see ShardedStore)
+                properties=[
+                    Property(name="file", data_type=DataType.TEXT),
+                    Property(name="path", data_type=DataType.TEXT),
+                    Property(name="chunk", data_type=DataType.TEXT),
+                    Property(name="sentence_offsets", data_type=DataType.INT_ARRAY),
+                    Property(name="sentence_vectors", data_type=DataType.BLOB),
+                    Property(name="paths", data_type=DataType.TEXT_ARRAY, tokenization=Tokenization.FIELD),
+                ],
+                vectorizer_config=Configure.Vectorizer.none(),
+                vector_index_config=self.vector_index_config(),
+            )
+            print(f"[DONE] Schema created ({self.class_name})")
+        else:
+            print("[INFO] Schema already exists")
+
+        self.collection = self.client.collections.get(self.class_name)
+        self._property_names = None
+        self.ensure_sentence_properties()
+        if report_drift:
+            report_settings_drift(self)
+
+        if file_vectors:
+            self.ensure_file_collection()
+
+    def ensure_sentence_properties(self):
+        """Add the sentence_* and paths properties to collections created before they existed"""
+        from weaviate.collections.classes.config import Property, DataType, Tokenization
+
+        existing = self.property_names()
+        if "sentence_offsets" not in existing:
+            self.collection.config.add_property(Property(name="sentence_offsets", data_type=DataType.INT_ARRAY))
+            print("[DONE] Added sentence_offsets property")
+        if "sentence_vectors" not in existing:
+            self.collection.config.add_property(Property(name="sentence_vectors", data_type=DataType.BLOB))
+            print("[DONE] Added sentence_vectors property")
+        if "paths" not in existing:
+            self.collection.config.add_property(
+                Property(name="paths", data_type=DataType.TEXT_ARRAY, tokenization=Tokenization.FIELD)
+            )
+            print("[DONE] Added paths property")
+        self._property_names = None
+
+    def ensure_file_collection(self):
+        """
+        Create the file summary collection if missing and backfill it from
+        the chunk vectors already stored (no re-embedding).
+        """
+        from weaviate.collections.classes.config import Property, DataType, Configure, Tokenization
+
+        if self.file_class_name in self.client.collections.list_all():
+            self._file_collection = self.client.collections.get(self.file_class_name)
+            return
+
+        self.client.collections.create(
+            name=self.file_class_name,
+            properties=[
+                Property(name="file", data_type=DataType.TEXT),
+                # Field tokenization so path filters match whole paths exactly
+                Property(name="path", data_type=DataType.TEXT, tokenization=Tokenization.FIELD),
+                Property(name="chunk_count", data_type=DataType.INT),
+            ],
+            vectorizer_config=Configure.Vectorizer.none(),
+        )
+        self._file_collection = self.client.collections.get(self.file_class_name)
+        print("[DONE] File summary collection created")
+
+        sums = {}  # path -> [unit vector sum, chunk count]
+        for obj in self.collection.iterator(include_vector=True, return_properties=["path"]):
+            path = obj.properties.get("path", "")
+            vector = hit_vector(obj)
+            if not path or vector is None:
+                continue
+            vec = unit_rows(vector)[0]
+            if path in sums:
+                sums[path][0] += vec
+                sums[path][1] += 1
+            else:
+                sums[path] = [vec, 1]
+
+        for path, (total, count) in sums.items():
+            self.upsert_file_vector(path, [total / count], count)
+        if sums:
+            print(f"[DONE] Backfilled {len(sums)} file summary vectors")
+
+    def property_names(self) -> Set[str]:
+        """Names of the properties defined on the chunk collection"""
+        if self._property_names is None:
+            self._property_names = {p.name for p in self.collection.config.get().properties}
+        return self._property_names
+
+    @staticmethod
+    def vector_index_config():
+        """HNSW config (with optional PQ/BQ compression) from the CONFIG block"""
+        from weaviate.collections.classes.config import Configure
+
+        quantizer = None
+        if VECTOR_COMPRESSION == "pq":
+            quantizer = Configure.VectorIndex.Quantizer.pq(
+                segments=PQ_SEGMENTS or None,
+                training_limit=PQ_TRAINING_LIMIT
+            )
+        elif VECTOR_COMPRESSION == "bq":
+            quantizer = Configure.VectorIndex.Quantizer.bq(rescore_limit=BQ_RESCORE_LIMIT)
+        elif VECTOR_COMPRESSION != "none":
+            raise ValueError(f"Unknown VECTOR_COMPRESSION: {VECTOR_COMPRESSION}")
+
+        return Configure.VectorIndex.hnsw(
+            ef=HNSW_EF,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            max_connections=HNSW_MAX_CONNECTIONS,
+            quantizer=quantizer
+        )
+
+    def applied_settings(self) -> dict:
+        """Vector index settings the chunk collection actually has"""
+        index = self.collection.config.get().vector_index_config
+        quantizer = getattr(index, "quantizer", None)
+        compression = "none"
+        if quantizer is not None:
+            # _PQConfig -> "pq", _BQConfig -> "bq"
+            compression = type(quantizer).__name__.strip("_").replace("Config", "").lower()
+        return {
+            "ef": index.ef,
+            "ef_construction": index.ef_construction,
+            "max_connections": index.max_connections,
+            "compression": compression,
+            "shard_by_root": self.shard is not None,
+        }
+
+    def update_settings(self, settings: dict):
+        """Apply mutable settings (ef) to the live collection"""
+        from weaviate.classes.config import Reconfigure
+
+        self.collection.config.update(
+            vector_index_config=Reconfigure.VectorIndex.hnsw(ef=settings["ef"])
+        )
+
+    def count(self) -> int:
+        """Number of stored chunks"""
+        return self.collection.aggregate.over_all(total_count=True).total_count
+
+    def drop(self):
+        """Delete this version's collections"""
+        for name in (self.class_name, self.file_class_name):
+            if self.client.collections.exists(name):
+                self.client.collections.delete(name)
+        self._file_collection = None
+
+    def has_file_vectors(self) -> bool:
+        """True once the file summary collection exists"""
+        if self._file_collection is None:
+            if not self.client.collections.exists(self.file_class_name):
+                return False
+            self._file_collection = self.client.collections.get(self.file_class_name)
+        return True
+
+    # ---- Writes ----
+
+    def delete_path(self, path: str):
+        """Remove every chunk (and the file summary) of one file"""
+        from weaviate.collections.classes.filters import Filter
+
+        self.collection.data.delete_many(
+            where=Filter.by_property("path").equal(path)
+        )
+        if self.has_file_vectors():
+            self._file_collection.data.delete_many(
+                where=Filter.by_property("path").equal(path)
+            )
+
+    def insert_chunks(self, properties: List[dict], vectors, uids: Optional[List[str]] = None):
+        """Insert chunk objects with their vectors (and optional fixed uuids)"""
+        from weaviate.classes.data import DataObject
+
+        uids = uids or [None] * len(properties)
+        result = self.collection.data.insert_many([
+            DataObject(properties=props, vector=list(map(float, vec)), uuid=uid)
+            for props, vec, uid in zip(properties, vectors, uids)
+        ])
+        if result.has_errors:
+            first = next(iter(result.errors.values()))
+            raise RuntimeError(f"Failed to insert {len(result.errors)} chunk(s): {first.message}")
+
+    def update_chunk(self, uid: str, properties: dict):
+        """Change properties of one chunk object (its vector is kept)"""
+        self.collection.data.update(uuid=uid, properties=properties)
+
+    def upsert_file_vector(self, path: str, vectors, chunk_count: int):
+        """Replace the summary object of one file"""
+        from weaviate.collections.classes.filters import Filter
+
+        if not self.has_file_vectors():
+            return
+        self._file_collection.data.delete_many(
+            where=Filter.by_property("path").equal(path)
+        )
+        self._file_collection.data.insert(
+            properties={
+                "file": os.path.basename(path),
+                "path": path,
+                "chunk_count": chunk_count,
+            },
+            vector=file_summary_vector(vectors),
+        )
+
+    def insert_file_vectors(self, properties: List[dict], vectors):
+        """Bulk-insert file summaries ({"path", "chunk_count"}) whose vectors are already centroids"""
+        from weaviate.classes.data import DataObject
+
+        if not properties or not self.has_file_vectors():
+            return
+        result = self._file_collection.data.insert_many([
+            DataObject(
+                properties={
+                    "file": os.path.basename(props["path"]),
+                    "path": props["path"],
+                    "chunk_count": props.get("chunk_count") or 0,
+                },
+                vector=list(map(float, vec))
+            )
+            for props, vec in zip(properties, vectors)
+        ])
+        if result.has_errors:
+            first = next(iter(result.errors.values()))
+            raise RuntimeError(f"Failed to insert {len(result.errors)} file summaries: {first.message}")
+
+    # ---- Reads ----
+
+    def query(
+        self,
+        vector: List[float],
+        limit: int,
+        offset: int = 0,
+        return_properties: Optional[List[str]] = None,
+        paths: Optional[List[str]] = None,
+        group_by_path: Optional[Tuple[int, int]] = None,
+        roots: Optional[List[str]] = None
+    ):
+        """
+        Nearest chunks to `vector`, closest first.
+        paths restricts hits to chunks of those exact file paths (own path
+        or `paths` refs); group_by_path is (number_of_files,
+        chunks_per_file) for Weaviate's native group-by. roots only selects
+        shards (ShardedStore); callers still scope hits themselves.
+        """
+        from weaviate.classes.query import GroupBy, Filter
+
+        if group_by_path is not None:
+            number_of_groups, objects_per_group = group_by_path
+            results = self.collection.query.near_vector(
+                near_vector=vector,
+                group_by=GroupBy(
+                    prop="path",
+                    objects_per_group=objects_per_group,
+                    number_of_groups=number_of_groups
+                ),
+                return_metadata=["distance"],
+                return_properties=return_properties
+            )
+            return results.objects
+
+        filters = None
+        if paths:
+            conditions = [Filter.by_property("path").equal(p) for p in paths]
+            if "paths" in self.property_names():
+                conditions.append(Filter.by_property("paths").contains_any(paths))
+                if return_properties is not None and "paths" not in return_properties:
+                    return_properties = list(return_properties) + ["paths"]
+            filters = Filter.any_of(conditions)
+
+        results = self.collection.query.near_vector(
+            near_vector=vector,
+            limit=limit,
+            offset=offset or None,
+            filters=filters,
+            return_metadata=["distance"],
+            return_properties=return_properties
+        )
+        objects = results.objects
+        if paths:
+            # Text filters on the chunk collection are token-based; keep exact paths only
+            wanted = set(paths)
+            objects = [obj for obj in objects if wanted.intersection(hit_refs(obj))]
+        return objects
+
+    def query_files(self, vector: List[float], limit: int, roots: Optional[List[str]] = None):
+        """Nearest file summaries to `vector`"""
+        if not self.has_file_vectors():
+            return []
+        return self._file_collection.query.near_vector(
+            near_vector=vector,
+            limit=limit,
+            return_metadata=["distance"],
+            return_properties=["path", "file"]
+        ).objects
+
+    def iterate(self, return_properties: Optional[List[str]] = None, include_vector: bool = False):
+        """Iterate over every stored chunk"""
+        return self.collection.iterator(
+            include_vector=include_vector,
+            return_properties=return_properties
+        )
+
+    def iterate_files(self):
+        """Iterate over file summaries (with vectors and chunk_count)"""
+        if not self.has_file_vectors():
+            return iter(())
+        return self._file_collection.iterator(
+            include_vector=True,
+            return_properties=["path", "file", "chunk_count"]
+        )
+
+    def close(self):
+        if self._owns_client:
+            self.client.close()
+
+
+# -------- LOCAL BACKEND --------
+
+CHUNK_COLUMNS = "row, path, file, chunk, sentence_offsets, sentence_vectors, paths, uid"
+CHUNK_PROPERTY_NAMES = ("file", "path", "chunk", "sentence_offsets", "sentence_vectors", "paths")
+
+def chunk_properties(record: tuple, return_properties: Optional[List[str]] = None) -> dict:
+    """Chunk properties from a CHUNK_COLUMNS row"""
+    _, path, file, chunk, offsets, blob, paths, _ = record
+    props = {"path": path, "file": file, "chunk": chunk}
+    if offsets is not None:
+        props["sentence_offsets"] = json.loads(offsets)
+    if blob is not None:
+        props["sentence_vectors"] = blob
+    if paths is not None:
+        props["paths"] = json.loads(paths)
+    if return_properties is not None:
+        props = {k: v for k, v in props.items() if k in return_properties}
+    return props
+
+
+def row_refs(path: str, paths: Optional[str]) -> List[str]:
+    """Files a chunk row belongs to (`paths` column is JSON, NULL for unshared chunks)"""
+    return json.loads(paths) if paths else [path]
+
+
+class LocalStore:
+    """
+    Embedded vector store: unit vectors in memory-mapped files, properties
+    in SQLite. Queries are a blocked brute-force matrix product for small
+    corpora, or an HNSW graph (hnswlib, optional) at LOCAL_HNSW_THRESHOLD
+    live chunks and above. Deletes are tombstones until compact().
+    Safe for concurrent use by threads of one process; a single writer
+    process is assumed.
+    """
+
+    backend = "local"
+    MUTABLE_SETTINGS: Set[str] = set()  # dtype and graph parameters are fixed per store
+
+    def __init__(self, directory: str = LOCAL_STORE_DIR, dtype=None, version: int = 1):
+        self.directory = directory
+        self.version = version
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "meta.db"), timeout=30, check_same_thread=False
+        )
+        self._init_db()
+
+        # Settings are fixed by the first write; an existing store keeps its own
+        self.dtype = np.dtype(self._meta("dtype", np.dtype(dtype or LOCAL_VECTOR_DTYPE).name))
+        self.hnsw_m = self._meta("hnsw_m", LOCAL_HNSW_M)
+        self.hnsw_ef_construction = self._meta("hnsw_ef_construction", LOCAL_HNSW_EF_CONSTRUCTION)
+        self.shard_root = self._meta("shard_root")  # Set for the shards of a ShardedStore
+        self.shard = shard_id(self.shard_root) if self.shard_root is not None else None
+
+        # In-memory view of chunk rows, refreshed when the store version changes
+        self._loaded_version = None
+        self._loaded_epoch = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_paths: List[Optional[str]] = []
+        self._rows_by_path: Dict[str, List[int]] = {}
+        self._matrix = None
+        self._hnsw = None
+        self._hnsw_rows = 0
+
+        self._file_version = None
+        self._file_rows: List[Tuple[int, str, str]] = []
+        self._file_matrix = None
+
+    # ---- Storage ----
+
+    def _init_db(self):
+        cur = self._conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                file TEXT NOT NULL,
+                chunk TEXT NOT NULL,
+                sentence_offsets TEXT,
+                sentence_vectors TEXT,
+                deleted_version INTEGER
+            )
+        """)
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(chunks)")}
+        for column in ("paths", "uid"):
+            if column not in columns:
+                cur.execute(f"ALTER TABLE chunks ADD COLUMN {column} TEXT")
+        cur.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path)")
+        cur.execute("CREATE INDEX IF NOT EXISTS chunks_uid ON chunks(uid)")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _meta(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM store_meta WHERE key=?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("REPLACE INTO store_meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _bump_version(self) -> int:
+        version = self._meta("version", 0) + 1
+        self._set_meta("version", version)
+        return version
+
+    def _vector_path(self) -> str:
+        return os.path.join(self.directory, "chunks.vec")
+
+    def _hnsw_path(self) -> str:
+        return os.path.join(self.directory, "chunks.hnsw")
+
+    def _dim(self) -> Optional[int]:
+        return self._meta("dim")
+
+    def _row_count(self) -> int:
+        dim = self._dim()
+        path = self._vector_path()
+        if not dim or not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (dim * self.dtype.itemsize)
+
+    # ---- Schema ----
+
+    def ensure_schema(self, file_vectors: bool = True, report_drift: bool = True):
+        """Tables are created on open; only settings drift is reported"""
+        if report_drift:
+            print(f"[INFO] Local vector store at {os.path.abspath(self.directory)}")
+            report_settings_drift(self)
+
+    def set_shard_root(self, root: str):
+        """Record the user root this store is the shard of"""
+        with self._lock:
+            self._set_meta("shard_root", root)
+            self._conn.commit()
+            self.shard_root = root
+            self.shard = shard_id(root)
+
+    def property_names(self) -> Set[str]:
+        return set(CHUNK_PROPERTY_NAMES)
+
+    def applied_settings(self) -> dict:
+        return {
+            "dtype": self.dtype.name,
+            "hnsw_m": self.hnsw_m,
+            "hnsw_ef_construction": self.hnsw_ef_construction,
+            "shard_by_root": self.shard is not None,
+        }
+
+    def update_settings(self, settings: dict):
+        """
+        Nothing can change in place (MUTABLE_SETTINGS is empty): settings
+        equal to the built ones are a no-op, differing ones raise
+        SettingsRequireRebuild (rebuild with migrate_index.py).
+        """
+        applied = self.applied_settings()
+        unknown = set(settings) - set(applied)
+        if unknown:
+            raise ValueError(f"Unknown local store settings: {sorted(unknown)}")
+        fixed = {k for k, v in settings.items() if applied[k] != v}
+        if fixed:
+            raise SettingsRequireRebuild(fixed)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM chunks WHERE deleted_version IS NULL"
+            ).fetchone()[0]
+
+    def drop(self):
+        """Delete this store's files (the instance is unusable afterwards)"""
+        import shutil
+
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+            self._hnsw = None
+            self._matrix = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+        with _local_store_lock:
+            _local_stores.pop(self.directory, None)
+
+    def has_file_vectors(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is not None
+
+    # ---- Writes ----
+
+    def delete_path(self, path: str):
+        with self._lock:
+            version = self._bump_version()
+            self._conn.execute(
+                "UPDATE chunks SET deleted_version=? WHERE path=? AND deleted_version IS NULL",
+                (version, path)
+            )
+            self._conn.execute("DELETE FROM files WHERE path=?", (path,))
+            self._conn.commit()
+
+    def insert_chunks(self, properties: List[dict], vectors, uids: Optional[List[str]] = None):
+        if not properties:
+            return
+        with self._lock:
+            self._append(properties, unit_rows(vectors), uids)
+            self._bump_version()
+            self._conn.commit()
+
+    def _append(self, properties: List[dict], matrix: np.ndarray, uids: Optional[List[str]]):
+        """Append rows (vectors, then properties); the caller bumps the version and commits"""
+        import uuid
+
+        dim = self._dim()
+        if dim is None:
+            dim = matrix.shape[1]
+            self._set_meta("dim", dim)
+            self._set_meta("dtype", self.dtype.name)
+            self._set_meta("hnsw_m", self.hnsw_m)
+            self._set_meta("hnsw_ef_construction", self.hnsw_ef_construction)
+        elif dim != matrix.shape[1]:
+            raise ValueError(f"Vector dimension {matrix.shape[1]} does not match store dimension {dim}")
+
+        # Vectors first: rows past the committed table are simply ignored
+        first_row = self._row_count()
+        with open(self._vector_path(), "ab") as f:
+            f.write(matrix.astype(self.dtype).tobytes())
+
+        uids = uids or [None] * len(properties)
+        self._conn.executemany(
+            "INSERT INTO chunks (row, path, file, chunk, sentence_offsets, sentence_vectors, paths, uid) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    first_row + i,
+                    props.get("path", ""),
+                    props.get("file", ""),
+                    props.get("chunk", ""),
+                    json.dumps(props["sentence_offsets"]) if props.get("sentence_offsets") is not None else None,
+                    props.get("sentence_vectors"),
+                    json.dumps(props["paths"]) if props.get("paths") else None,
+                    uid or str(uuid.uuid4()),
+                )
+                for i, (props, uid) in enumerate(zip(properties, uids))
+            ]
+        )
+
+    def update_chunk(self, uid: str, properties: dict):
+        """
+        Change properties of one chunk. Rows are append-only, so the row is
+        tombstoned and re-appended with the same vector and uid.
+        """
+        with self._lock:
+            record = self._conn.execute(
+                f"SELECT {CHUNK_COLUMNS} FROM chunks WHERE uid=? AND deleted_version IS NULL", (uid,)
+            ).fetchone()
+            if record is None:
+                return
+            row = record[0]
+            props = chunk_properties(record)
+            props.update(properties)
+            vectors = np.memmap(self._vector_path(), dtype=self.dtype, mode="r", shape=(self._row_count(), self._dim()))
+            vector = np.asarray(vectors[row:row + 1], dtype=np.float32)
+            del vectors
+
+            version = self._bump_version()
+            self._conn.execute("UPDATE chunks SET deleted_version=? WHERE row=?", (version, row))
+            self._append([props], vector, [uid])
+            self._conn.commit()
+
+    def upsert_file_vector(self, path: str, vectors, chunk_count: int):
+        vector = np.asarray(file_summary_vector(vectors), dtype=np.float32)
+        with self._lock:
+            self._conn.execute(
+                "REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (path, os.path.basename(path), chunk_count, vector.tobytes())
+            )
+            self._bump_version()
+            self._conn.commit()
+
+    def insert_file_vectors(self, properties: List[dict], vectors):
+        """Bulk-insert file summaries ({"path", "chunk_count"}) whose vectors are already centroids"""
+        if not properties:
+            return
+        matrix = unit_rows(vectors)
+        with self._lock:
+            self._conn.executemany(
+                "REPLACE INTO files VALUES (?, ?, ?, ?)",
+                [
+                    (props["path"], os.path.basename(props["path"]), props.get("chunk_count") or 0, vec.tobytes())
+                    for props, vec in zip(properties, matrix)
+                ]
+            )
+            self._bump_version()
+            self._conn.commit()
+
+    def compact(self):
+        """Rewrite the vector file without deleted rows and renumber rows"""
+        with self._lock:
+            total = self._row_count()
+            if total == 0:
+                return
+            alive_rows = [r for (r,) in self._conn.execute(
+                "SELECT row FROM chunks WHERE deleted_version IS NULL ORDER BY row"
+            )]
+            if total - len(alive_rows) < total * LOCAL_COMPACT_RATIO:
+                return
+
+            dim = self._dim()
+            source = np.memmap(self._vector_path(), dtype=self.dtype, mode="r", shape=(total, dim))
+            tmp_path = self._vector_path() + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(alive_rows), LOCAL_BLOCK_ROWS):
+                    f.write(np.asarray(source[alive_rows[start:start + LOCAL_BLOCK_ROWS]]).tobytes())
+            del source
+
+            cur = self._conn.cursor()
+            cur.execute("DELETE FROM chunks WHERE deleted_version IS NOT NULL")
+            cur.execute("CREATE TEMP TABLE row_map (old INTEGER PRIMARY KEY, new INTEGER)")
+            cur.executemany("INSERT INTO row_map VALUES (?, ?)", [(old, new) for new, old in enumerate(alive_rows)])
+            # Shift out of the way first so renumbering never collides
+            cur.execute("UPDATE chunks SET row = -row - 1")
+            cur.execute("UPDATE chunks SET row = (SELECT new FROM row_map WHERE old = -chunks.row - 1)")
+            cur.execute("DROP TABLE row_map")
+            self._set_meta("epoch", self._meta("epoch", 0) + 1)
+            self._bump_version()
+            os.replace(tmp_path, self._vector_path())
+            self._conn.commit()
+
+            if os.path.exists(self._hnsw_path()):
+                os.remove(self._hnsw_path())
+            self._hnsw = None
+            self._loaded_version = None
+            print(f"[DONE] Compacted local vector store: {total} → {len(alive_rows)} rows")
+
+    # ---- In-memory view ----
+
+    def _refresh(self):
+        """Bring the in-memory row view up to date with the store version"""
+        version = self._meta("version", 0)
+        if version == self._loaded_version:
+            return
+
+        epoch = self._meta("epoch", 0)
+        total = self._row_count()
+        full_reload = epoch != self._loaded_epoch
+
+        if full_reload:
+            alive = np.zeros(total, dtype=bool)
+            row_paths: List[Optional[str]] = [None] * total
+            rows_by_path: Dict[str, List[int]] = {}
+            for row, path, paths in self._conn.execute(
+                "SELECT row, path, paths FROM chunks WHERE deleted_version IS NULL"
+            ):
+                if row < total:
+                    alive[row] = True
+                    row_paths[row] = path
+                    for ref in row_refs(path, paths):
+                        rows_by_path.setdefault(ref, []).append(row)
+            self._hnsw = None
+        else:
+            alive = np.zeros(total, dtype=bool)
+            alive[:len(self._alive)] = self._alive[:total]
+            row_paths = self._row_paths + [None] * (total - len(self._row_paths))
+            rows_by_path = self._rows_by_path
+            loaded_rows = len(self._alive)
+            for row, path, paths in self._conn.execute(
+                "SELECT row, path, paths FROM chunks WHERE row >= ? AND deleted_version IS NULL", (loaded_rows,)
+            ):
+                if row < total:
+                    alive[row] = True
+                    row_paths[row] = path
+                    for ref in row_refs(path, paths):
+                        rows_by_path.setdefault(ref, []).append(row)
+            for row, path, paths in self._conn.execute(
+                "SELECT row, path, paths FROM chunks WHERE deleted_version > ?", (self._loaded_version or 0,)
+            ):
+                if row < total and alive[row]:
+                    alive[row] = False
+                    for ref in row_refs(path, paths):
+                        rows = rows_by_path.get(ref)
+                        if rows and row in rows:
+                            rows.remove(row)
+                            if not rows:
+                                del rows_by_path[ref]
+                    if self._hnsw is not None and row < self._hnsw_rows:
+                        try:
+                            self._hnsw.mark_deleted(row)
+                        except RuntimeError:
+                            pass
+
+        dim = self._dim()
+        self._matrix = (
+            np.memmap(self._vector_path(), dtype=self.dtype, mode="r", shape=(total, dim))
+            if total and dim else None
+        )
+        self._alive = alive
+        self._row_paths = row_paths
+        self._rows_by_path = rows_by_path
+        self._loaded_version = version
+        self._loaded_epoch = epoch
+
+        if self._hnsw is not None and self._hnsw_rows < total:
+            self._hnsw_add(self._hnsw_rows, total)
+
+    def _use_hnsw(self) -> bool:
+        return hnswlib is not None and int(self._alive.sum()) >= LOCAL_HNSW_THRESHOLD
+
+    def _ensure_hnsw(self):
+        """Load or build the HNSW graph over the current rows"""
+        if self._hnsw is not None:
+            return
+        total = len(self._alive)
+        dim = self._dim()
+        index = hnswlib.Index(space="ip", dim=dim)
+
+        saved = self._meta("hnsw")
+        if saved and saved.get("epoch") == self._loaded_epoch and os.path.exists(self._hnsw_path()):
+            index.load_index(self._hnsw_path(), max_elements=max(total, 1))
+            self._hnsw, self._hnsw_rows = index, min(saved["rows"], total)
+            for row in np.flatnonzero(~self._alive[:self._hnsw_rows]):
+                try:
+                    index.mark_deleted(int(row))
+                except RuntimeError:
+                    pass
+        else:
+            index.init_index(max_elements=max(total, 1), ef_construction=self.hnsw_ef_construction, M=self.hnsw_m)
+            self._hnsw, self._hnsw_rows = index, 0
+            print(f"[INDEX] Building local HNSW graph over {total} rows...")
+
+        index.set_ef(LOCAL_HNSW_EF)
+        self._hnsw_add(self._hnsw_rows, total)
+
+    def _hnsw_add(self, start: int, end: int):
+        """Add rows [start, end) to the HNSW graph (dead rows added then marked)"""
+        if end <= start:
+            return
+        self._hnsw.resize_index(max(end, self._hnsw.get_max_elements()))
+        for block in range(start, end, LOCAL_BLOCK_ROWS):
+            stop = min(block + LOCAL_BLOCK_ROWS, end)
+            labels = np.arange(block, stop)
+            self._hnsw.add_items(np.asarray(self._matrix[block:stop], dtype=np.float32), labels)
+            for row in labels[~self._alive[block:stop]]:
+                self._hnsw.mark_deleted(int(row))
+        self._hnsw_rows = end
+
+    def _save_hnsw(self):
+        if self._hnsw is None:
+            return
+        self._hnsw.save_index(self._hnsw_path())
+        self._set_meta("hnsw", {"epoch": self._loaded_epoch, "rows": self._hnsw_rows})
+        self._conn.commit()
+
+    def _brute_force_distances(self, query: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Cosine distance to every row (inf where masked out), in row blocks"""
+        distances = np.full(len(mask), np.inf, dtype=np.float32)
+        for start in range(0, len(mask), LOCAL_BLOCK_ROWS):
+            stop = min(start + LOCAL_BLOCK_ROWS, len(mask))
+            block_mask = mask[start:stop]
+            if not block_mask.any():
+                continue
+            scores = np.asarray(self._matrix[start:stop], dtype=np.float32) @ query
+            distances[start:stop] = np.where(block_mask, 1 - scores, np.inf)
+        return distances
+
+    def _load_hits(self, rows: List[int], distances: List[float], return_properties) -> List[StoreHit]:
+        if not rows:
+            return []
+        fetched = {}
+        for start in range(0, len(rows), 500):
+            part = rows[start:start + 500]
+            for record in self._conn.execute(
+                f"SELECT {CHUNK_COLUMNS} FROM chunks WHERE row IN ({','.join('?' * len(part))})", part
+            ):
+                fetched[record[0]] = (chunk_properties(record, return_properties), record[-1])
+        return [
+            StoreHit(fetched[row][0], float(dist), uuid=fetched[row][1])
+            for row, dist in zip(rows, distances) if row in fetched
+        ]
+
+    # ---- Reads ----
+
+    def query(
+        self,
+        vector: List[float],
+        limit: int,
+        offset: int = 0,
+        return_properties: Optional[List[str]] = None,
+        paths: Optional[List[str]] = None,
+        group_by_path: Optional[Tuple[int, int]] = None,
+        roots: Optional[List[str]] = None
+    ) -> List[StoreHit]:
+        """Nearest chunks to `vector`, closest first (same contract as WeaviateStore.query)"""
+        with self._lock:
+            self._refresh()
+            if self._matrix is None or not self._alive.any():
+                return []
+            query = unit_rows(vector)[0]
+
+            mask = self._alive
+            if paths:
+                mask = np.zeros(len(self._alive), dtype=bool)
+                for path in paths:
+                    rows = self._rows_by_path.get(path)
+                    if rows:
+                        mask[rows] = True
+
+            if group_by_path is None and not paths and self._use_hnsw():
+                self._ensure_hnsw()
+                k = min(offset + limit, int(self._alive.sum()))
+                # "ip" space already reports 1 - dot product, i.e. cosine distance
+                labels, hnsw_distances = self._hnsw.knn_query(query.reshape(1, -1), k=k)
+                rows = [int(r) for r in labels[0]][offset:]
+                distances = [float(d) for d in hnsw_distances[0]][offset:]
+                return self._load_hits(rows, distances, return_properties)
+
+            distances = self._brute_force_distances(query, mask)
+            candidates = int(np.isfinite(distances).sum())
+
+            if group_by_path is not None:
+                number_of_groups, objects_per_group = group_by_path
+                order = np.argsort(distances[np.isfinite(distances)], kind="stable")
+                finite_rows = np.flatnonzero(np.isfinite(distances))[order]
+                per_path: Dict[str, int] = {}
+                rows = []
+                for row in finite_rows:
+                    path = self._row_paths[row]
+                    count = per_path.get(path, 0)
+                    if count == 0 and len(per_path) >= number_of_groups:
+                        continue
+                    if count < objects_per_group:
+                        per_path[path] = count + 1
+                        rows.append(int(row))
+                return self._load_hits(rows, [distances[r] for r in rows], return_properties)
+
+            k = min(offset + limit, candidates)
+            if k <= 0:
+                return []
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top], kind="stable")][offset:]
+            rows = [int(r) for r in top]
+            return self._load_hits(rows, [distances[r] for r in rows], return_properties)
+
+    def query_files(self, vector: List[float], limit: int, roots: Optional[List[str]] = None) -> List[StoreHit]:
+        """Nearest file summaries (brute force; one row per file)"""
+        with self._lock:
+            version = self._meta("version", 0)
+            if version != self._file_version:
+                rows = self._conn.execute("SELECT path, file, vector FROM files").fetchall()
+                self._file_rows = [(path, file) for path, file, _ in rows]
+                self._file_matrix = (
+                    np.vstack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])
+                    if rows else None
+                )
+                self._file_version = version
+            if self._file_matrix is None:
+                return []
+            distances = 1 - self._file_matrix @ unit_rows(vector)[0]
+            order = np.argsort(distances, kind="stable")[:limit]
+            return [
+                StoreHit({"path": self._file_rows[i][0], "file": self._file_rows[i][1]}, float(distances[i]))
+                for i in order
+            ]
+
+    def iterate(
+        self,
+        return_properties: Optional[List[str]] = None,
+        include_vector: bool = False
+    ) -> Iterator[StoreHit]:
+        """Iterate over every live chunk"""
+        with self._lock:
+            self._refresh()
+            records = self._conn.execute(
+                f"SELECT {CHUNK_COLUMNS} FROM chunks WHERE deleted_version IS NULL ORDER BY row"
+            ).fetchall()
+            matrix = self._matrix
+        for record in records:
+            row = record[0]
+            vector = None
+            if include_vector and matrix is not None and row < len(matrix):
+                vector = np.asarray(matrix[row], dtype=np.float32).tolist()
+            yield StoreHit(chunk_properties(record, return_properties), None, vector, record[-1])
+
+    def iterate_files(self) -> Iterator[StoreHit]:
+        """Iterate over file summaries (with vectors and chunk_count)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, file, chunk_count, vector FROM files").fetchall()
+        for path, file, chunk_count, blob in rows:
+            yield StoreHit(
+                {"path": path, "file": file, "chunk_count": chunk_count},
+                None,
+                np.frombuffer(blob, dtype=np.float32).tolist()
+            )
+
+    def close(self):
+        """Persist the HNSW graph; the shared store itself stays open"""
+        with self._lock:
+            if self._conn is None:
+                return  # Dropped
+            self.compact()
+            self._save_hnsw()
+
+
+_local_stores: Dict[str, LocalStore] = {}
+_local_store_lock = threading.Lock()
+
+def get_local_store(directory: str = LOCAL_STORE_DIR, version: int = 1) -> LocalStore:
+    """Process-wide LocalStore instance per directory"""
+    with _local_store_lock:
+        if directory not in _local_stores:
+            _local_stores[directory] = LocalStore(directory, version=version)
+        return _local_stores[directory]
+
+
+# -------- PER-ROOT SHARDS --------
+# With SHARD_BY_ROOT every user root gets its own store: a collection pair
+# "<Documents>_<shard>" in Weaviate (the collection description holds the
+# root) or a local store directory "<vector_store>/shards/<shard>" (root in
+# store_meta). Scoped searches only query the shards of the searched roots,
+# and removing a root drops its shard instead of deleting file by file.
+
+def shard_id(root: str) -> str:
+    """Stable shard name of a root ("" = files outside every root)"""
+    if not root:
+        return "Runrooted"
+    return "R" + hashlib.sha1(os.path.normpath(root).encode("utf-8")).hexdigest()[:16]
+
+
+def path_in_root(path: str, root: str) -> bool:
+    if not root:
+        return True
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+_shard_executor = None
+_shard_executor_lock = threading.Lock()
+
+def shard_executor() -> ThreadPoolExecutor:
+    global _shard_executor
+    with _shard_executor_lock:
+        if _shard_executor is None:
+            _shard_executor = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="sage-shard")
+        return _shard_executor
+
+
+class ShardedStore:
+    """
+    Per-root shards behind the common store interface. Writes go to the
+    shard of the innermost root containing the path; queries fan out in
+    parallel to the shards the searched roots touch and are merged by
+    distance.
+    """
+
+    shard = None
+
+    def __init__(self, backend: str, version: int):
+        self.backend = backend
+        self.version = version
+        self.MUTABLE_SETTINGS = WeaviateStore.MUTABLE_SETTINGS if backend == "weaviate" else LocalStore.MUTABLE_SETTINGS
+
+        self._lock = threading.RLock()
+        self._shards: Dict[str, object] = {}  # root -> store
+        self._user_roots: List[str] = []
+        self._pinned_roots: Optional[List[str]] = None  # pin_roots(): used instead of index_db.user_roots()
+        self._refreshed = 0.0
+        self._file_vectors = True
+        self._client = connect_weaviate() if backend == "weaviate" else None
+        self._refresh(max_age=0)
+
+    # ---- Shard registry ----
+
+    def _shard_dir(self) -> str:
+        return os.path.join(versioned_name(LOCAL_STORE_DIR, self.version), "shards")
+
+    def _open_shard(self, root: str):
+        shard = shard_id(root)
+        if self.backend == "weaviate":
+            return WeaviateStore(
+                class_name=f"{versioned_name(CLASS_NAME, self.version)}_{shard}",
+                file_class_name=f"{versioned_name(FILE_CLASS_NAME, self.version)}_{shard}",
+                version=self.version,
+                client=self._client,
+                shard_root=root
+            )
+        store = get_local_store(os.path.join(self._shard_dir(), shard), self.version)
+        if store.shard_root is None:
+            store.set_shard_root(root)
+        return store
+
+    def _discover(self) -> Dict[str, object]:
+        """Shards that exist in storage: root -> store"""
+        found = {}
+        if self.backend == "weaviate":
+            prefix = f"{versioned_name(CLASS_NAME, self.version)}_R"
+            for name, config in self._client.collections.list_all(simple=False).items():
+                if name.startswith(prefix) and config.description is not None:
+                    root = config.description
+                    found[root] = self._shards.get(root) or self._open_shard(root)
+        elif os.path.isdir(self._shard_dir()):
+            for entry in os.listdir(self._shard_dir()):
+                store = get_local_store(os.path.join(self._shard_dir(), entry), self.version)
+                if store.shard_root is not None:
+                    found[store.shard_root] = store
+        return found
+
+    def _refresh(self, max_age: float = SHARD_REFRESH_SECONDS):
+        """Re-read shards and user roots (other processes add both)"""
+        now = time.monotonic()
+        if now - self._refreshed < max_age:
+            return
+        with self._lock:
+            self._shards = self._discover()
+            roots = self._pinned_roots if self._pinned_roots is not None else index_db.user_roots()
+            self._user_roots = [os.path.normpath(r) for r in roots]
+            self._refreshed = now
+
+    def pin_roots(self, roots: List[str]):
+        """Route writes by `roots` instead of the configured roots (snapshot import: its roots go live at the flip)"""
+        self._pinned_roots = list(roots)
+        self._refresh(max_age=0)
+
+    def roots_of(self, path: str) -> List[str]:
+        """Known roots containing `path`, innermost first"""
+        with self._lock:
+            roots = set(self._shards) | set(self._user_roots)
+        return sorted((r for r in roots if path_in_root(path, r)), key=len, reverse=True)
+
+    def root_for(self, path: str) -> str:
+        """Root whose shard holds `path`"""
+        self._refresh()
+        roots = self.roots_of(path)
+        if not roots or roots[0] == "":
+            self._refresh(max_age=0.5)  # Possibly a root added since the last refresh
+            roots = self.roots_of(path)
+        return roots[0] if roots else ""
+
+    def shard_for(self, path: str, create: bool = True):
+        """Store of the shard holding `path` (None if it does not exist and create is False)"""
+        return self.shard_of(self.root_for(path), create)
+
+    def shard_of(self, root: str, create: bool = True):
+        with self._lock:
+            store = self._shards.get(root)
+            if store is None and create:
+                store = self._open_shard(root)
+                store.ensure_schema(file_vectors=self._file_vectors, report_drift=False)
+                self._shards[root] = store
+                print(f"[SHARD] Created shard {shard_id(root)} for {root or 'files outside every root'}")
+            return store
+
+    def shards_for(self, path: str) -> list:
+        """Every existing shard whose root contains `path` (stale copies after nesting roots)"""
+        self._refresh()
+        with self._lock:
+            return [self._shards[r] for r in self.roots_of(path) if r in self._shards]
+
+    def select(self, roots: Optional[List[str]] = None) -> list:
+        """Shards a search over `roots` needs (all without roots)"""
+        self._refresh()
+        with self._lock:
+            items = list(self._shards.items())
+        if not roots:
+            return [store for _, store in items]
+        return [
+            store for root, store in items
+            if any(path_in_root(root, r) or path_in_root(r, root) for r in roots)
+        ]
+
+    def drop_root(self, root: str):
+        """Drop the shard of a removed root; returns the dropped store (or None)"""
+        self._refresh(max_age=0)
+        with self._lock:
+            store = self._shards.pop(os.path.normpath(root), None)
+        if store is not None:
+            store.drop()
+            store.close()
+            print(f"[SHARD] Dropped shard {shard_id(root)} ({root})")
+        return store
+
+    @staticmethod
+    def _fan_out(calls: list) -> list:
+        """Run zero-argument callables, in parallel when there are several"""
+        if len(calls) <= 1:
+            return [call() for call in calls]
+        return list(shard_executor().map(lambda call: call(), calls))
+
+    def _group_by_root(self, paths: List[str]) -> Dict[str, List[int]]:
+        groups: Dict[str, List[int]] = {}
+        for i, path in enumerate(paths):
+            groups.setdefault(self.root_for(path), []).append(i)
+        return groups
+
+    # ---- Schema ----
+
+    def ensure_schema(self, file_vectors: bool = True, report_drift: bool = True):
+        self._file_vectors = file_vectors
+        self._refresh(max_age=0)
+        with self._lock:
+            shards = list(self._shards.values())
+        for store in shards:
+            store.ensure_schema(file_vectors=file_vectors, report_drift=False)
+        if report_drift:
+            print(f"[INFO] Vector store sharded by root ({len(shards)} shards)")
+            report_settings_drift(self)
+
+    def property_names(self) -> Set[str]:
+        return set(CHUNK_PROPERTY_NAMES)  # Shards are created with the full schema
+
+    def applied_settings(self) -> dict:
+        shards = self.select()
+        if shards:
+            return shards[0].applied_settings()
+        return dict(vector_index_settings(self.backend), shard_by_root=True)
+
+    def update_settings(self, settings: dict):
+        for store in self.select():
+            store.update_settings(settings)
+
+    def count(self) -> int:
+        return sum(store.count() for store in self.select())
+
+    def drop(self):
+        import shutil
+
+        for store in self.select():
+            store.drop()
+            store.close()
+        with self._lock:
+            self._shards = {}
+        if self.backend == "local":
+            shutil.rmtree(versioned_name(LOCAL_STORE_DIR, self.version), ignore_errors=True)
+
+    def has_file_vectors(self) -> bool:
+        return any(store.has_file_vectors() for store in self.select())
+
+    # ---- Writes ----
+
+    def delete_path(self, path: str):
+        for store in self.shards_for(path):
+            store.delete_path(path)
+
+    def insert_chunks(self, properties: List[dict], vectors, uids: Optional[List[str]] = None):
+        for root, indices in self._group_by_root([p.get("path", "") for p in properties]).items():
+            self.shard_of(root).insert_chunks(
+                [properties[i] for i in indices],
+                [vectors[i] for i in indices],
+                [uids[i] for i in indices] if uids else None
+            )
+
+    def update_chunk(self, uid: str, properties: dict):
+        store = self.shard_for(properties.get("path", ""), create=False)
+        if store is not None:
+            store.update_chunk(uid, properties)
+
+    def upsert_file_vector(self, path: str, vectors, chunk_count: int):
+        self.shard_for(path).upsert_file_vector(path, vectors, chunk_count)
+
+    def insert_file_vectors(self, properties: List[dict], vectors):
+        for root, indices in self._group_by_root([p["path"] for p in properties]).items():
+            self.shard_of(root).insert_file_vectors(
+                [properties[i] for i in indices], [vectors[i] for i in indices]
+            )
+
+    # ---- Reads ----
+
+    def query(
+        self,
+        vector: List[float],
+        limit: int,
+        offset: int = 0,
+        return_properties: Optional[List[str]] = None,
+        paths: Optional[List[str]] = None,
+        group_by_path: Optional[Tuple[int, int]] = None,
+        roots: Optional[List[str]] = None
+    ):
+        """Fan out to the needed shards and merge hits by distance"""
+        if paths:
+            by_store: Dict[int, Tuple[object, List[str]]] = {}
+            for path in paths:
+                for store in self.shards_for(path):
+                    by_store.setdefault(id(store), (store, []))[1].append(path)
+            targets = list(by_store.values())
+        else:
+            targets = [(store, None) for store in self.select(roots)]
+
+        k = offset + limit
+        results = self._fan_out([
+            (lambda s=store, p=shard_paths: s.query(vector, k, 0, return_properties, p, group_by_path))
+            for store, shard_paths in targets
+        ])
+        objects = sorted((obj for hits in results for obj in hits), key=lambda obj: obj.metadata.distance)
+
+        if group_by_path is not None:
+            number_of_groups, _ = group_by_path
+            kept_paths: Set[str] = set()
+            grouped = []
+            for obj in objects:
+                path = obj.properties.get("path", "")
+                if path not in kept_paths and len(kept_paths) >= number_of_groups:
+                    continue
+                kept_paths.add(path)
+                grouped.append(obj)
+            return grouped
+        return objects[offset:offset + limit]
+
+    def query_files(self, vector: List[float], limit: int, roots: Optional[List[str]] = None):
+        results = self._fan_out([
+            (lambda s=store: s.query_files(vector, limit)) for store in self.select(roots)
+        ])
+        hits = sorted((obj for found in results for obj in found), key=lambda obj: obj.metadata.distance)
+        return hits[:limit]
+
+    def iterate(self, return_properties: Optional[List[str]] = None, include_vector: bool = False):
+        for store in self.select():
+            yield from store.iterate(return_properties=return_properties, include_vector=include_vector)
+
+    def iterate_files(self):
+        for store in self.select():
+            yield from store.iterate_files()
+
+    def close(self):
+        for store in self.select():
+            store.close()
+        if self._client is not None:
+            self._client.close()
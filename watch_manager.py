@@ -0,0 +1,400 @@
+import os
+import sys
+import time
+import errno
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
+
+import metrics
+
+# ---------------- CONFIG ----------------
+
+WATCH_MODE = os.getenv("SAGE_WATCH_MODE", "auto")  # auto | native | polling (force one mode for every root)
+MAX_NATIVE_DIRS = 50000        # auto: roots with more directories than this are polled
+WATCH_HEADROOM = 0.25          # auto: leave this share of max_user_watches to other programs
+POLL_INTERVAL_SECONDS = 15     # Minimum seconds between two scans of a polled root
+POLL_LOAD_FACTOR = 10          # ...stretched to scan time x this (a 3s network scan runs every 30s at most)
+CHECK_SECONDS = 30             # Native watch health check / retry of missing roots
+TEMP_PREFIXES = ("~$",)        # Office lock files: never reported as changes
+NETWORK_FS_TYPES = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "davfs",
+    "fuse.sshfs", "fuse.rclone", "fuse.s3fs", "ceph", "glusterfs", "fuse.glusterfs",
+}
+
+# --------------------------------------
+
+# Per-root watch scheduling. Each root is watched natively (one watchdog
+# emitter per root, scheduled and unscheduled on its own) or, when that
+# would not work or not scale, by the stat-based PollScanner:
+#   - network file systems (no change notifications from other clients),
+#   - trees with more directories than the inotify budget allows (Linux
+#     needs one watch per directory, capped per user by max_user_watches),
+#   - roots whose native watch failed with ENOSPC/EMFILE or died later
+#     (a new subdirectory can exhaust the limit after scheduling).
+
+MODES = ("native", "polling", "missing", "error")
+WATCHED_ROOTS = metrics.Gauge("sage_watched_roots", "Watched roots by mode", labels=("mode",))
+
+
+# -------- ENVIRONMENT --------
+
+def max_user_watches() -> Optional[int]:
+    """inotify watch limit per user, None where watches are not per directory (Windows, macOS)"""
+    try:
+        with open("/proc/sys/fs/inotify/max_user_watches") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def user_watches_in_use() -> int:
+    """inotify watches held by all processes of this user (what max_user_watches limits)"""
+    uid = os.getuid()
+    total = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            if os.stat(f"/proc/{pid}").st_uid != uid:
+                continue
+            for fd in os.listdir(f"/proc/{pid}/fd"):
+                if os.readlink(f"/proc/{pid}/fd/{fd}") != "anon_inode:inotify":
+                    continue
+                with open(f"/proc/{pid}/fdinfo/{fd}") as f:
+                    total += sum(1 for line in f if line.startswith("inotify wd:"))
+        except OSError:
+            continue  # Process exited or not readable
+    return total
+
+
+def count_dirs(root: str, limit: int) -> int:
+    """Directories under root including itself (symlinks not followed, like the watcher); stops after `limit`"""
+    count, stack = 0, [root]
+    while stack and count <= limit:
+        path = stack.pop()
+        count += 1
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return count
+
+
+def is_network_path(path: str) -> bool:
+    """True for UNC paths, mapped network drives and network file system mounts"""
+    if sys.platform == "win32":
+        if path.startswith(("\\\\", "//")):
+            return True
+        try:
+            import ctypes
+            drive = os.path.splitdrive(os.path.abspath(path))[0] + "\\"
+            return ctypes.windll.kernel32.GetDriveTypeW(drive) == 4  # DRIVE_REMOTE
+        except Exception:
+            return False
+    try:
+        with open("/proc/self/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False  # macOS: no mount table to read; FSEvents copes with large trees
+    path = os.path.realpath(path)
+    best, fstype = "", ""
+    for mount_point, kind in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, fstype = mount_point, kind
+    return fstype in NETWORK_FS_TYPES
+
+
+# -------- POLLING --------
+
+class PollScanner:
+    """
+    Stat-based change detection for one root: walks it with os.scandir and
+    compares (mtime_ns, size) of files with an allowed extension. Only the
+    file table is kept (no full directory snapshot), and the interval grows
+    with the scan time so slow shares are not hammered.
+    """
+
+    def __init__(self, root: str, allowed_ext: Tuple[str, ...]):
+        self.root = root
+        self.allowed_ext = allowed_ext
+        self.files: Optional[Dict[str, Tuple[int, int]]] = None  # None until the baseline scan
+        self.interval = POLL_INTERVAL_SECONDS
+        self.next_scan = 0.0
+        self.last_scan_seconds: Optional[float] = None
+        self.last_scan_at: Optional[float] = None
+        self.pending: Optional[Tuple[str, str]] = None  # Change whose trigger did not start indexing yet
+
+    def scan(self) -> List[Tuple[str, str]]:
+        """(action, path) changes since the previous scan; none for the baseline"""
+        start = time.perf_counter()
+        files: Dict[str, Tuple[int, int]] = {}
+        stack = [self.root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.name.lower().endswith(self.allowed_ext) and not entry.name.startswith(TEMP_PREFIXES):
+                                st = entry.stat()
+                                files[os.path.abspath(entry.path)] = (st.st_mtime_ns, st.st_size)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+        changes = []
+        if self.files is not None:
+            for path, sig in files.items():
+                old = self.files.get(path)
+                if old is None:
+                    changes.append(("created", path))
+                elif old != sig:
+                    changes.append(("modified", path))
+            changes += [("deleted", path) for path in self.files.keys() - files.keys()]
+        self.files = files
+
+        self.last_scan_seconds = time.perf_counter() - start
+        self.last_scan_at = time.time()
+        self.interval = max(POLL_INTERVAL_SECONDS, self.last_scan_seconds * POLL_LOAD_FACTOR)
+        self.next_scan = time.monotonic() + self.interval
+        return changes
+
+
+# -------- MANAGER --------
+
+class WatchedRoot:
+    def __init__(self, root: str):
+        self.root = root
+        self.mode = "missing"
+        self.reason = ""
+        self.watches = 0  # Native watches held (inotify: directories; otherwise 1)
+        self.watch: Optional[ObservedWatch] = None
+        self.scanner: Optional[PollScanner] = None
+
+    def info(self) -> dict:
+        info = {"root": self.root, "mode": self.mode, "reason": self.reason, "watches": self.watches}
+        if self.scanner is not None:
+            info.update(
+                files=len(self.scanner.files or ()),
+                interval_s=round(self.scanner.interval, 1),
+                last_scan_ms=None if self.scanner.last_scan_seconds is None else round(self.scanner.last_scan_seconds * 1000, 1),
+                last_scan_at=self.scanner.last_scan_at,
+            )
+        return info
+
+
+class WatchManager:
+    """
+    Keeps one watch per root in sync with the configured roots. sync()
+    schedules only added roots and unschedules only removed ones; the
+    observer itself keeps running.
+    """
+
+    def __init__(self, handler, on_change: Callable[[str, str], None], allowed_ext: Sequence[str]):
+        self.handler = handler          # watchdog event handler for native watches
+        self.on_change = on_change      # (action, path) from polled roots; True once indexing was triggered
+        self.allowed_ext = tuple(allowed_ext)
+        self.roots: Dict[str, WatchedRoot] = {}
+        self.observer = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_check = 0.0
+
+    def start(self):
+        with self._lock:
+            if self.observer is not None:
+                return
+            self.observer = Observer()
+            self.observer.start()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sage-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self.observer is None:
+                return
+            for root in list(self.roots):
+                self._unschedule(self.roots.pop(root))
+            self._stop.set()
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        self._thread.join()
+        self._publish()
+
+    @property
+    def running(self) -> bool:
+        return self.observer is not None
+
+    def sync(self, roots: Sequence[str]):
+        """Watch exactly `roots`; roots already watched are left alone"""
+        wanted = set(roots)
+        with self._lock:
+            for root in [r for r in self.roots if r not in wanted]:
+                self._unschedule(self.roots.pop(root))
+                print(f"[WATCH] Stopped watching: {root}")
+            for root in roots:
+                if root not in self.roots:
+                    self.roots[root] = WatchedRoot(root)
+                    self._schedule(self.roots[root])
+        self._publish()
+
+    def status(self) -> dict:
+        with self._lock:
+            roots = [r.info() for r in self.roots.values()]
+        limit = max_user_watches()
+        return {
+            "running": self.running,
+            "observer": type(self.observer).__name__ if self.observer is not None else None,
+            "watch_mode": WATCH_MODE,
+            "watches": sum(r["watches"] for r in roots),
+            "max_user_watches": limit,
+            "user_watches_in_use": user_watches_in_use() if limit is not None else None,
+            "roots": roots,
+        }
+
+    # -------- scheduling --------
+
+    def _schedule(self, entry: WatchedRoot):
+        root = entry.root
+        if not os.path.isdir(root):
+            entry.mode, entry.reason = "missing", "path not found (retried every check)"
+            print(f"[WATCH] Not found, will retry: {root}")
+            return
+
+        reason = self._polling_reason(root, entry)
+        if reason:
+            self._poll(entry, reason)
+            return
+        try:
+            entry.watch = self.observer.schedule(self.handler, root, recursive=True)
+        except OSError as e:
+            self._drop_handler(root)
+            if e.errno in (errno.ENOSPC, errno.EMFILE):
+                self._poll(entry, f"native watch failed: {e.strerror}")
+            else:
+                entry.mode, entry.reason = "error", str(e)
+                print(f"❌ Failed to watch {root}: {e}")
+            return
+        entry.mode, entry.reason = "native", ""
+        print(f"[WATCH] Watching: {root} ({entry.watches} watches)")
+
+    def _polling_reason(self, root: str, entry: WatchedRoot) -> str:
+        """Why `root` should be polled ("" to watch it natively); sets entry.watches"""
+        if WATCH_MODE == "polling":
+            return "SAGE_WATCH_MODE=polling"
+        limit = max_user_watches()
+        if WATCH_MODE == "native":
+            entry.watches = count_dirs(root, sys.maxsize) if limit is not None else 1
+            return ""
+        if is_network_path(root):
+            return "network file system"
+        if limit is None:
+            entry.watches = 1  # One handle per root (ReadDirectoryChangesW / FSEvents)
+            return ""
+        budget = int(limit * (1 - WATCH_HEADROOM)) - user_watches_in_use()
+        cap = min(MAX_NATIVE_DIRS, budget)
+        dirs = count_dirs(root, cap)
+        if dirs > cap:
+            if cap < MAX_NATIVE_DIRS:
+                return f"over inotify budget ({budget} of max_user_watches={limit} free)"
+            return f"more than MAX_NATIVE_DIRS={MAX_NATIVE_DIRS} directories"
+        entry.watches = dirs
+        return ""
+
+    def _poll(self, entry: WatchedRoot, reason: str):
+        entry.mode, entry.reason, entry.watches, entry.watch = "polling", reason, 0, None
+        entry.scanner = PollScanner(entry.root, self.allowed_ext)
+        print(f"[WATCH] Polling: {entry.root} ({reason})")
+
+    def _unschedule(self, entry: WatchedRoot):
+        if entry.watch is not None:
+            try:
+                self.observer.unschedule(entry.watch)
+            except (KeyError, OSError):
+                pass  # Emitter already gone (root deleted or watch lost)
+        entry.watch = None
+        entry.scanner = None
+
+    def _drop_handler(self, root: str):
+        """Forget the handler registered by a failed schedule()"""
+        try:
+            self.observer.remove_handler_for_watch(self.handler, ObservedWatch(root, True))
+        except (KeyError, ValueError):
+            pass
+
+    # -------- background loop --------
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + CHECK_SECONDS
+                self._check()
+            with self._lock:
+                scanners = [r.scanner for r in self.roots.values() if r.scanner is not None]
+            for scanner in scanners:
+                if self._stop.is_set():
+                    return
+                if scanner.next_scan <= now:
+                    self._scan(scanner)
+                else:
+                    self._trigger(scanner)  # Retry a debounced or busy trigger every tick
+
+    def _check(self):
+        """Re-schedule missing roots; move native roots whose emitter died to polling"""
+        changed = False
+        with self._lock:
+            if self.observer is None:
+                return
+            for entry in self.roots.values():
+                if entry.mode == "missing" and os.path.isdir(entry.root):
+                    self._schedule(entry)
+                    changed = True
+                elif entry.mode == "native" and not self._emitter_alive(entry.watch):
+                    self._unschedule(entry)
+                    if os.path.isdir(entry.root):
+                        self._poll(entry, "native watch stopped (watch limit reached?)")
+                    else:
+                        entry.mode, entry.reason, entry.watches = "missing", "path not found (retried every check)", 0
+                    changed = True
+        if changed:
+            self._publish()
+
+    def _emitter_alive(self, watch: Optional[ObservedWatch]) -> bool:
+        return watch is not None and any(e.watch == watch and e.is_alive() for e in self.observer.emitters)
+
+    def _scan(self, scanner: PollScanner):
+        changes = scanner.scan()
+        if changes:
+            print(f"[POLL] {len(changes)} change(s) under {scanner.root}")
+            scanner.pending = changes[0]
+        self._trigger(scanner)
+
+    def _trigger(self, scanner: PollScanner):
+        """One trigger per batch (indexing reconciles the whole root); kept until indexing starts"""
+        if scanner.pending is None:
+            return
+        action, path = scanner.pending
+        if self.on_change(action, path):
+            scanner.pending = None
+
+    def _publish(self):
+        with self._lock:
+            modes = [r.mode for r in self.roots.values()]
+        for mode in MODES:
+            WATCHED_ROOTS.set(modes.count(mode), mode=mode)